@@ -0,0 +1,97 @@
+#compares write throughput of the original SQLite engine against the tuned one in database.py
+#run from the backend folder: python benchmarks/bench_db_writes.py
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, func
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+from database import Base, create_db_engine
+from models import User, QuestionResponse, SubtopicScoreRollup
+from rollups import record_interest, record_responses
+
+#the configuration database.py used before tuning
+def default_engine(url):
+    return create_engine(url, connect_args={"check_same_thread": False})
+
+#one graded answer, written the way save_response does it
+def write_response(db, user_id, i):
+    db.add(QuestionResponse(user_id=user_id, job_role="Engineer", subtopic=f"Subtopic {i % 6}",
+                            question_text="q" * 200, user_answer="a" * 800, feedback="f" * 800, score=i % 11))
+    record_interest(db, user_id, "Engineer", f"Subtopic {i % 6}")
+    record_responses(db, [{"user_id": user_id, "job_role": "Engineer", "subtopic": f"Subtopic {i % 6}", "score": i % 11}])
+    db.commit()
+
+def run(name, make_engine, writers, writes, readers):
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = make_engine(f"sqlite:///{tmp}/bench.db")
+        Base.metadata.create_all(bind=engine)
+        Session = sessionmaker(bind=engine)
+        with Session() as db:
+            db.add_all([User(id=i + 1, email=f"w{i}@example.com", name="w", hashed_password="x") for i in range(writers)])
+            db.commit()
+        errors = []
+        read_latencies = []
+        done = threading.Event()
+
+        def writer(user_id):
+            db = Session()
+            try:
+                for i in range(writes):
+                    try:
+                        write_response(db, user_id, i)
+                    except OperationalError as e:
+                        db.rollback()
+                        errors.append(str(e))
+            finally:
+                db.close()
+
+        def reader():
+            db = Session()
+            try:
+                while not done.is_set():
+                    start = time.perf_counter()
+                    db.query(func.sum(SubtopicScoreRollup.score_sum)).filter(SubtopicScoreRollup.user_id == 1).scalar()
+                    db.commit()
+                    read_latencies.append(time.perf_counter() - start)
+            finally:
+                db.close()
+
+        reader_threads = [threading.Thread(target=reader) for _ in range(readers)]
+        writer_threads = [threading.Thread(target=writer, args=(i + 1,)) for i in range(writers)]
+        for thread in reader_threads:
+            thread.start()
+        start = time.perf_counter()
+        for thread in writer_threads:
+            thread.start()
+        for thread in writer_threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        done.set()
+        for thread in reader_threads:
+            thread.join()
+        engine.dispose()
+
+        committed = writers * writes - len(errors)
+        read_latencies.sort()
+        p99 = read_latencies[int(len(read_latencies) * 0.99) - 1] * 1000 if read_latencies else 0
+        print(f"{name:>8} {committed / elapsed:12.1f} {len(errors):8d} {len(read_latencies):8d} {p99:12.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="SQLite write throughput, original vs tuned engine")
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--writes", type=int, default=200)
+    parser.add_argument("--readers", type=int, default=2)
+    args = parser.parse_args()
+    print(f"{'config':>8} {'writes/sec':>12} {'errors':>8} {'reads':>8} {'read p99 ms':>12}")
+    run("default", default_engine, args.writers, args.writes, args.readers)
+    run("tuned", create_db_engine, args.writers, args.writes, args.readers)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+#measures how completion throughput scales with the number of Ollama servers in the pool, using stub servers
+#run from the backend folder: python benchmarks/bench_llm_pool.py
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from llm_pool import pool_from_settings
+from llm_service import LLM_MAX_CONCURRENCY, ainvoke_chain, set_max_concurrency
+from stub_ollama import StubOllama
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] * 1000 if values else 0.0
+
+async def run(backend_count, requests, concurrency, latency):
+    stubs = [StubOllama(latency=latency) for _ in range(backend_count)]
+    try:
+        pool = pool_from_settings({"name": "llama3"}, backends=",".join(stub.url for stub in stubs))
+        set_max_concurrency(LLM_MAX_CONCURRENCY * backend_count)
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies = []
+
+        async def call():
+            async with semaphore:
+                start = time.perf_counter()
+                await ainvoke_chain(pool, "Tell me about caching.")
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(call() for _ in range(requests)))
+        elapsed = time.perf_counter() - start
+    finally:
+        for stub in stubs:
+            stub.stop()
+    spread = ", ".join(str(len(stub.requests)) for stub in stubs)
+    print(f"{backend_count} backend(s): {requests / elapsed:.1f} req/s, p50 {percentile(latencies, 0.5):.0f} ms, "
+          f"p95 {percentile(latencies, 0.95):.0f} ms, requests per backend [{spread}]")
+
+def main():
+    parser = argparse.ArgumentParser(description="LLM pool scaling benchmark")
+    parser.add_argument("--backends", default="1,2,4")
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.1, help="seconds each stub spends per generation")
+    args = parser.parse_args()
+    for count in (int(n) for n in args.backends.split(",")):
+        asyncio.run(run(count, args.requests, args.concurrency, args.latency))
+
+if __name__ == "__main__":
+    main()
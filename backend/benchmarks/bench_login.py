@@ -0,0 +1,68 @@
+#measures login throughput and how responsive a cheap endpoint stays during a login burst
+#run from the backend folder: python benchmarks/bench_login.py
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_tmp = tempfile.TemporaryDirectory()
+#points the app at a throwaway database before it is imported
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmp.name}/bench.db"
+os.environ.setdefault("LLM_CACHE_DB", "")
+
+import httpx
+from main import app
+from passwords import hash_executor
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] * 1000 if values else 0.0
+
+async def run(logins, concurrency):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        await client.post("/register", json={"email": "bench@example.com", "name": "Bench", "password": "secure123"})
+        semaphore = asyncio.Semaphore(concurrency)
+        login_latencies = []
+        probe_latencies = []
+        done = asyncio.Event()
+
+        async def login():
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post("/login", json={"email": "bench@example.com", "password": "secure123"})
+                login_latencies.append(time.perf_counter() - start)
+                assert response.status_code in (200, 503), response.text
+
+        #a cheap request that should keep answering in milliseconds while logins are hashing
+        async def probe():
+            while not done.is_set():
+                start = time.perf_counter()
+                await client.get("/llm-cache/stats")
+                probe_latencies.append(time.perf_counter() - start)
+                await asyncio.sleep(0.01)
+
+        probe_task = asyncio.create_task(probe())
+        start = time.perf_counter()
+        await asyncio.gather(*(login() for _ in range(logins)))
+        elapsed = time.perf_counter() - start
+        done.set()
+        await probe_task
+
+    print(f"logins: {logins} at concurrency {concurrency} in {elapsed:.2f}s ({logins / elapsed:.1f}/s)")
+    print(f"login latency p50 {percentile(login_latencies, 0.5):.1f} ms, p95 {percentile(login_latencies, 0.95):.1f} ms")
+    print(f"cheap endpoint during burst p50 {percentile(probe_latencies, 0.5):.1f} ms, p95 {percentile(probe_latencies, 0.95):.1f} ms")
+    print(f"hash pool: {hash_executor.stats()}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Login throughput benchmark")
+    parser.add_argument("--logins", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+    asyncio.run(run(args.logins, args.concurrency))
+
+if __name__ == "__main__":
+    main()
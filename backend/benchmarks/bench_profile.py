@@ -0,0 +1,89 @@
+#benchmarks /user-profile/{user_id} against growing response histories
+#run from the backend folder: python benchmarks/bench_profile.py
+import argparse
+import os
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+#keeps the benchmark from touching the persistent LLM cache
+os.environ.setdefault("LLM_CACHE_DB", "")
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+from database import Base
+from migrations import run_migrations
+from models import User, QuestionResponse
+from main import get_user_profile
+from rollups import backfill
+
+#the previous implementation, which loaded every response row into Python
+def legacy_profile(user_id, db):
+    user = db.query(User).filter(User.id == user_id).first()
+    responses = db.query(QuestionResponse).filter(QuestionResponse.user_id == user_id).all()
+    total_questions = len(responses)
+    average_score = sum(r.score for r in responses if r.score is not None) / total_questions if total_questions else 0
+    subtopic_scores = defaultdict(list)
+    for r in responses:
+        if r.subtopic and r.score is not None:
+            subtopic_scores[r.subtopic].append(r.score)
+    job_roles = [r.job_role for r in responses if r.job_role]
+    return {"name": user.name, "total_questions": total_questions, "average_score": round(average_score, 2),
+            "most_interested_career": max(set(job_roles), key=job_roles.count) if job_roles else None,
+            "job_role_distribution": dict(Counter(job_roles))}
+
+#inserts a user with the given number of responses, spread over a few subtopics and roles
+def seed(db, user_id, count, text_size):
+    db.add(User(id=user_id, email=f"bench{user_id}@example.com", name="Bench", hashed_password="x"))
+    body = "x" * text_size
+    rows = [{
+        "user_id": user_id,
+        "job_role": f"Role {i % 5}",
+        "subtopic": f"Subtopic {i % 12}",
+        "question_text": body,
+        "user_answer": body,
+        "feedback": body,
+        "score": i % 11
+    } for i in range(count)]
+    for start in range(0, len(rows), 10000):
+        db.execute(insert(QuestionResponse), rows[start:start + 10000])
+    db.commit()
+    #builds the score rollups the endpoint reads from
+    backfill(db)
+
+def time_call(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return timings[len(timings) // 2] * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile endpoint latency by history size")
+    parser.add_argument("--sizes", default="10,100,1000,10000,100000")
+    parser.add_argument("--text-size", type=int, default=512)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--skip-legacy", action="store_true")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{tmp}/bench.db")
+        Base.metadata.create_all(bind=engine)
+        run_migrations(engine)
+        Session = sessionmaker(bind=engine)
+        print(f"{'responses':>10} {'rollup ms':>10} {'legacy ms':>10}")
+        for user_id, size in enumerate(int(s) for s in args.sizes.split(",")):
+            db = Session()
+            seed(db, user_id + 1, size, args.text_size)
+            rollup_ms = time_call(lambda: get_user_profile(user_id + 1, db, claims=None), args.repeat)
+            legacy_ms = None if args.skip_legacy else time_call(lambda: legacy_profile(user_id + 1, db), args.repeat)
+            db.close()
+            legacy = f"{legacy_ms:10.2f}" if legacy_ms is not None else f"{'-':>10}"
+            print(f"{size:>10} {rollup_ms:10.2f} {legacy}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+#deterministic stand-in for the Ollama LLM, used by the tests and the load scenarios in place of main.llm
+import asyncio
+import re
+import time
+from typing import Any, Dict, List, Tuple
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk, LLMResult
+
+#canned replies in the format each prompt in prompts.json asks for, matched by a phrase of the prompt
+DEFAULT_RESPONSES = (
+    ("Your previous reply could not be used", '{"subtopics": ["Data Structures", "Algorithms"]}'),
+    ("Break down the role", '{"subtopics": ["Data Structures", "Algorithms", "System Design", "Databases", '
+                            '"Testing", "Communication"]}'),
+    ("Validate the following", "The subtopics are relevant and logically grouped.\nVerdict: NO CHANGES"),
+    ("refine the subtopics", '{"refined_subtopics": ["Data Structures", "Algorithms", "System Design"]}'),
+    ("Categorize the following", '{"Technical Skills": ["Data Structures", "Algorithms"], '
+                                 '"Soft Skills": ["Communication"], "Advanced Topics": ["System Design"]}'),
+    ("interview questions for", "\n".join(f"{n}. Sample interview question {n} about this topic?" for n in range(1, 8))),
+    ("original feedback generated", "Score: 7/10\nConstructive Feedback:\nThe answer is correct but could give an example."),
+    ("Candidate's answer", "Score: 7/10\nConstructive Feedback:\nThe answer is correct but could give an example."),
+    ("Reply with OK", "OK"),
+)
+
+_TOKEN = re.compile(r"\S+\s*|\s+")
+
+class FakeLLM(LLM):
+    #seconds before the first token, like Ollama's prompt evaluation
+    latency: float = 0.0
+    #generation speed, 0 sends the whole reply at once
+    tokens_per_second: float = 0.0
+    #(phrase, reply) pairs checked in order, a reply can be a function of the prompt
+    responses: Tuple[Tuple[str, Any], ...] = DEFAULT_RESPONSES
+    default_response: str = "OK"
+    model: str = "fake"
+    #every prompt received, for assertions
+    calls: List[str] = []
+
+    @property
+    def _llm_type(self):
+        return "fake"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"model": self.model, "latency": self.latency, "tokens_per_second": self.tokens_per_second}
+
+    def reply(self, prompt):
+        for phrase, response in self.responses:
+            if phrase in prompt:
+                return response(prompt) if callable(response) else response
+        return self.default_response
+
+    def _chunks(self, prompt):
+        self.calls.append(prompt)
+        tokens = _TOKEN.findall(self.reply(prompt)) if self.tokens_per_second else [self.reply(prompt)]
+        delay = 1 / self.tokens_per_second if self.tokens_per_second else 0.0
+        last = len(tokens) - 1
+        for index, token in enumerate(tokens):
+            #the final chunk carries the counts and timings Ollama reports, durations are in nanoseconds
+            info = {"done": True, "prompt_eval_count": len(prompt.split()), "eval_count": len(tokens),
+                    "eval_duration": int(max(len(tokens) * delay, 1e-6) * 1e9)} if index == last else None
+            yield GenerationChunk(text=token, generation_info=info), delay
+
+    def _stream(self, prompt, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency)
+        for chunk, delay in self._chunks(prompt):
+            time.sleep(delay)
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, prompt, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        for chunk, delay in self._chunks(prompt):
+            await asyncio.sleep(delay)
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    def _call(self, prompt, stop=None, run_manager=None, **kwargs):
+        return "".join(chunk.text for chunk in self._stream(prompt, stop=stop, run_manager=run_manager, **kwargs))
+
+    async def _acall(self, prompt, stop=None, run_manager=None, **kwargs):
+        return "".join([chunk.text async for chunk in self._astream(prompt, stop=stop, run_manager=run_manager, **kwargs)])
+
+    #keeps the final chunk's token counts, like the pool does for Ollama's
+    def _generate(self, prompts, stop=None, run_manager=None, **kwargs):
+        generations = []
+        for prompt in prompts:
+            merged = GenerationChunk(text="")
+            for chunk in self._stream(prompt, stop=stop, run_manager=run_manager, **kwargs):
+                merged += chunk
+            generations.append([merged])
+        return LLMResult(generations=generations)
+
+    async def _agenerate(self, prompts, stop=None, run_manager=None, **kwargs):
+        generations = []
+        for prompt in prompts:
+            merged = GenerationChunk(text="")
+            async for chunk in self._astream(prompt, stop=stop, run_manager=run_manager, **kwargs):
+                merged += chunk
+            generations.append([merged])
+        return LLMResult(generations=generations)
@@ -0,0 +1,192 @@
+#scripted load scenarios against the app with the fake LLM and a throwaway database, reporting latency
+#percentiles and requests/sec per endpoint and saving them as JSON to compare across commits
+#run from the backend folder: python benchmarks/load_scenarios.py [--scenario grading_burst] [--compare old.json]
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+_tmp = tempfile.TemporaryDirectory()
+#points the app at a throwaway database before it is imported
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmp.name}/bench.db"
+os.environ["LLM_CACHE_DB"] = ""
+os.environ["WARMUP_ON_STARTUP"] = "0"
+os.environ.setdefault("LOG_SAMPLE_RATE", "0")
+#the scenarios measure capacity, so one client sending every request mustn't be throttled or shed
+os.environ.setdefault("RATE_LIMIT", "0")
+os.environ.setdefault("LLM_QUEUE_PER_CLIENT", "1000000")
+
+import httpx
+import main
+from bench_profile import seed
+from database import SessionLocal
+from fake_llm import FakeLLM
+from metrics import llm_metrics
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] * 1000 if values else 0.0
+
+#latencies and status codes per endpoint over one scenario
+class Recorder:
+    def __init__(self):
+        self.calls = {}
+
+    async def request(self, client, endpoint, method, url, **kwargs):
+        start = time.perf_counter()
+        response = await client.request(method, url, **kwargs)
+        self.calls.setdefault(endpoint, []).append((start, time.perf_counter(), response.status_code))
+        return response
+
+    def summary(self):
+        report = {}
+        for endpoint, calls in self.calls.items():
+            latencies = [end - start for start, end, _ in calls]
+            #throughput over the span the endpoint was under load
+            elapsed = max(end for _, end, _ in calls) - min(start for start, _, _ in calls)
+            report[endpoint] = {
+                "requests": len(calls),
+                "errors": sum(1 for _, _, status in calls if status >= 400),
+                "rps": round(len(calls) / elapsed, 2) if elapsed else 0.0,
+                "p50_ms": round(percentile(latencies, 0.5), 2),
+                "p95_ms": round(percentile(latencies, 0.95), 2),
+                "p99_ms": round(percentile(latencies, 0.99), 2),
+            }
+        return report
+
+async def gather_limited(concurrency, calls):
+    semaphore = asyncio.Semaphore(concurrency)
+    async def run(call):
+        async with semaphore:
+            await call()
+    await asyncio.gather(*(run(call) for call in calls))
+
+async def register_and_login(client, email):
+    await client.post("/register", json={"email": email, "name": "Bench", "password": "secure123"})
+    response = await client.post("/login", json={"email": email, "password": "secure123"})
+    return response.json()
+
+#many users signing in at once, with a cheap endpoint probed to see whether it stays responsive
+async def login_storm(client, args):
+    users = [f"storm{n}@example.com" for n in range(args.users)]
+    for email in users:
+        await client.post("/register", json={"email": email, "name": "Bench", "password": "secure123"})
+    recorder = Recorder()
+    done = asyncio.Event()
+
+    async def probe():
+        while not done.is_set():
+            await recorder.request(client, "GET /llm-cache/stats", "GET", "/llm-cache/stats")
+            await asyncio.sleep(0.01)
+
+    probe_task = asyncio.create_task(probe())
+    await gather_limited(args.concurrency, [
+        (lambda email=users[n % len(users)]: recorder.request(
+            client, "POST /login", "POST", "/login", json={"email": email, "password": "secure123"}))
+        for n in range(args.requests)])
+    done.set()
+    await probe_task
+    return recorder.summary()
+
+#a class finishing a question set at the same time, every answer graded by the LLM and stored
+async def grading_burst(client, args):
+    login = await register_and_login(client, "grader@example.com")
+    headers = {"Authorization": f"Bearer {login['access_token']}"}
+    recorder = Recorder()
+    await gather_limited(args.concurrency, [
+        (lambda n=n: recorder.request(client, "POST /check-response", "POST", "/check-response", headers=headers, json={
+            "question": f"Question {n % 7}: how does a hash map handle collisions?",
+            "answer": f"Answer {n}: it chains entries in buckets or probes for the next free slot.",
+            "job_role": "Software Engineer", "subtopic": "Data Structures"}))
+        for n in range(args.requests)])
+    return recorder.summary()
+
+#profile reads for a user with a long answer history
+async def profile_reads(client, args):
+    login = await register_and_login(client, "history@example.com")
+    db = SessionLocal()
+    try:
+        seed(db, 100000, args.history, 256)
+    finally:
+        db.close()
+    recorder = Recorder()
+    await gather_limited(args.concurrency, [
+        (lambda: recorder.request(client, "GET /user-profile/{user_id}", "GET", "/user-profile/100000"))
+        for _ in range(args.requests)])
+    #reads with an access token skip the user lookup, measured on the logged in user's own profile
+    headers = {"Authorization": f"Bearer {login['access_token']}"}
+    await gather_limited(args.concurrency, [
+        (lambda: recorder.request(client, "GET /user-profile/{user_id} (token)", "GET",
+                                  f"/user-profile/{login['id']}", headers=headers))
+        for _ in range(args.requests)])
+    return recorder.summary()
+
+SCENARIOS = {"login_storm": login_storm, "grading_burst": grading_burst, "profile_reads": profile_reads}
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+async def run(args):
+    main.llm = FakeLLM(latency=args.llm_latency, tokens_per_second=args.tokens_per_second, callbacks=[llm_metrics])
+    transport = httpx.ASGITransport(app=main.app)
+    results = {}
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for name in args.scenario or list(SCENARIOS):
+            results[name] = await SCENARIOS[name](client, args)
+    return results
+
+def print_results(results, baseline=None):
+    print(f"{'scenario':<14} {'endpoint':<36} {'req':>5} {'err':>4} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for scenario, endpoints in results.items():
+        for endpoint, row in endpoints.items():
+            line = (f"{scenario:<14} {endpoint:<36} {row['requests']:>5} {row['errors']:>4} {row['rps']:>8.1f} "
+                    f"{row['p50_ms']:>8.1f} {row['p95_ms']:>8.1f} {row['p99_ms']:>8.1f}")
+            before = (baseline or {}).get(scenario, {}).get(endpoint)
+            if before and before["p95_ms"] and before["rps"]:
+                line += f"  p95 {row['p95_ms'] / before['p95_ms']:.2f}x, rps {row['rps'] / before['rps']:.2f}x"
+            print(line)
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Load scenarios with a fake LLM")
+    parser.add_argument("--scenario", action="append", choices=list(SCENARIOS), help="defaults to every scenario")
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--users", type=int, default=20, help="accounts used by the login storm")
+    parser.add_argument("--history", type=int, default=10000, help="answers in the profile_reads history")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="seconds before the fake LLM's first token")
+    parser.add_argument("--tokens-per-second", type=float, default=200)
+    parser.add_argument("--output", help="defaults to benchmarks/results/<commit>.json")
+    parser.add_argument("--compare", help="an earlier results file to show the change against")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["scenarios"]
+    print_results(results, baseline)
+
+    commit = git_commit()
+    output = args.output or os.path.join(RESULTS_DIR, f"{commit or 'results'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    config = {name: value for name, value in vars(args).items() if name not in ("output", "compare")}
+    with open(output, "w") as f:
+        json.dump({"commit": commit, "created_at": datetime.now(timezone.utc).isoformat(), "config": config,
+                   "scenarios": results}, f, indent=2)
+    print(f"saved {output}")
+
+if __name__ == "__main__":
+    main_cli()
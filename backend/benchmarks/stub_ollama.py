@@ -0,0 +1,96 @@
+#minimal stand-in for an Ollama server, answering /api/tags and streaming /api/generate
+#run from the backend folder: python benchmarks/stub_ollama.py --port 11435
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class StubOllama:
+    def __init__(self, models=("llama3",), reply="Score: 7/10\nConstructive Feedback:\nGood answer.",
+                 latency=0.0, token_delay=0.0, parallel=1, port=0):
+        self.models = list(models)
+        self.reply = reply
+        self.latency = latency
+        self.token_delay = token_delay
+        #like a single GPU, only this many generations run at once and the rest wait
+        self.slots = threading.Semaphore(parallel)
+        #set to make every generate call fail with a 500
+        self.fail = False
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, status, body):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if self.path == "/api/tags":
+                    self._send_json(200, {"models": [{"name": name} for name in stub.models]})
+                else:
+                    self._send_json(404, {"error": "not found"})
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if self.path != "/api/generate":
+                    return self._send_json(404, {"error": "not found"})
+                stub.requests.append(body)
+                if stub.fail:
+                    return self._send_json(500, {"error": "stub failure"})
+                if body.get("model") not in stub.models and f"{body.get('model')}:latest" not in stub.models:
+                    return self._send_json(404, {"error": f"model '{body.get('model')}' not found"})
+                with stub.slots:
+                    time.sleep(stub.latency)
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/x-ndjson")
+                    self.end_headers()
+                    tokens = stub.reply.split(" ")
+                    for token in tokens:
+                        self._write_line({"model": body["model"], "response": token + " ", "done": False})
+                        time.sleep(stub.token_delay)
+                    #the same token counts and timings Ollama reports, durations are in nanoseconds
+                    self._write_line({"model": body["model"], "response": "", "done": True, "done_reason": "stop",
+                                      "prompt_eval_count": len(body.get("prompt", "").split()),
+                                      "eval_count": len(tokens),
+                                      "eval_duration": int(max(len(tokens) * stub.token_delay, 1e-6) * 1e9)})
+
+            def _write_line(self, event):
+                self.wfile.write((json.dumps(event) + "\n").encode())
+                self.wfile.flush()
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub Ollama server")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--models", default="llama3")
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--token-delay", type=float, default=0.0)
+    parser.add_argument("--parallel", type=int, default=1)
+    args = parser.parse_args()
+    stub = StubOllama(args.models.split(","), latency=args.latency, token_delay=args.token_delay,
+                      parallel=args.parallel, port=args.port)
+    print(f"stub Ollama listening on {stub.url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        stub.stop()
+
+if __name__ == "__main__":
+    main()
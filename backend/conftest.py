@@ -0,0 +1,57 @@
+#imports
+import os
+import tempfile
+import pytest
+
+#points the app at a throwaway SQLite file before main is imported, so test runs never write to users.db,
+#and keeps the completion cache in memory and the app from calling Ollama on its own
+_tmp = tempfile.TemporaryDirectory()
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmp.name}/test.db"
+os.environ["LLM_CACHE_DB"] = ""
+os.environ["WARMUP_ON_STARTUP"] = "0"
+os.environ["LLM_HEALTH_INTERVAL_SECONDS"] = "0"
+#per-user limits would trip across tests that share the test client's address, the limit test enables them itself
+os.environ["RATE_LIMIT"] = "0"
+
+#the account the login tests sign in with
+TEST_USER = {"email": "testuser@example.com", "name": "Test User", "password": "secure123"}
+
+@pytest.fixture(scope="session", autouse=True)
+def test_user():
+    from database import Base, SessionLocal, engine
+    from migrations import run_migrations
+    from models import User
+    from passwords import pwd_context
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+    db = SessionLocal()
+    try:
+        if not db.query(User.id).filter(User.email == TEST_USER["email"]).first():
+            db.add(User(email=TEST_USER["email"], name=TEST_USER["name"], hashed_password=pwd_context.hash(TEST_USER["password"])))
+            db.commit()
+    finally:
+        db.close()
+    return TEST_USER
+
+#an empty database in its own file, with every table and migration applied, returns a session factory
+@pytest.fixture
+def temp_db(tmp_path):
+    from sqlalchemy.orm import sessionmaker
+    from database import Base, create_db_engine
+    from migrations import run_migrations
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+    yield sessionmaker(bind=engine, autocommit=False, autoflush=False)
+    engine.dispose()
+
+#replaces the app's LLM with the deterministic fake, tests can change its replies, latency or token rate
+@pytest.fixture
+def fake_llm(monkeypatch):
+    import main
+    from benchmarks.fake_llm import FakeLLM
+    from metrics import llm_metrics
+    #with the same metrics callback as the real pool
+    llm = FakeLLM(callbacks=[llm_metrics])
+    monkeypatch.setattr(main, "llm", llm)
+    return llm
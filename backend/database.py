@@ -1,13 +1,81 @@
 #imports
-from sqlalchemy import create_engine
+import os
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from starlette.concurrency import run_in_threadpool
+
+#defines the database location, any SQLAlchemy URL works so the same models can run on Postgres
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./users.db")
+#connection pool size per worker process, sized for the threadpool that serves sync endpoints
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+#how long a writer waits for the SQLite lock before giving up, in milliseconds
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+#negative values are in KiB, so this is a 64 MiB page cache per connection
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", "-65536"))
+
+#WAL lets readers run alongside a writer, and NORMAL sync is safe in WAL mode while avoiding an fsync per commit
+def apply_sqlite_pragmas(engine):
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        cursor.execute(f"PRAGMA cache_size={SQLITE_CACHE_SIZE}")
+        cursor.close()
+
+#creates an engine with pooling, and the tuned pragmas when the database is a SQLite file
+def create_db_engine(url=DATABASE_URL, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW):
+    parsed = make_url(url)
+    if parsed.get_backend_name() != "sqlite":
+        return create_engine(url, pool_size=pool_size, max_overflow=max_overflow, pool_pre_ping=True)
+    if parsed.database in (None, "", ":memory:"):
+        return create_engine(url, connect_args={"check_same_thread": False})
+    engine = create_engine(
+        url,
+        connect_args={"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000},
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+    )
+    apply_sqlite_pragmas(engine)
+    return engine
+
+#creates an async engine when an async driver (aiosqlite or asyncpg) is installed, otherwise returns None
+def create_async_db_engine(url=DATABASE_URL):
+    try:
+        from sqlalchemy.ext.asyncio import create_async_engine
+    except ImportError:
+        return None
+    parsed = make_url(url)
+    drivers = {"sqlite": "aiosqlite", "postgresql": "asyncpg"}
+    backend = parsed.get_backend_name()
+    if backend not in drivers or parsed.database in (None, "", ":memory:"):
+        return None
+    try:
+        __import__(drivers[backend])
+    except ImportError:
+        return None
+    async_url = parsed.set(drivername=f"{backend}+{drivers[backend]}")
+    if backend == "sqlite":
+        engine = create_async_engine(async_url, connect_args={"timeout": SQLITE_BUSY_TIMEOUT_MS / 1000})
+        apply_sqlite_pragmas(engine.sync_engine)
+        return engine
+    return create_async_engine(async_url, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_pre_ping=True)
 
-#defines the database location
-DATABASE_URL = "sqlite:///./users.db"
 #creates the engine and a session
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+engine = create_db_engine()
 SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False)
+#optional async engine so async endpoints don't block the event loop on database access
+async_engine = create_async_db_engine() if os.getenv("DB_ASYNC", "1") == "1" else None
+AsyncSessionLocal = None
+if async_engine is not None:
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+    AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
 #base class for all models to inherit from
 Base = declarative_base()
 #provides the session to the route, used for FastAPI routes
@@ -16,4 +84,25 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+#runs fn(session) from async code, on the async engine when available and in the threadpool otherwise
+async def run_db(fn):
+    if AsyncSessionLocal is not None:
+        async with AsyncSessionLocal() as session:
+            return await session.run_sync(fn)
+    def run():
+        db = SessionLocal()
+        try:
+            return fn(db)
+        finally:
+            db.close()
+    return await run_in_threadpool(run)
+
+#returns an INSERT construct that supports ON CONFLICT upserts on the session's database
+def upsert_insert(db, model):
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(model)
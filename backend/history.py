@@ -0,0 +1,72 @@
+#imports
+import csv
+import io
+import json
+from fastapi import HTTPException
+from sqlalchemy import select
+from models import QuestionResponse
+
+#columns a client may ask for, the long answer and feedback texts are only read when requested
+HISTORY_FIELDS = ("id", "job_role", "subtopic", "question_text", "user_answer", "score", "feedback",
+                  "prompt_tokens", "completion_tokens")
+#what the list view needs, without the long texts
+DEFAULT_HISTORY_FIELDS = ("id", "job_role", "subtopic", "question_text", "score")
+#rows fetched from the cursor at a time while exporting
+EXPORT_BATCH_SIZE = 1000
+
+#parses a comma separated field list, the id is always included since it is the page cursor
+def parse_fields(fields, default=DEFAULT_HISTORY_FIELDS):
+    if not fields:
+        return default
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in names if name not in HISTORY_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=422, detail=f"Unknown fields: {', '.join(unknown)}. "
+                                                    f"Choose from {', '.join(HISTORY_FIELDS)}")
+    return tuple(dict.fromkeys(["id"] + names))
+
+#selects only the requested columns of one user's responses, with the optional filters
+def history_query(user_id, fields, subtopic=None, job_role=None, min_score=None, max_score=None):
+    query = select(*(getattr(QuestionResponse, name) for name in fields)).where(QuestionResponse.user_id == user_id)
+    if subtopic is not None:
+        query = query.where(QuestionResponse.subtopic == subtopic)
+    if job_role is not None:
+        query = query.where(QuestionResponse.job_role == job_role)
+    if min_score is not None:
+        query = query.where(QuestionResponse.score >= min_score)
+    if max_score is not None:
+        query = query.where(QuestionResponse.score <= max_score)
+    return query
+
+#one page, newest first, continuing below before_id, the id cursor stays fast at any depth unlike an offset
+def history_page(db, query, limit, before_id=None):
+    if before_id is not None:
+        query = query.where(QuestionResponse.id < before_id)
+    #one extra row tells whether there is another page
+    rows = db.execute(query.order_by(QuestionResponse.id.desc()).limit(limit + 1)).all()
+    items = [dict(row._mapping) for row in rows[:limit]]
+    return {"items": items, "next_before_id": items[-1]["id"] if len(rows) > limit else None}
+
+#streams the rows oldest first in NDJSON or CSV from a server-side cursor, one batch of rows in memory at a time,
+#after_id resumes an interrupted export
+def export_rows(session_factory, query, fields, output_format, after_id=None):
+    if after_id is not None:
+        query = query.where(QuestionResponse.id > after_id)
+    query = query.order_by(QuestionResponse.id).execution_options(stream_results=True, yield_per=EXPORT_BATCH_SIZE)
+    db = session_factory()
+    try:
+        if output_format == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(fields)
+            yield buffer.getvalue()
+        for batch in db.execute(query).partitions():
+            if output_format == "csv":
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                writer.writerows(batch)
+                yield buffer.getvalue()
+            else:
+                yield "".join(json.dumps(dict(row._mapping)) + "\n" for row in batch)
+    finally:
+        db.close()
@@ -0,0 +1,221 @@
+#imports
+import asyncio
+import itertools
+import json
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from fastapi import HTTPException
+from sqlalchemy import or_
+from starlette.concurrency import run_in_threadpool
+from database import SessionLocal
+from models import Job
+
+#number of jobs processed at the same time
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+#queued jobs beyond this limit are rejected instead of piling up in front of the model server
+JOB_QUEUE_LIMIT = int(os.getenv("JOB_QUEUE_LIMIT", "100"))
+#finished jobs, with their payloads and results, are deleted this long after they finish, 0 keeps them
+JOB_RETENTION_HOURS = float(os.getenv("JOB_RETENTION_HOURS", "24"))
+#how long a worker's claim on a running job holds, it is renewed while the job runs,
+#so only jobs of a worker that died are picked up by another one
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "120"))
+#how often finished jobs past their retention and running jobs with an expired lease are looked for
+JOB_SWEEP_INTERVAL_SECONDS = 60
+
+#lower numbers are served first, so interactive grading runs ahead of prefetching
+PRIORITY_INTERACTIVE = 0
+PRIORITY_PREFETCH = 10
+
+#priority queue of background jobs, persisted in the jobs table so results survive a restart
+class JobQueue:
+    def __init__(self, session_factory=SessionLocal, workers=JOB_WORKERS, max_pending=JOB_QUEUE_LIMIT,
+                 retention_hours=JOB_RETENTION_HOURS, lease_seconds=JOB_LEASE_SECONDS):
+        self.session_factory = session_factory
+        self.workers = workers
+        self.max_pending = max_pending
+        self.retention_hours = retention_hours
+        self.lease_seconds = lease_seconds
+        #identifies this process's claims among every worker sharing the jobs table
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.handlers = {}
+        self._queue = None
+        #ids on this worker's queue, so a sweep doesn't queue them twice
+        self._queued = set()
+        self._tasks = []
+        self._loop = None
+        self._sequence = itertools.count()
+
+    #registers the coroutine that runs a kind of job and its default priority
+    def register(self, kind, handler, priority=PRIORITY_PREFETCH):
+        self.handlers[kind] = (handler, priority)
+
+    #runs fn(session) in the threadpool, so a write waiting on a locked database doesn't stall the event loop
+    async def _run(self, fn):
+        def run():
+            db = self.session_factory()
+            try:
+                return fn(db)
+            finally:
+                db.close()
+        return await run_in_threadpool(run)
+
+    #starts the workers and queues the jobs nobody is running, other workers' queued jobs included since
+    #a job only runs once whoever claims it first
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        if self._tasks and self._loop is loop:
+            return
+        self._loop = loop
+        self._queue = asyncio.PriorityQueue()
+        self._queued = set()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._sweeper()))
+        await self.requeue()
+
+    #puts queued jobs and running jobs whose worker stopped renewing the lease back on this worker's queue
+    async def requeue(self):
+        now = datetime.utcnow()
+
+        def load(db):
+            db.query(Job).filter(Job.status == "running", or_(Job.lease_until.is_(None), Job.lease_until < now)) \
+                .update({Job.status: "queued", Job.owner: None}, synchronize_session=False)
+            db.commit()
+            return db.query(Job.priority, Job.id).filter(Job.status == "queued").order_by(Job.created_at).all()
+        for priority, job_id in await self._run(load):
+            self._enqueue(priority, job_id)
+
+    def _enqueue(self, priority, job_id):
+        if job_id not in self._queued:
+            self._queued.add(job_id)
+            self._queue.put_nowait((priority, next(self._sequence), job_id))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    #stores a new job and queues it, rejecting it when the queue is full
+    async def submit(self, kind, payload, priority=None):
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        #workers are started on demand when the app was not started through its startup event
+        await self.start()
+        if self._queue.qsize() >= self.max_pending:
+            #gives an error message so clients back off instead of queueing forever
+            raise HTTPException(status_code=503, detail="Job queue is full, try again later.",
+                                headers={"Retry-After": "5"})
+        if priority is None:
+            priority = self.handlers[kind][1]
+        job_id = uuid.uuid4().hex
+
+        def store(db):
+            db.add(Job(id=job_id, kind=kind, status="queued", priority=priority, payload=json.dumps(payload)))
+            db.commit()
+        await self._run(store)
+        self._enqueue(priority, job_id)
+        return job_id
+
+    #returns the stored state of a job, or None if it does not exist
+    def get(self, job_id):
+        db = self.session_factory()
+        try:
+            job = db.query(Job).filter(Job.id == job_id).first()
+            if not job:
+                return None
+            return {
+                "job_id": job.id,
+                "kind": job.kind,
+                "status": job.status,
+                "priority": job.priority,
+                "result": json.loads(job.result) if job.result else None,
+                "error": job.error,
+                "created_at": job.created_at,
+                "updated_at": job.updated_at
+            }
+        finally:
+            db.close()
+
+    def stats(self):
+        return {"queued": self._queue.qsize() if self._queue else 0, "workers": len(self._tasks)}
+
+    #deletes finished jobs older than the retention, returning how many were deleted
+    async def prune(self):
+        cutoff = datetime.utcnow() - timedelta(hours=self.retention_hours)
+
+        def delete(db):
+            deleted = db.query(Job).filter(Job.status.in_(["succeeded", "failed"]), Job.updated_at < cutoff) \
+                .delete(synchronize_session=False)
+            db.commit()
+            return deleted
+        return await self._run(delete)
+
+    async def _sweeper(self):
+        while True:
+            await asyncio.sleep(JOB_SWEEP_INTERVAL_SECONDS)
+            try:
+                if self.retention_hours:
+                    await self.prune()
+                await self.requeue()
+            except Exception:
+                #a busy database is tried again on the next round
+                pass
+
+    #updates a job this worker holds the claim on
+    async def _update(self, job_id, **fields):
+        def update(db):
+            db.query(Job).filter(Job.id == job_id, Job.owner == self.owner).update(fields)
+            db.commit()
+        await self._run(update)
+
+    #claims a queued job with one conditional UPDATE, so when several workers queued the same job only one runs it,
+    #returns its kind and payload, or (None, None) when another worker got it first
+    async def _claim(self, job_id):
+        def claim(db):
+            claimed = db.query(Job).filter(Job.id == job_id, Job.status == "queued").update(
+                {Job.status: "running", Job.owner: self.owner,
+                 Job.lease_until: datetime.utcnow() + timedelta(seconds=self.lease_seconds)},
+                synchronize_session=False)
+            db.commit()
+            if claimed != 1:
+                return None, None
+            job = db.query(Job.kind, Job.payload).filter(Job.id == job_id).first()
+            return job.kind, json.loads(job.payload)
+        return await self._run(claim)
+
+    #extends the lease while the job runs
+    async def _renew(self, job_id):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                await self._update(job_id, lease_until=datetime.utcnow() + timedelta(seconds=self.lease_seconds))
+            except Exception:
+                pass
+
+    async def _worker(self):
+        while True:
+            #stops even when a handler swallowed the cancellation, otherwise shutdown waits on queue.get forever
+            if asyncio.current_task().cancelling():
+                raise asyncio.CancelledError()
+            _, _, job_id = await self._queue.get()
+            self._queued.discard(job_id)
+            try:
+                kind, payload = await self._claim(job_id)
+                if kind is None:
+                    continue
+                handler, _ = self.handlers[kind]
+                renew = asyncio.create_task(self._renew(job_id))
+                try:
+                    result = await handler(payload)
+                except HTTPException as e:
+                    await self._update(job_id, status="failed", error=str(e.detail))
+                except Exception as e:
+                    await self._update(job_id, status="failed", error=str(e))
+                else:
+                    await self._update(job_id, status="succeeded", result=json.dumps(result))
+                finally:
+                    renew.cancel()
+            finally:
+                self._queue.task_done()
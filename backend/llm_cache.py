@@ -0,0 +1,202 @@
+#imports
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from langchain_core.output_parsers import StrOutputParser
+from llm_service import ainvoke_chain
+
+#the persistent tier lives next to users.db unless pointed elsewhere
+LLM_CACHE_DB = os.getenv("LLM_CACHE_DB", "./llm_cache.db")
+LLM_CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", "86400"))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1024"))
+#expired rows are deleted from the SQLite tier once every this many writes, and when the cache is opened
+LLM_CACHE_SWEEP_EVERY = int(os.getenv("LLM_CACHE_SWEEP_EVERY", "100"))
+
+#model settings that change the completion and therefore belong in the cache key
+_KEY_PARAMS = ("temperature", "num_predict", "top_k", "top_p", "format", "stop")
+
+#collects the generation parameters of an LLM client, including any bound per-call options
+def llm_params(llm):
+    bound = getattr(llm, "bound", llm)
+    params = {name: getattr(bound, name, None) for name in _KEY_PARAMS}
+    params.update(getattr(llm, "kwargs", None) or {})
+    return params
+
+#builds a content-addressed key from the rendered prompt, model name and parameters
+def make_cache_key(prompt_text, model, params):
+    payload = json.dumps({"prompt": prompt_text, "model": model, "params": params},
+                         sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+#two-tier completion cache: an in-process LRU in front of a SQLite table
+class LLMCache:
+    def __init__(self, db_path=LLM_CACHE_DB, ttl=LLM_CACHE_TTL_SECONDS, max_entries=LLM_CACHE_MAX_ENTRIES,
+                 sweep_every=LLM_CACHE_SWEEP_EVERY):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.sweep_every = sweep_every
+        self._writes = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_lock = threading.Lock()
+        self._inflight = {}
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._conn = None
+        if db_path:
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            #lets the expiry sweep find old rows without scanning the table
+            self._conn.execute("CREATE INDEX IF NOT EXISTS ix_llm_cache_created_at ON llm_cache (created_at)")
+            self._sweep(time.time())
+            self._conn.commit()
+
+    #deletes rows past the TTL, the caller commits
+    def _sweep(self, now):
+        if self.ttl is not None:
+            self._conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl,))
+
+    def _expired(self, created_at, now):
+        return self.ttl is not None and now - created_at > self.ttl
+
+    def _from_memory(self, key, now):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            value, created_at = entry
+            if self._expired(created_at, now):
+                del self._memory[key]
+                return None
+            self._memory.move_to_end(key)
+            self.memory_hits += 1
+            return value
+
+    #reads the SQLite tier under its own lock, so memory hits never wait on a disk write
+    def _from_disk(self, key, now):
+        with self._disk_lock:
+            row = self._conn.execute("SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is not None and self._expired(row[1], now):
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                row = None
+        if row is None:
+            return None
+        value, created_at = row
+        with self._lock:
+            self._remember(key, value, created_at)
+            self.disk_hits += 1
+        return value
+
+    def _to_disk(self, key, value, now):
+        with self._disk_lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, created_at) VALUES (?, ?, ?)",
+                (key, value, now),
+            )
+            #expired rows are never served, so they are only cleared out now and then
+            self._writes += 1
+            if self.sweep_every and self._writes % self.sweep_every == 0:
+                self._sweep(now)
+            self._conn.commit()
+
+    def _miss(self):
+        with self._lock:
+            self.misses += 1
+
+    #looks the key up in memory first, then on disk, promoting disk hits into memory
+    def get(self, key):
+        now = time.time()
+        value = self._from_memory(key, now)
+        if value is None and self._conn is not None:
+            value = self._from_disk(key, now)
+        if value is None:
+            self._miss()
+        return value
+
+    #get for async code, memory hits are answered on the event loop and disk lookups run in a thread
+    async def aget(self, key):
+        now = time.time()
+        value = self._from_memory(key, now)
+        if value is None and self._conn is not None:
+            value = await asyncio.to_thread(self._from_disk, key, now)
+        if value is None:
+            self._miss()
+        return value
+
+    #stores a completion in both tiers
+    def set(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now)
+        if self._conn is not None:
+            self._to_disk(key, value, now)
+
+    #set for async code, the disk write and its commit run in a thread
+    async def aset(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now)
+        if self._conn is not None:
+            await asyncio.to_thread(self._to_disk, key, value, now)
+
+    def _remember(self, key, value, created_at):
+        self._memory[key] = (value, created_at)
+        self._memory.move_to_end(key)
+        #evicts the least recently used entries once the memory tier is full
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        if self._conn is not None:
+            with self._disk_lock:
+                self._conn.execute("DELETE FROM llm_cache")
+                self._conn.commit()
+
+    #hit/miss counters for monitoring
+    def stats(self):
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "memory_entries": len(self._memory),
+            }
+
+    #renders the prompt and returns it together with its cache key
+    def prepare(self, prompt, llm, inputs):
+        rendered = prompt.format(**inputs)
+        return rendered, make_cache_key(rendered, getattr(llm, "model", None), llm_params(llm))
+
+    #runs the prompt through the LLM unless an identical completion is cached,
+    #sharing one in-flight call between concurrent identical requests
+    async def ainvoke(self, prompt, llm, inputs):
+        rendered, key = self.prepare(prompt, llm, inputs)
+        cached = await self.aget(key)
+        if cached is not None:
+            return cached
+        pending = self._inflight.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+        task = asyncio.ensure_future(ainvoke_chain(llm | StrOutputParser(), rendered))
+        self._inflight[key] = task
+        try:
+            response = await asyncio.shield(task)
+        finally:
+            self._inflight.pop(key, None)
+        await self.aset(key, response)
+        return response
@@ -0,0 +1,269 @@
+#imports
+import asyncio
+import os
+import random
+import threading
+import time
+from typing import Any, List
+import httpx
+from fastapi import HTTPException
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk, LLMResult
+from langchain_ollama import OllamaLLM
+from pydantic import PrivateAttr
+
+#comma separated Ollama servers, overrides the backends listed in prompts.json
+LLM_BACKENDS = os.getenv("LLM_BACKENDS", "")
+#consecutive failures after which a backend is taken out of rotation, and for how long
+LLM_CIRCUIT_FAILURES = int(os.getenv("LLM_CIRCUIT_FAILURES", "3"))
+LLM_CIRCUIT_RESET_SECONDS = float(os.getenv("LLM_CIRCUIT_RESET_SECONDS", "30"))
+#how often each backend's /api/tags is polled, 0 turns health checks off
+LLM_HEALTH_INTERVAL_SECONDS = float(os.getenv("LLM_HEALTH_INTERVAL_SECONDS", "10"))
+
+#gives an error message when every backend is down, has an open circuit or is busy with its trial request
+def _no_backend():
+    return HTTPException(status_code=503, detail="No LLM backend available.", headers={"Retry-After": "5"})
+
+#one Ollama server with its load, circuit breaker and health state
+class Backend:
+    def __init__(self, base_url, model, keep_alive=None, models=None):
+        self.base_url = base_url.rstrip("/")
+        self.llm = OllamaLLM(model=model, base_url=self.base_url, keep_alive=keep_alive)
+        #models the server has pulled, None until the first health check unless configured
+        self.models = set(models) if models else None
+        self.healthy = True
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        #set while the one trial request of a half-open circuit is in flight
+        self.trial = False
+
+    #the reset time of an open circuit has passed, but no request has succeeded since
+    def half_open(self, now):
+        return self.open_until > 0 and now >= self.open_until
+
+    #a backend is skipped while its circuit is open, and gets one trial request once the reset time has passed
+    def available(self, now):
+        return self.healthy and now >= self.open_until and not self.trial
+
+    #counts a request against the backend, or returns False when it has become unavailable since it was picked,
+    #the first request after the reset time becomes the trial and every other one skips the backend until it ends
+    def begin(self, now):
+        if not self.available(now):
+            return False
+        self.trial = self.half_open(now)
+        self.outstanding += 1
+        self.requests += 1
+        return True
+
+    def serves(self, model):
+        return self.models is None or model in self.models or f"{model}:latest" in self.models
+
+    #a success closes the circuit, a failed trial opens it again since the failure count is still over the limit
+    def record_success(self):
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+
+    def record_failure(self, now):
+        self.failures += 1
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= LLM_CIRCUIT_FAILURES:
+            self.open_until = now + LLM_CIRCUIT_RESET_SECONDS
+
+    def stats(self, now):
+        return {
+            "base_url": self.base_url,
+            "healthy": self.healthy,
+            "circuit": "open" if now < self.open_until else "half-open" if self.half_open(now) else "closed",
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "failures": self.failures,
+            "models": sorted(self.models) if self.models is not None else None,
+        }
+
+#LLM that spreads completions over several Ollama servers, picking the one with the fewest requests in flight
+#and failing over to the next one when a server errors before sending any output
+class LLMPool(LLM):
+    model: str = "llama3"
+    backends: List[Any] = []
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+    _health_task: Any = PrivateAttr(default=None)
+
+    @property
+    def _llm_type(self):
+        return "ollama-pool"
+
+    @property
+    def _identifying_params(self):
+        return {"model": self.model, "backends": [backend.base_url for backend in self.backends]}
+
+    #backends to try in order: healthy ones serving the model first, least outstanding requests first
+    def _candidates(self, model):
+        now = time.monotonic()
+        with self._lock:
+            serving = [backend for backend in self.backends if backend.serves(model)] or list(self.backends)
+            ready = [backend for backend in serving if backend.available(now)]
+            #random tie-break so equally loaded backends share the work
+            ready.sort(key=lambda backend: (backend.outstanding, random.random()))
+        if not ready:
+            raise _no_backend()
+        return ready
+
+    #a task routed to a model no backend has pulled runs on the pool's default model instead
+    def _route(self, kwargs):
+        model = kwargs.get("model") or self.model
+        with self._lock:
+            known = all(backend.models is not None for backend in self.backends)
+            if known and model != self.model and not any(backend.serves(model) for backend in self.backends):
+                model = self.model
+        return {**kwargs, "model": model}
+
+    def _acquire(self, backend):
+        with self._lock:
+            return backend.begin(time.monotonic())
+
+    def _release(self, backend, failed):
+        now = time.monotonic()
+        with self._lock:
+            backend.outstanding -= 1
+            backend.trial = False
+            if failed:
+                backend.record_failure(now)
+            else:
+                backend.record_success()
+
+    def _stream(self, prompt, stop=None, run_manager=None, **kwargs):
+        kwargs = self._route(kwargs)
+        error = None
+        for backend in self._candidates(kwargs["model"]):
+            if not self._acquire(backend):
+                continue
+            started = False
+            failed = True
+            try:
+                for chunk in backend.llm._stream(prompt, stop=stop, run_manager=run_manager, **kwargs):
+                    started = True
+                    yield chunk
+                failed = False
+                return
+            except (GeneratorExit, asyncio.CancelledError):
+                #the caller stopped reading or timed out, which says nothing about the backend
+                failed = False
+                raise
+            except Exception as e:
+                #output already sent can't be taken back, so only failures before the first chunk fail over
+                if started:
+                    raise
+                error = e
+            finally:
+                self._release(backend, failed)
+        raise error or _no_backend()
+
+    async def _astream(self, prompt, stop=None, run_manager=None, **kwargs):
+        kwargs = self._route(kwargs)
+        error = None
+        for backend in self._candidates(kwargs["model"]):
+            if not self._acquire(backend):
+                continue
+            started = False
+            failed = True
+            try:
+                async for chunk in backend.llm._astream(prompt, stop=stop, run_manager=run_manager, **kwargs):
+                    started = True
+                    yield chunk
+                failed = False
+                return
+            except (GeneratorExit, asyncio.CancelledError):
+                failed = False
+                raise
+            except Exception as e:
+                if started:
+                    raise
+                error = e
+            finally:
+                self._release(backend, failed)
+        raise error or _no_backend()
+
+    def _call(self, prompt, stop=None, run_manager=None, **kwargs):
+        return "".join(chunk.text for chunk in self._stream(prompt, stop=stop, run_manager=run_manager, **kwargs))
+
+    async def _acall(self, prompt, stop=None, run_manager=None, **kwargs):
+        return "".join([chunk.text async for chunk in self._astream(prompt, stop=stop, run_manager=run_manager, **kwargs)])
+
+    #merges the streamed chunks instead of joining their text, so Ollama's token counts and timings
+    #in the final chunk's generation_info reach the callbacks
+    def _generate(self, prompts, stop=None, run_manager=None, **kwargs):
+        generations = []
+        for prompt in prompts:
+            merged = GenerationChunk(text="")
+            for chunk in self._stream(prompt, stop=stop, run_manager=run_manager, **kwargs):
+                merged += chunk
+            generations.append([merged])
+        return LLMResult(generations=generations)
+
+    async def _agenerate(self, prompts, stop=None, run_manager=None, **kwargs):
+        generations = []
+        for prompt in prompts:
+            merged = GenerationChunk(text="")
+            async for chunk in self._astream(prompt, stop=stop, run_manager=run_manager, **kwargs):
+                merged += chunk
+            generations.append([merged])
+        return LLMResult(generations=generations)
+
+    #polls every backend's model list once, marking unreachable ones unhealthy
+    async def check_health(self):
+        async with httpx.AsyncClient(timeout=5) as client:
+            async def check(backend):
+                try:
+                    response = await client.get(f"{backend.base_url}/api/tags")
+                    response.raise_for_status()
+                    models = {model["name"] for model in response.json().get("models", [])}
+                except (httpx.HTTPError, ValueError):
+                    healthy, models = False, backend.models
+                else:
+                    healthy = True
+                with self._lock:
+                    if healthy and not backend.healthy:
+                        backend.record_success()
+                    backend.healthy, backend.models = healthy, models
+
+            await asyncio.gather(*(check(backend) for backend in self.backends))
+
+    async def _health_loop(self, interval):
+        while True:
+            await self.check_health()
+            await asyncio.sleep(interval)
+
+    def start_health_checks(self, interval=LLM_HEALTH_INTERVAL_SECONDS):
+        if interval > 0 and (self._health_task is None or self._health_task.done()):
+            self._health_task = asyncio.create_task(self._health_loop(interval))
+
+    async def stop_health_checks(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+            self._health_task = None
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            return {"model": self.model, "backends": [backend.stats(now) for backend in self.backends]}
+
+#builds the pool from the model section of prompts.json, LLM_BACKENDS replaces its server list
+def pool_from_settings(settings, backends=LLM_BACKENDS):
+    model = settings.get("name", "llama3")
+    keep_alive = settings.get("keep_alive")
+    entries = [url.strip() for url in backends.split(",") if url.strip()] if backends else \
+        settings.get("backends") or [settings.get("base_url", "http://localhost:11434")]
+    pool_backends = []
+    for entry in entries:
+        #entries are a URL, or an object with base_url and the models that server has
+        if isinstance(entry, str):
+            entry = {"base_url": entry}
+        pool_backends.append(Backend(entry["base_url"], model, keep_alive, entry.get("models")))
+    return LLMPool(model=model, backends=pool_backends)
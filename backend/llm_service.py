@@ -0,0 +1,192 @@
+#imports
+import asyncio
+import contextvars
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from fastapi import HTTPException
+from metrics import llm_queue_wait, registry
+
+#limits how many completions can be in flight against each model server at once
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+#default number of seconds a single completion may take before it is abandoned
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "120"))
+#completions one client may have waiting for a slot, more are rejected with a 429
+LLM_QUEUE_PER_CLIENT = int(os.getenv("LLM_QUEUE_PER_CLIENT", "8"))
+#how long a completion may wait for a slot before it is rejected with a 503
+LLM_QUEUE_TIMEOUT_SECONDS = float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", "60"))
+
+#the user (or IP) the current request belongs to, set by the rate limit dependency, work without one shares a turn
+llm_client = contextvars.ContextVar("llm_client", default="background")
+#client of work nobody is waiting for, like question bank top-ups, it only gets a slot when no other client is
+#waiting and holds at most one at a time, so the rest stay free for users
+IDLE_CLIENT = "idle"
+
+llm_queue_shed = registry.counter("llm_queue_shed_total", "Completions turned away while waiting for a slot", ("reason",))
+
+#concurrency limit that hands free slots to waiting clients in turn, so one client's backlog
+#can't hold everyone else behind it
+class FairQueue:
+    def __init__(self, limit, per_client=LLM_QUEUE_PER_CLIENT):
+        self.limit = limit
+        self.per_client = per_client
+        self.active = 0
+        self.idle_active = 0
+        #waiters per client, in the order the clients get their next turn
+        self._waiting = OrderedDict()
+        self._idle_waiting = deque()
+
+    def waiting(self):
+        return sum(len(waiters) for waiters in self._waiting.values())
+
+    def idle_waiting(self):
+        return len(self._idle_waiting)
+
+    #idle work waits as long as it takes instead of timing out
+    async def acquire(self, client, timeout=LLM_QUEUE_TIMEOUT_SECONDS):
+        if client == IDLE_CLIENT:
+            return await self._acquire_idle()
+        if self.active < self.limit and not self._waiting:
+            self.active += 1
+            return
+        waiters = self._waiting.get(client)
+        if waiters is not None and len(waiters) >= self.per_client:
+            llm_queue_shed.inc(reason="client_queue_full")
+            raise HTTPException(status_code=429, detail="Too many requests waiting, try again later.",
+                                headers={"Retry-After": "5"})
+        future = asyncio.get_running_loop().create_future()
+        self._waiting.setdefault(client, deque()).append(future)
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled():
+                #the slot was handed over just as the wait ended, so it is passed on
+                self.release()
+            else:
+                future.cancel()
+                self._discard(client, future)
+            if isinstance(e, asyncio.TimeoutError):
+                llm_queue_shed.inc(reason="timeout")
+                raise HTTPException(status_code=503, detail="The model is busy, try again later.",
+                                    headers={"Retry-After": "10"})
+            raise
+
+    async def _acquire_idle(self):
+        if self.active < self.limit and not self._waiting and not self.idle_active:
+            self.active += 1
+            self.idle_active += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._idle_waiting.append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release(IDLE_CLIENT)
+            elif future in self._idle_waiting:
+                self._idle_waiting.remove(future)
+            raise
+
+    def _discard(self, client, future):
+        waiters = self._waiting.get(client)
+        if waiters is not None and future in waiters:
+            waiters.remove(future)
+            if not waiters:
+                del self._waiting[client]
+
+    #hands the slot to the next client in turn, which then goes to the back of the line,
+    #idle work gets it only when no other client is waiting
+    def release(self, client=None):
+        if client == IDLE_CLIENT:
+            self.idle_active -= 1
+        while self._waiting:
+            client, waiters = next(iter(self._waiting.items()))
+            future = waiters.popleft()
+            if waiters:
+                self._waiting.move_to_end(client)
+            else:
+                del self._waiting[client]
+            if not future.done():
+                future.set_result(None)
+                return
+        while self._idle_waiting and not self.idle_active:
+            future = self._idle_waiting.popleft()
+            if not future.done():
+                self.idle_active += 1
+                future.set_result(None)
+                return
+        self.active -= 1
+
+#the queue is created lazily so it always belongs to the running event loop
+_queue = None
+_queue_loop = None
+_max_concurrency = LLM_MAX_CONCURRENCY
+
+#sets the total number of completions in flight, e.g. the per-server limit times the number of servers
+def set_max_concurrency(limit):
+    global _queue, _max_concurrency
+    _max_concurrency = limit
+    _queue = None
+
+def _get_queue():
+    global _queue, _queue_loop
+    loop = asyncio.get_running_loop()
+    if _queue is None or _queue_loop is not loop:
+        _queue = FairQueue(_max_concurrency)
+        _queue_loop = loop
+    return _queue
+
+def queue_stats():
+    queue = _queue
+    return {"limit": _max_concurrency, "active": queue.active if queue else 0,
+            "waiting": queue.waiting() if queue else 0, "waiting_clients": len(queue._waiting) if queue else 0,
+            "idle_active": queue.idle_active if queue else 0, "idle_waiting": queue.idle_waiting() if queue else 0,
+            "shed": llm_queue_shed.snapshot()}
+
+#holds a concurrency slot, taking turns with other clients and recording how long the completion queued for it
+@asynccontextmanager
+async def _slot():
+    queue = _get_queue()
+    client = llm_client.get()
+    started = time.perf_counter()
+    await queue.acquire(client)
+    llm_queue_wait.observe(time.perf_counter() - started)
+    try:
+        yield
+    finally:
+        queue.release(client)
+
+#runs a chain without blocking the event loop, bounded by the concurrency limit and a timeout
+async def ainvoke_chain(chain, inputs, timeout=None):
+    timeout = LLM_TIMEOUT_SECONDS if timeout is None else timeout
+    async with _slot():
+        try:
+            return await asyncio.wait_for(chain.ainvoke(inputs), timeout)
+        except asyncio.TimeoutError:
+            #gives an error message if the model server takes too long
+            raise HTTPException(status_code=504, detail="LLM request timed out.")
+
+#streams the chain output chunk by chunk, holding one concurrency slot for the whole stream
+async def astream_chain(chain, inputs, timeout=None):
+    timeout = LLM_TIMEOUT_SECONDS if timeout is None else timeout
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    async with _slot():
+        stream = chain.astream(inputs).__aiter__()
+        try:
+            while True:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    raise HTTPException(status_code=504, detail="LLM request timed out.")
+                try:
+                    chunk = await asyncio.wait_for(stream.__anext__(), remaining)
+                except StopAsyncIteration:
+                    break
+                except asyncio.TimeoutError:
+                    raise HTTPException(status_code=504, detail="LLM request timed out.")
+                yield chunk
+        finally:
+            #closes the underlying stream so the model server stops generating
+            if hasattr(stream, "aclose"):
+                await stream.aclose()
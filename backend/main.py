@@ -1,24 +1,44 @@
 #imports
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
+import asyncio
 import json
+import os
 import re
-from langchain_core.prompts import PromptTemplate
-from langchain_core.output_parsers import JsonOutputParser, StrOutputParser
+import time
+from langchain_core.output_parsers import JsonOutputParser
 from sqlalchemy.orm import Session
 from fastapi import Depends
-from database import SessionLocal, engine
-from models import User, QuestionResponse, UserJobInterest
-from schemas import UserCreate, UserLogin
-from passlib.hash import bcrypt
+from database import SessionLocal, async_engine, engine
+from models import User, QuestionResponse, SubtopicScoreRollup
+from schemas import UserCreate, UserLogin, RefreshRequest
+from passwords import hash_executor, hash_password, verify_password
+from tokens import (ACCESS_TOKEN_TTL_SECONDS, ALLOW_LEGACY_USER_ID, consume_refresh_token, create_access_token,
+                    get_token_claims, issue_refresh_token, require_token_claims, resolve_user_id)
 from database import Base
-from langchain_ollama import OllamaLLM
-from collections import defaultdict
-from collections import Counter
-from sqlalchemy import func
-from database import get_db  
+from migrations import run_migrations
+from rollups import record_interest, record_responses
+from history import export_rows, history_page, history_query, parse_fields, HISTORY_FIELDS
+from token_budget import ANSWER_MAX_TOKENS, FEEDBACK_MAX_TOKENS, check_answer_size, fit_input
+from sqlalchemy import func, insert
+from database import get_db, run_db
+from llm_service import (IDLE_CLIENT, LLM_MAX_CONCURRENCY, ainvoke_chain, astream_chain, llm_client, queue_stats,
+                         set_max_concurrency)
+from llm_pool import pool_from_settings
+from llm_cache import LLMCache
+from semantic_cache import SemanticCache, build_embedder
+from prompt_registry import PromptRegistry
+from rate_limit import apply_rate_limit, rate_limit, rate_limiter
+from question_bank import (QUESTION_BANK_TARGET, QUESTIONS_PER_SET, add_questions, bank_key, format_questions,
+                           parse_questions, refill, stock, take_questions)
+from structured_output import (CategorizedSubtopics, RefinedSubtopicsOutput, SubtopicsOutput, generate_structured,
+                               structured_stats)
+from jobs import JobQueue, PRIORITY_INTERACTIVE
+from metrics import (db_queries_per_request, db_time_per_request, http_request_duration, instrument_engine,
+                     llm_metrics, log_event, registry, timed_stage, track_request_db, track_token_usage, usage_columns)
 from pydantic import BaseModel, Field, constr
 from enum import Enum
 
@@ -27,6 +47,7 @@ from enum import Enum
 #app initialisation
 app = FastAPI()
 Base.metadata.create_all(bind=engine)
+run_migrations(engine)
 
 app.add_middleware(
     CORSMiddleware,
@@ -36,7 +57,23 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-llm = OllamaLLM(model="llama3", base_url="http://localhost:11434")
+#loads every prompt and its model parameters once, from prompts.json
+registry_started = time.perf_counter()
+prompts = PromptRegistry()
+#pool of Ollama servers, a single one unless LLM_BACKENDS or prompts.json lists more
+llm_pool = pool_from_settings(prompts.llm_settings)
+#records duration, time to first token and token counts of every completion
+llm_pool.callbacks = [llm_metrics]
+set_max_concurrency(LLM_MAX_CONCURRENCY * len(llm_pool.backends))
+llm = llm_pool
+prompts.build(llm)
+startup_stats = {"prompts_version": prompts.version,
+                 "registry_load_ms": round((time.perf_counter() - registry_started) * 1000, 2),
+                 "warmup_ms": None, "warmup_error": None, "first_request_ms": None}
+#caches completions for repeated generation requests
+llm_cache = LLMCache()
+#reuses evaluations of near-identical answers when SEMANTIC_CACHE=1
+semantic_cache = SemanticCache(embedder=build_embedder(base_url=llm_pool.backends[0].base_url))
 
 #request models define the structure for incoming JSON payloads
 class SubtopicRequest(BaseModel):
@@ -75,152 +112,440 @@ class QuestionRequest(BaseModel):
     job_role: constr(min_length=1)
     experience_level: constr(min_length=1)
 
+class AnswerItem(BaseModel):
+    question: str
+    answer: str
 
+#most answers one batch may grade, a question set is 7
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "10"))
 
-#endpoints
-#breaks down a job role into 6-8 interview subtopics using LLM
-@app.post("/generate-subtopics")
-def generate_subtopics(request: SubtopicRequest):
-    #prompts the LLM for subtopics based on a selected job role and experience level
-    prompt = PromptTemplate.from_template(
-        "Break down the role of a {job_role} into 6-8 key interview subtopics "
-        "for a {experience_level} candidate. Return the result as a JSON object "
-        "with a 'subtopics' key containing a list of strings. Example: "
-        "{{\"subtopics\": [\"Data Structures\", \"System Design\", \"Databases\"]}}"
-    )
-    #chains the prompt with the LLM and string output parser. 
-    chain = prompt | llm | StrOutputParser()
-    response = chain.invoke({"job_role": request.job_role, 
-                             "experience_level": request.experience_level})
-    #extracts the necessary data
-    match = re.search(r"\{[\s\S]*?\}", response)
-    if not match:
-        #gives an error message if no JSON object is found
-        raise HTTPException(status_code=500, detail="No JSON object found in response.")
+class BatchCheckRequest(BaseModel):
+    user_id: Optional[int] = None
+    job_role: Optional[str] = None
+    subtopic: Optional[str] = None
+    evaluation_mode: Optional[str] = None
+    items: List[AnswerItem] = Field(min_length=1, max_length=BATCH_MAX_ITEMS)
+
+class PipelineRequest(BaseModel):
+    job_role: constr(min_length=1)
+    experience_level: constr(min_length=1)
+    #question type used for the questions prefetched for the first subtopics
+    question_type: QuestionType = QuestionType.technical
+
+
+
+#runs long generations on background workers so clients can poll instead of holding a request open
+job_queue = JobQueue()
+
+#stores a job and answers with its id and a 202 status
+async def queue_job(kind, payload):
+    job_id = await job_queue.submit(kind, payload)
+    return JSONResponse(status_code=202, content={"job_id": job_id, "status": "queued"})
+
+@app.on_event("startup")
+async def start_job_workers():
+    await job_queue.start()
+
+#loads the model into Ollama's memory in the background so the first user request doesn't pay for it
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "1") == "1"
+
+async def warm_up_llm():
+    started = time.perf_counter()
     try:
-        #parses the JSON string into a python dictionary, validates it exists and then returns the list of subtopics as a JSON response
-        parsed = json.loads(match.group())
-        if "subtopics" not in parsed or not isinstance(parsed["subtopics"], list):
-            raise ValueError("Missing or invalid 'subtopics' key in response.")
-        return {"subtopics": parsed["subtopics"]}
+        await ainvoke_chain(prompts.chain("warmup", llm), {})
     except Exception as e:
-        #catches any errors in parsing or validation
-        raise HTTPException(status_code=500, detail=f"Invalid response format: {str(e)}")
+        startup_stats["warmup_error"] = str(e) or type(e).__name__
+    startup_stats["warmup_ms"] = round((time.perf_counter() - started) * 1000, 2)
+
+#the task is kept on app.state, since the event loop only holds a weak reference to it
+@app.on_event("startup")
+async def start_llm_warmup():
+    app.state.warmup_task = asyncio.create_task(warm_up_llm()) if WARMUP_ON_STARTUP else None
+
+@app.on_event("shutdown")
+async def stop_llm_warmup():
+    task = getattr(app.state, "warmup_task", None)
+    if task is not None:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        app.state.warmup_task = None
+
+#polls the Ollama servers so dead ones leave the rotation and come back once they answer again
+@app.on_event("startup")
+async def start_llm_health_checks():
+    llm_pool.start_health_checks()
+
+@app.on_event("shutdown")
+async def stop_llm_health_checks():
+    await llm_pool.stop_health_checks()
+
+#times every database query, on the async engine too when there is one
+instrument_engine(engine)
+if async_engine is not None:
+    instrument_engine(async_engine.sync_engine)
+
+#records latency per route, and how many database queries each request ran and how long they took,
+#the route template is used as the label so path parameters don't create a series per id
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    started = time.perf_counter()
+    status = 500
+    with track_request_db() as db_stats:
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            route = request.scope.get("route")
+            path = route.path if route is not None else "unmatched"
+            http_request_duration.observe(time.perf_counter() - started, method=request.method, route=path, status=status)
+            db_queries_per_request.observe(db_stats["queries"], route=path)
+            db_time_per_request.observe(db_stats["seconds"], route=path)
+
+#records how long the first request after boot took
+@app.middleware("http")
+async def record_first_request(request: Request, call_next):
+    if startup_stats["first_request_ms"] is not None:
+        return await call_next(request)
+    started = time.perf_counter()
+    response = await call_next(request)
+    if startup_stats["first_request_ms"] is None:
+        startup_stats["first_request_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        startup_stats["first_request_path"] = request.url.path
+    return response
+
+@app.on_event("shutdown")
+async def stop_job_workers():
+    await job_queue.stop()
+
+#writes the semantic cache indexes that changed since their last save
+@app.on_event("shutdown")
+async def flush_semantic_cache():
+    await semantic_cache.flush()
+
+#endpoints
+#breaks down a job role into 6-8 interview subtopics using LLM
+@app.post("/generate-subtopics", dependencies=[Depends(rate_limit("generate-subtopics"))])
+async def generate_subtopics(request: SubtopicRequest, background: bool = False):
+    if background:
+        return await queue_job("generate-subtopics", request.model_dump(mode="json"))
+    #prompts the LLM for subtopics based on a selected job role and experience level,
+    #reusing the cached answer for repeated inputs, and validates the JSON object it returns
+    parsed, _ = await generate_structured(prompts, "subtopics", llm, {"job_role": request.job_role, 
+                                                                       "experience_level": request.experience_level},
+                                          SubtopicsOutput, cache=llm_cache)
+    return {"subtopics": parsed["subtopics"]}
 
 #validates the relevance and grouping of the subtopics
-@app.post("/validate-subtopics")
-def validate_subtopics(request: ValidationRequest):
+@app.post("/validate-subtopics", dependencies=[Depends(rate_limit("validate-subtopics"))])
+async def validate_subtopics(request: ValidationRequest):
     subtopics_str = ", ".join(request.subtopics)
     #prompts the LLM to validate the subtopics, asking for feedback
-    prompt = PromptTemplate.from_template(
-        "Validate the following subtopics for a {job_role} interview: {subtopics}. "
-        "Are they relevant and logically grouped? Provide feedback or corrections."
-    )
-    #chains the prompt with the LLM and string output parser. 
-    chain = prompt | llm | StrOutputParser()
-    response = chain.invoke({"job_role": request.job_role, 
-                             "subtopics": subtopics_str})
+    response = await ainvoke_chain(prompts.chain("validation", llm), {"job_role": request.job_role, 
+                                          "subtopics": subtopics_str})
     #returns the LLM's feedback as JSON response
     return {"validation_feedback": response}
 
 #refines the subtopics based on feedback
-@app.post("/refine-subtopics")
-def refine_subtopics(request: RefineRequest):
+@app.post("/refine-subtopics", dependencies=[Depends(rate_limit("refine-subtopics"))])
+async def refine_subtopics(request: RefineRequest, background: bool = False):
+    if background:
+        return await queue_job("refine-subtopics", request.model_dump(mode="json"))
     subtopics_str = ", ".join(request.subtopics)
-    #prompts the LLM to refine the subtopics based on the feedback given 
-    prompt = PromptTemplate.from_template(
-        "Based on the following feedback: \"{feedback}\", "
-        "refine the subtopics for a {job_role} interview. "
-        "The original subtopics were: {subtopics}. "
-        "Return only a JSON object with a 'refined_subtopics' key containing a list of strings. "
-        "Example: {{\"refined_subtopics\": [\"Classroom Management\", \"Lesson Planning\", \"Student Engagement\"]}}"
-    )
-    #chains the prompt with the LLM and string output parser
-    chain = prompt | llm | StrOutputParser()
-    response = chain.invoke({
+    #prompts the LLM to refine the subtopics based on the feedback given and validates the JSON object it returns
+    parsed, response = await generate_structured(prompts, "refinement", llm, {
         "feedback": request.validation_feedback,
         "job_role": request.job_role,
         "subtopics": subtopics_str
-    })
-    #extracts the necessary data
-    match = re.search(r"\{.*\"refined_subtopics\"\s*:\s*\[.*?\]\s*\}", response, re.DOTALL)
-    if not match:
-        #gives an error message if no JSON object is found
-        raise HTTPException(status_code=500, detail="No JSON object found in response.")
-    try:
-        #parses the JSON string into a python dictionary, validates it exists and then returns the list of refined subtopics as a JSON response
-        parsed = json.loads(match.group())
-        if "refined_subtopics" not in parsed or not isinstance(parsed["refined_subtopics"], list):
-            raise ValueError("Missing or invalid 'refined_subtopics' key in response.")
-        return {"refined_subtopics": parsed["refined_subtopics"], "explanation": response}
-    except Exception as e:
-        #catches any errors in parsing or validation
-        raise HTTPException(status_code=500, detail=f"Invalid response format: {str(e)}")
+    }, RefinedSubtopicsOutput)
+    return {"refined_subtopics": parsed["refined_subtopics"], "explanation": response}
 
 #generates 7 interview questions for a chosen subtopic 
-@app.post("/generate-questions")
-def generate_questions(request: QuestionRequest):
-    #debugging log because of double click for some reason
-    print("Generating questions for:", request.subtopic)
-    #prompts the LLM to generate 7 interview questions based on the selected subtopic
-    prompt = PromptTemplate.from_template(
-        "Generate 7 {question_type} interview questions for a {experience_level} "
-        "{job_role} under the topic '{subtopic}'. Each question should:\n"
-        "- Be answerable in 5-10 minutes\n"
-        "- Be open-ended but focused\n"
-        "Avoid take-home project-style prompts. Format the output as a numbered list."
-        "**Return ONLY the 7 questions in a numbered list with no introduction, explanation.**"
-    )
-    #chains the prompt with the LLM and string output parser    
-    chain = prompt | llm | StrOutputParser()
-    response = chain.invoke({
-        "question_type": request.question_type,
+@app.post("/generate-questions", dependencies=[Depends(rate_limit("generate-questions"))])
+async def generate_questions(request: QuestionRequest, background: bool = False):
+    if background:
+        return await queue_job("generate-questions", request.model_dump(mode="json"))
+    log_event("generate_questions", subtopic=request.subtopic, question_type=request.question_type.value)
+    inputs = question_inputs(request)
+    key = bank_key(**inputs)
+    #serves a set from the question bank when it has one, most requests never reach the LLM
+    items = await serve_from_bank(inputs, key)
+    if items is not None:
+        return {"questions": format_questions(items), "items": items, "source": "bank"}
+    #prompts the LLM to generate 7 interview questions based on the selected subtopic,
+    #reusing the cached completion for repeated inputs
+    response = await llm_cache.ainvoke(prompts.template("questions"), prompts.model("questions", llm), inputs)
+    items = await bank_generated(inputs, key, response)
+    #returns the generated questions as a JSON response
+    return {"questions": response, "items": items, "source": "llm"}
+
+#streaming variant of /generate-questions that sends question tokens as NDJSON while they are generated
+@app.post("/generate-questions/stream", dependencies=[Depends(rate_limit("generate-questions"))])
+async def generate_questions_stream(request: QuestionRequest):
+    inputs = question_inputs(request)
+    key = bank_key(**inputs)
+
+    async def events():
+        items = await serve_from_bank(inputs, key)
+        if items is not None:
+            #a set from the question bank is sent as a single chunk
+            questions = format_questions(items)
+            yield ndjson_event(type="token", text=questions)
+            yield ndjson_event(type="result", questions=questions, items=items, source="bank")
+            return
+        rendered, cache_key = llm_cache.prepare(prompts.template("questions"), prompts.model("questions", llm), inputs)
+        cached = await llm_cache.aget(cache_key)
+        if cached is not None:
+            #a cached completion is sent as a single chunk
+            yield ndjson_event(type="token", text=cached)
+            yield ndjson_event(type="result", questions=cached, items=await bank_generated(inputs, key, cached),
+                               source="llm")
+            return
+        parts = []
+        try:
+            async for chunk in astream_chain(prompts.text_chain("questions", llm), rendered):
+                parts.append(chunk)
+                yield ndjson_event(type="token", text=chunk)
+        except HTTPException as e:
+            yield ndjson_event(type="error", status_code=e.status_code, detail=e.detail)
+            return
+        response = "".join(parts)
+        await llm_cache.aset(cache_key, response)
+        yield ndjson_event(type="result", questions=response, items=await bank_generated(inputs, key, response),
+                           source="llm")
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+def question_inputs(request):
+    return {
+        "question_type": request.question_type.value,
         "experience_level": request.experience_level,
         "job_role": request.job_role,
         "subtopic": request.subtopic
-    })
-    #returns the generated questions as a JSON response
-    return {"questions": response}
+    }
+
+#keys with a refill job already queued, so a busy key doesn't queue one per request
+refills_pending = set()
+
+#queues a low-priority job that tops a key's bank up to target, it runs after interactive work
+async def schedule_refill(inputs, key, target):
+    if key in refills_pending:
+        return
+    #marked before the job is stored, so concurrent requests don't queue it again meanwhile
+    refills_pending.add(key)
+    try:
+        await job_queue.submit("refill-question-bank", {**inputs, "target": target})
+    except HTTPException:
+        #the queue is full, a later request for this key tries again
+        refills_pending.discard(key)
+
+#generates in the LLM queue's idle lane, so top-ups only use the model while no user is waiting for it
+async def refill_question_bank(payload):
+    inputs = {name: value for name, value in payload.items() if name != "target"}
+    client = llm_client.set(IDLE_CLIENT)
+    try:
+        return await refill(prompts, llm, inputs, payload.get("target", QUESTION_BANK_TARGET))
+    finally:
+        llm_client.reset(client)
+        refills_pending.discard(bank_key(**inputs))
+
+#takes a set of questions from the bank, refilling the key when it runs low, or returns None if it can't fill a set,
+#each top-up adds one fresh set, so a key grows by a set per request instead of a burst of generations,
+#a key the bank couldn't serve also gets the set the request generates itself
+async def serve_from_bank(inputs, key):
+    items, available = await run_db(lambda db: (take_questions(db, key), stock(db, key)))
+    if available < QUESTION_BANK_TARGET:
+        sets = 1 if items is not None else 2
+        await schedule_refill(inputs, key, min(QUESTION_BANK_TARGET, available + sets * QUESTIONS_PER_SET))
+    return items
+
+#adds LLM generated questions to the bank as already served and returns them parsed
+async def bank_generated(inputs, key, response):
+    items = parse_questions(response)
+    await run_db(lambda db: add_questions(db, key, items, served=True))
+    return items
 
 #categorises subtopics into predefined categories
-@app.post("/categorize-subtopics")
-def categorize_subtopics(request: CategorizeRequest):
+@app.post("/categorize-subtopics", dependencies=[Depends(rate_limit("categorize-subtopics"))])
+async def categorize_subtopics(request: CategorizeRequest):
     subtopics_str = ", ".join(request.subtopics)
-    #prompts the LLM to cetegorise the refined subtopic list into given categories
-    prompt = PromptTemplate.from_template(
-        "Categorize the following interview subtopics into one of these categories:\n"
-        "- Technical Skills\n"
-        "- Soft Skills\n"
-        "- Advanced Topics\n"
-        "- General Skills\n\n"
-        "Subtopics: {subtopics}\n\n"
-        "Return the result as a JSON object with each category as a key and a list of subtopics as values."
+    #prompts the LLM to cetegorise the refined subtopic list into given categories,
+    #reusing the cached answer for repeated inputs, each category is returned as a list
+    parsed, _ = await generate_structured(prompts, "categorization", llm, {"subtopics": subtopics_str},
+                                          CategorizedSubtopics, cache=llm_cache)
+    return parsed
+
+#number of subtopics whose questions are prefetched while the pipeline categorises
+PIPELINE_PREFETCH_SUBTOPICS = int(os.getenv("PIPELINE_PREFETCH_SUBTOPICS", "3"))
+
+#validation ends with a verdict line, refinement is skipped when it says no changes are needed
+def needs_refinement(validation_feedback):
+    verdict = re.search(r"Verdict:\s*\**\s*(NO CHANGES|CHANGES NEEDED)", validation_feedback, re.IGNORECASE)
+    return not verdict or verdict.group(1).upper() != "NO CHANGES"
+
+#runs generate, validate, refine and categorize in one request, streaming each stage as NDJSON when it completes
+@app.post("/subtopic-pipeline", dependencies=[Depends(rate_limit("subtopic-pipeline"))])
+async def subtopic_pipeline(request: PipelineRequest):
+    async def events():
+        timings = {}
+        stage = "subtopics"
+
+        #runs one stage and records how long it took
+        async def timed(name, coroutine):
+            nonlocal stage
+            stage = name
+            started = time.perf_counter()
+            result = await coroutine
+            timings[name] = round((time.perf_counter() - started) * 1000, 2)
+            return result
+
+        started = time.perf_counter()
+        try:
+            subtopics = (await timed("subtopics", generate_subtopics(SubtopicRequest(
+                job_role=request.job_role, experience_level=request.experience_level))))["subtopics"]
+            yield ndjson_event(type="stage", stage="subtopics", subtopics=subtopics, ms=timings["subtopics"])
+
+            validation_feedback = (await timed("validation", validate_subtopics(ValidationRequest(
+                subtopics=subtopics, job_role=request.job_role))))["validation_feedback"]
+            yield ndjson_event(type="stage", stage="validation", validation_feedback=validation_feedback,
+                               ms=timings["validation"])
+
+            if needs_refinement(validation_feedback):
+                refined = await timed("refinement", refine_subtopics(RefineRequest(
+                    subtopics=subtopics, job_role=request.job_role, validation_feedback=validation_feedback)))
+                refined_subtopics, explanation = refined["refined_subtopics"], refined["explanation"]
+                yield ndjson_event(type="stage", stage="refinement", refined_subtopics=refined_subtopics,
+                                   explanation=explanation, skipped=False, ms=timings["refinement"])
+            else:
+                refined_subtopics = subtopics
+                yield ndjson_event(type="stage", stage="refinement", refined_subtopics=refined_subtopics,
+                                   explanation="", skipped=True, ms=0)
+
+            #queues question generation for the first subtopics so it runs on the job workers during categorization
+            prefetched = refined_subtopics[:PIPELINE_PREFETCH_SUBTOPICS]
+            for subtopic in prefetched:
+                inputs = {"question_type": request.question_type.value, "experience_level": request.experience_level,
+                          "job_role": request.job_role, "subtopic": subtopic}
+                #one set per subtopic, for the step the user is likely to take next, the rest fills in as it is used
+                await schedule_refill(inputs, bank_key(**inputs), QUESTIONS_PER_SET)
+            yield ndjson_event(type="prefetch", subtopics=prefetched)
+
+            categories = await timed("categorization", categorize_subtopics(CategorizeRequest(subtopics=refined_subtopics)))
+            yield ndjson_event(type="stage", stage="categorization", categories=categories, ms=timings["categorization"])
+        except HTTPException as e:
+            yield ndjson_event(type="error", stage=stage, status_code=e.status_code, detail=e.detail)
+            return
+        timings["total"] = round((time.perf_counter() - started) * 1000, 2)
+        yield ndjson_event(type="result", subtopics=subtopics, validation_feedback=validation_feedback,
+                           refined_subtopics=refined_subtopics, categories=categories, timings=timings)
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+#extracts the score from the refined feedback
+def parse_score(result):
+    score_match = re.search(r"Score:\s*(\d+)", result)
+    return int(score_match.group(1)) if score_match else None
+
+#checks that feedback follows the Score/Constructive Feedback format with a score out of 10
+def is_well_formed(result):
+    score = parse_score(result)
+    return score is not None and 0 <= score <= 10 and "Constructive Feedback:" in result
+
+#limits how many answers of one batch are graded at the same time
+BATCH_MAX_WORKERS = int(os.getenv("BATCH_MAX_WORKERS", "4"))
+
+#"single" grades in one call and only refines malformed output, "refine" always makes two calls
+EVALUATION_MODES = ("single", "refine")
+EVALUATION_MODE = os.getenv("EVALUATION_MODE", "single")
+
+#picks the evaluation mode for a request, falling back to the configured default
+def resolve_evaluation_mode(mode):
+    mode = mode or EVALUATION_MODE
+    if mode not in EVALUATION_MODES:
+        #gives an error message if the mode is unknown
+        raise HTTPException(status_code=422, detail=f"evaluation_mode must be one of {', '.join(EVALUATION_MODES)}")
+    return mode
+
+#grades an answer and returns the feedback, the parsed score and how many LLM calls were used
+async def evaluate_answer(question, answer, mode=None):
+    mode = resolve_evaluation_mode(mode)
+    #reuses the evaluation of a near-identical earlier answer to the same question without any LLM call
+    with timed_stage("check_response.semantic_lookup"):
+        hit, vector = await semantic_cache.match(question, answer)
+    if hit is not None and not hit["audit"]:
+        return hit["feedback"], hit["score"], 0
+    with timed_stage(f"check_response.grade_{mode}"):
+        result, score, llm_calls = await grade_answer(question, answer, mode)
+    if hit is not None:
+        semantic_cache.record_drift(hit["score"], score)
+    with timed_stage("check_response.semantic_store"):
+        await semantic_cache.add(question, vector, result, score)
+    return result, score, llm_calls
+
+async def grade_answer(question, answer, mode):
+    first_prompt = "single_pass_feedback" if mode == "single" else "initial_feedback"
+    inputs = grading_inputs(first_prompt, question, answer)
+    if mode == "single":
+        result = await ainvoke_chain(prompts.chain("single_pass_feedback", llm), inputs)
+        if is_well_formed(result):
+            return result, parse_score(result), 1
+        raw_feedback = result
+    else:
+        #initially prompts the LLM for constructive feedback and a score out of 10 based on the users answer
+        raw_feedback = await ainvoke_chain(prompts.chain("initial_feedback", llm), inputs)
+    #prompts the LLM once more to refine and validate the initial feedback
+    result = await ainvoke_chain(prompts.chain("feedback_refinement", llm), refinement_inputs(inputs, raw_feedback))
+    return result, parse_score(result), 2
+
+#the question and answer for a grading prompt, with a long answer trimmed to the token budget,
+#the stored answer stays whole
+def grading_inputs(prompt_name, question, answer):
+    return fit_input(prompts, prompt_name, {"question": question, "answer": answer}, "answer", ANSWER_MAX_TOKENS)
+
+def refinement_inputs(inputs, raw_feedback):
+    return fit_input(prompts, "feedback_refinement", {**inputs, "raw_feedback": raw_feedback}, "raw_feedback",
+                     FEEDBACK_MAX_TOKENS)
+
+#saves the graded response, the job the user is interested in and the score rollup in one transaction
+def save_response(db, user_id, job_role, subtopic, question, answer, score, result, usage=None):
+    response_entry = QuestionResponse(
+        user_id=user_id,
+        job_role=job_role,
+        question_text=question,
+        user_answer=answer,
+        score=score,
+        feedback=result,
+        subtopic = subtopic,
+        **(usage or {})
     )
-    #chains the prompt with the LLM and string output parser  
-    chain = prompt | llm | StrOutputParser()
-    response = chain.invoke({"subtopics": subtopics_str})
-    #extracts the necessary data
-    match = re.search(r"\{.*\}", response, re.DOTALL)
-    if not match:
-        #gives an error message if no JSON object is found
-        raise HTTPException(status_code=500, detail="No JSON object found in response.")
-    try:
-        #parses the JSON string into a python dictionary, ensures each value is in a list and returns the categorised subtopics
-        parsed = json.loads(match.group())
-        if not isinstance(parsed, dict):
-            raise ValueError("Expected a dictionary of categories.")
-        for key, value in parsed.items():
-            if not isinstance(value, list):
-                parsed[key] = [value] if value else []
-        return parsed
-    except Exception as e:
-        #catches any errors in parsing or validation
-        raise HTTPException(status_code=500, detail=f"Invalid response format: {str(e)}")
+    db.add(response_entry)
+    #counts the interaction with this job role and subtopic for analytics
+    record_interest(db, user_id, job_role, subtopic)
+    record_responses(db, [{"user_id": user_id, "job_role": job_role, "subtopic": subtopic, "score": score}])
+    db.commit()
+
+#formats a single newline-delimited JSON event for streaming responses
+def ndjson_event(**fields):
+    return json.dumps(fields) + "\n"
 
 #evaluates the users response and gives feedback and a score before storing it 
-@app.post("/check-response")
-async def check_response(request: Request, db: Session = Depends(get_db)):
+@app.post("/check-response", dependencies=[Depends(rate_limit("check-response"))])
+async def check_response(request: Request, background: bool = False, claims=Depends(get_token_claims)):
     data = await request.json()
+    #the user comes from the access token, the body's user_id is only used by legacy clients
+    data["user_id"] = resolve_user_id(claims, data.get("user_id"))
+    #answers too long to grade are refused before any work is queued
+    check_answer_size(data["question"], data["answer"])
+    if background:
+        #queues the grading ahead of prefetch jobs and returns a job id straight away
+        return await queue_job("check-response", data)
+    return await grade_and_store(data)
+
+#grades an answer from a /check-response payload and stores the result for the user
+async def grade_and_store(data):
     #extracts the question and answer from the request
     question = data["question"]
     answer = data["answer"]
@@ -228,133 +553,385 @@ async def check_response(request: Request, db: Session = Depends(get_db)):
     user_id = data.get("user_id")  
     job_role = data.get("job_role")
     subtopic = data.get("subtopic")
-    #initially prompts the LLM for constructive feedback and a score out of 10 based on the users answer
-    initial_prompt = f"""Here's the interview question:\n\n{question}\n\nCandidate's answer:\n\n{answer}\n\n
-    Please provide constructive feedback and a score out of 10.
-    **Don't include phrases like 'I'm happy to help' in your response**"""
-    #chains the prompt with the LLM and string output parser  
-    chain = llm | StrOutputParser()
-    raw_feedback = chain.invoke(initial_prompt)
-    print("initial feedback:", raw_feedback)
-    #prmopts the LLM once more to refine and validate the initial feedback
-    refinement_prompt = f"""
-    Here is the original feedback generated for a candidate's interview response:\n\n{raw_feedback}\n\n
-    Please validate its clarity, relevance, and tone: Based off of this {question} and this {answer}. 
-    Then refine it to be more actionable and structured.
-    Return the result in this format:
-    Score: <number>/10
-    Constructive Feedback:
-    <short paragraph>
-    Reasoning:
-    <optional deeper explanation>"""
-
-    refined_result = llm | StrOutputParser()
-    result = refined_result.invoke(refinement_prompt)
-   
-    #extracts the necessary data
-    score_match = re.search(r"Score:\s*(\d+)", result)
-    score = int(score_match.group(1)) if score_match else None
+    #prompts the LLM for feedback and a score, refining it only when needed
+    usage = track_token_usage()
+    result, score, llm_calls = await evaluate_answer(question, answer, data.get("evaluation_mode"))
+    tokens = usage_columns(usage, llm_calls)
+    #logs sizes and the score rather than the texts, which can be long and personal
+    log_event("check_response", answer_chars=len(answer), feedback_chars=len(result), score=score, llm_calls=llm_calls,
+              **tokens)
     if user_id:
-        #saves the response data into the database
-        response_entry = QuestionResponse(
-            user_id=user_id,
-            job_role=job_role,
-            question_text=question,
-            user_answer=answer,
-            score=score,
-            feedback=result,
-            subtopic = subtopic
-        )
-        db.add(response_entry)
-        db.commit()
-        #saves the job the user is interested in into the database for analytics
-        interest_entry = UserJobInterest(
-            user_id=user_id,
-            job_role=job_role,
-            subtopic = subtopic    
-        )
-        db.add(interest_entry)
-        db.commit()
-    return {"feedback": result}
+        #saves the response data into the database without blocking the event loop
+        with timed_stage("check_response.store"):
+            await run_db(lambda db: save_response(db, user_id, job_role, subtopic, question, answer, score, result, tokens))
+    return {"feedback": result, "llm_calls": llm_calls}
+
+#streaming variant of /check-response that sends feedback tokens as NDJSON while they are generated
+@app.post("/check-response/stream", dependencies=[Depends(rate_limit("check-response"))])
+async def check_response_stream(request: Request, claims=Depends(get_token_claims)):
+    data = await request.json()
+    question = data["question"]
+    answer = data["answer"]
+    user_id = resolve_user_id(claims, data.get("user_id"))
+    job_role = data.get("job_role")
+    subtopic = data.get("subtopic")
+    mode = resolve_evaluation_mode(data.get("evaluation_mode"))
+    check_answer_size(question, answer)
+    first_prompt = "single_pass_feedback" if mode == "single" else "initial_feedback"
+    inputs = grading_inputs(first_prompt, question, answer)
+
+    async def events():
+        usage = track_token_usage()
+        hit, vector = await semantic_cache.match(question, answer)
+        if hit is not None and not hit["audit"]:
+            #a reused evaluation is sent as a single chunk
+            result, score = hit["feedback"], hit["score"]
+            yield ndjson_event(type="token", stage="cached", text=result)
+            if user_id:
+                await run_db(lambda db: save_response(db, user_id, job_role, subtopic, question, answer, score, result,
+                                                      usage_columns(usage, 0)))
+            yield ndjson_event(type="result", score=score, feedback=result, llm_calls=0)
+            return
+        try:
+            #streams the first pass as it is produced
+            first_chain = prompts.chain(first_prompt, llm)
+            parts = []
+            async for chunk in astream_chain(first_chain, inputs):
+                parts.append(chunk)
+                yield ndjson_event(type="token", stage="draft", text=chunk)
+            result = "".join(parts)
+            llm_calls = 1
+            #streams the refined feedback only when the first pass is not already usable
+            if mode == "refine" or not is_well_formed(result):
+                parts = []
+                async for chunk in astream_chain(prompts.chain("feedback_refinement", llm), refinement_inputs(inputs, result)):
+                    parts.append(chunk)
+                    yield ndjson_event(type="token", stage="refined", text=chunk)
+                result = "".join(parts)
+                llm_calls = 2
+        except HTTPException as e:
+            yield ndjson_event(type="error", status_code=e.status_code, detail=e.detail)
+            return
+        score = parse_score(result)
+        if hit is not None:
+            semantic_cache.record_drift(hit["score"], score)
+        await semantic_cache.add(question, vector, result, score)
+        #the response is only stored once the stream has completed
+        if user_id:
+            await run_db(lambda db: save_response(db, user_id, job_role, subtopic, question, answer, score, result,
+                                                  usage_columns(usage, llm_calls)))
+        #sends the parsed score as the final structured event
+        yield ndjson_event(type="result", score=score, feedback=result, llm_calls=llm_calls)
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+#grades a whole question set concurrently and stores every result in a single transaction
+@app.post("/check-responses/batch")
+async def check_responses_batch(request: BatchCheckRequest, http_request: Request, claims=Depends(get_token_claims)):
+    #each answer counts against the same limit as a single /check-response
+    apply_rate_limit(http_request, claims, "check-response", len(request.items))
+    user_id = resolve_user_id(claims, request.user_id)
+    mode = resolve_evaluation_mode(request.evaluation_mode)
+    workers = asyncio.Semaphore(BATCH_MAX_WORKERS)
+
+    async def grade(item):
+        check_answer_size(item.question, item.answer)
+        async with workers:
+            #each answer runs in its own task, so its token count is its own
+            usage = track_token_usage()
+            result, score, llm_calls = await evaluate_answer(item.question, item.answer, mode)
+            return result, score, llm_calls, usage_columns(usage, llm_calls)
+
+    #one failed evaluation does not cancel the rest of the batch
+    outcomes = await asyncio.gather(*(grade(item) for item in request.items), return_exceptions=True)
+    results = []
+    rows = []
+    for index, (item, outcome) in enumerate(zip(request.items, outcomes)):
+        if isinstance(outcome, Exception):
+            detail = outcome.detail if isinstance(outcome, HTTPException) else str(outcome)
+            results.append({"index": index, "error": detail})
+            continue
+        result, score, llm_calls, tokens = outcome
+        results.append({"index": index, "feedback": result, "score": score, "llm_calls": llm_calls})
+        rows.append({
+            "user_id": user_id,
+            "job_role": request.job_role,
+            "question_text": item.question,
+            "user_answer": item.answer,
+            "score": score,
+            "feedback": result,
+            "subtopic": request.subtopic,
+            **tokens
+        })
+    if user_id and rows:
+        #bulk inserts the graded responses and the job interest with one commit
+        def save_batch(db):
+            db.execute(insert(QuestionResponse), rows)
+            record_interest(db, user_id, request.job_role, request.subtopic, count=len(rows))
+            record_responses(db, rows)
+            db.commit()
+        try:
+            await run_db(save_batch)
+        except Exception as e:
+            #the uncommitted transaction is rolled back when the session closes
+            raise HTTPException(status_code=500, detail=f"Could not save responses: {str(e)}")
+    return {"results": results, "llm_calls": sum(r.get("llm_calls", 0) for r in results)}
 
 #registers a new user with a hashed password
 @app.post("/register")
-def register_user(user: UserCreate, db: Session = Depends(get_db)):
-    existing = db.query(User).filter(User.email == user.email).first()
+async def register_user(user: UserCreate):
+    existing = await run_db(lambda db: db.query(User.id).filter(User.email == user.email).first())
     if existing:
         #catches any errors with duplicate emails
         raise HTTPException(status_code=400, detail="Email already registered")
-    #hashes the users password for encryption purposes
-    hashed_pw = bcrypt.hash(user.password)
+    #hashes the users password on the dedicated hashing pool
+    hashed_pw = await hash_password(user.password)
     #stores user data in database
-    new_user = User(email=user.email, 
-                    name=user.name, 
-                    hashed_password=hashed_pw
-                    )
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
-    return {"id": new_user.id, "email": new_user.email, "name": new_user.name}
+    def create_user(db):
+        new_user = User(email=user.email, 
+                        name=user.name, 
+                        hashed_password=hashed_pw
+                        )
+        db.add(new_user)
+        db.commit()
+        db.refresh(new_user)
+        return {"id": new_user.id, "email": new_user.email, "name": new_user.name}
+    return await run_db(create_user)
 
 #authenticates a user
 @app.post("/login")
-def login(user: UserLogin, db: Session = Depends(get_db)):
-    db_user = db.query(User).filter(User.email == user.email).first()
-    if not db_user or not bcrypt.verify(user.password, db_user.hashed_password):
+async def login(user: UserLogin):
+    db_user = await run_db(lambda db: db.query(User.id, User.email, User.name, User.hashed_password)
+                           .filter(User.email == user.email).first())
+    verified, new_hash = await verify_password(user.password, db_user.hashed_password) if db_user else (False, None)
+    if not verified:
         #catches any errors if no user is found or if the password doesnt match
         raise HTTPException(status_code=401, detail="Invalid email or password")
-    return {"message": "Login successful", "id": db_user.id, "email": db_user.email, "name": db_user.name}
+    #upgrades the stored hash when the scheme or its cost settings have changed, and stores a refresh token
+    def finish_login(db):
+        if new_hash:
+            db.query(User).filter(User.id == db_user.id).update({"hashed_password": new_hash})
+        refresh_token = issue_refresh_token(db, db_user.id)
+        db.commit()
+        return refresh_token
+    refresh_token = await run_db(finish_login)
+    return {"message": "Login successful", "id": db_user.id, "email": db_user.email, "name": db_user.name,
+            **token_response(db_user.id, db_user.email, db_user.name, refresh_token)}
+
+#builds the token part of login and refresh responses
+def token_response(user_id, email, name, refresh_token):
+    return {"access_token": create_access_token(user_id, email, name), "token_type": "bearer",
+            "expires_in": ACCESS_TOKEN_TTL_SECONDS, "refresh_token": refresh_token}
+
+#swaps a refresh token for a new access token and refresh token, the old refresh token stops working
+@app.post("/token/refresh")
+async def refresh_access_token(request: RefreshRequest):
+    def rotate(db):
+        user_id = consume_refresh_token(db, request.refresh_token)
+        if user_id is None:
+            return None
+        user = db.query(User.id, User.email, User.name).filter(User.id == user_id).first()
+        refresh_token = issue_refresh_token(db, user_id)
+        db.commit()
+        return user.id, user.email, user.name, refresh_token
+    rotated = await run_db(rotate)
+    if rotated is None:
+        #catches any errors with unknown, expired or already used refresh tokens
+        raise HTTPException(status_code=401, detail="Invalid refresh token")
+    return token_response(*rotated)
+
+#revokes a refresh token
+@app.post("/logout")
+async def logout(request: RefreshRequest):
+    def revoke(db):
+        consume_refresh_token(db, request.refresh_token)
+        db.commit()
+    await run_db(revoke)
+    return {"message": "Logged out"}
 
 #returns user profile with stats like average score, most interested job role, ect.
 @app.get("/user-profile/{user_id}")
-def get_user_profile(user_id: int, db: Session = Depends(get_db)):
-    #fetches user from database
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
-        #catches any errors with the user not existing
-        raise HTTPException(status_code=404, detail="User not found")
-    #retrieves data, counts the number of questions and calculates the average score
-    responses = db.query(QuestionResponse).filter(QuestionResponse.user_id == user_id).all()
-    total_questions = len(responses)
-    average_score = sum(r.score for r in responses if r.score is not None) / total_questions if total_questions else 0
-    #groups scores by subtopics
-    subtopic_scores = defaultdict(list)
-    for r in responses:
-        if r.subtopic and r.score is not None:
-            subtopic_scores[r.subtopic].append(r.score)
+def get_user_profile(user_id: int, db: Session = Depends(get_db), claims=Depends(get_token_claims)):
+    if claims is not None:
+        #a valid token already carries the user's name and email, so no user lookup is needed
+        if int(claims["sub"]) != user_id:
+            raise HTTPException(status_code=403, detail="Not allowed to view this profile")
+        name, email = claims["name"], claims["email"]
+    elif ALLOW_LEGACY_USER_ID:
+        #fetches user from database
+        user = db.query(User).filter(User.id == user_id).first()
+        if not user:
+            #catches any errors with the user not existing
+            raise HTTPException(status_code=404, detail="User not found")
+        name, email = user.name, user.email
+    else:
+        raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+    #reads the running totals kept in the score rollup table instead of scanning every response
+    total_questions, score_sum = (
+        db.query(func.coalesce(func.sum(SubtopicScoreRollup.response_count), 0),
+                 func.coalesce(func.sum(SubtopicScoreRollup.score_sum), 0))
+        .filter(SubtopicScoreRollup.user_id == user_id)
+        .one()
+    )
+    average_score = score_sum / total_questions if total_questions else 0
     #calculates average score per subtopic
-    average_scores_by_subtopic = {
-        subtopic: round(sum(scores) / len(scores), 2)
-        for subtopic, scores in subtopic_scores.items()
-    }
-    #collects and counts all job roles the user is interested in
-    job_roles = [r.job_role for r in responses if r.job_role]
-    most_common_role = max(set(job_roles), key=job_roles.count) if job_roles else None
-    job_role_distribution = dict(Counter(job_roles))
-    return {"name": user.name, "email": user.email, "total_questions": total_questions, "average_score": round(average_score, 2), "most_interested_career": most_common_role, "average_scores_by_subtopic": average_scores_by_subtopic, "job_role_distribution": job_role_distribution }
+    subtopic_rows = (
+        db.query(SubtopicScoreRollup.subtopic,
+                 func.sum(SubtopicScoreRollup.score_sum),
+                 func.sum(SubtopicScoreRollup.scored_count))
+        .filter(SubtopicScoreRollup.user_id == user_id, SubtopicScoreRollup.subtopic != "")
+        .group_by(SubtopicScoreRollup.subtopic)
+        .having(func.sum(SubtopicScoreRollup.scored_count) > 0)
+        .all()
+    )
+    average_scores_by_subtopic = {subtopic: round(total / count, 2) for subtopic, total, count in subtopic_rows}
+    #counts the job roles the user is interested in, most common first
+    role_rows = (
+        db.query(SubtopicScoreRollup.job_role, func.sum(SubtopicScoreRollup.response_count))
+        .filter(SubtopicScoreRollup.user_id == user_id, SubtopicScoreRollup.job_role != "")
+        .group_by(SubtopicScoreRollup.job_role)
+        .order_by(func.sum(SubtopicScoreRollup.response_count).desc())
+        .all()
+    )
+    most_common_role = role_rows[0][0] if role_rows else None
+    job_role_distribution = {job_role: count for job_role, count in role_rows}
+    return {"name": name, "email": email, "total_questions": total_questions, "average_score": round(average_score, 2), "most_interested_career": most_common_role, "average_scores_by_subtopic": average_scores_by_subtopic, "job_role_distribution": job_role_distribution }
 
-#returns job interests with average scores per subtopic.
+#only the user themselves may read their history, no legacy client uses it so a token is always required
+def check_history_access(user_id, claims):
+    if int(claims["sub"]) != user_id:
+        raise HTTPException(status_code=403, detail="Not allowed to view this history")
+
+#returns a page of the user's graded answers, newest first, pass next_before_id back as before_id for the next page,
+#fields picks the columns so list views don't load the long answer and feedback texts
+@app.get("/history/{user_id}")
+def get_history(user_id: int, limit: int = Query(50, ge=1, le=500), before_id: Optional[int] = None,
+                fields: Optional[str] = None, subtopic: Optional[str] = None, job_role: Optional[str] = None,
+                min_score: Optional[int] = None, max_score: Optional[int] = None,
+                db: Session = Depends(get_db), claims=Depends(require_token_claims)):
+    check_history_access(user_id, claims)
+    query = history_query(user_id, parse_fields(fields), subtopic, job_role, min_score, max_score)
+    return history_page(db, query, limit, before_id)
+
+#streams the user's whole history as NDJSON or CSV, oldest first and with every column unless fields is given,
+#memory use stays flat however many rows there are
+@app.get("/history/{user_id}/export")
+def export_history(user_id: int, format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+                   fields: Optional[str] = None, after_id: Optional[int] = None, subtopic: Optional[str] = None,
+                   job_role: Optional[str] = None, min_score: Optional[int] = None, max_score: Optional[int] = None,
+                   claims=Depends(require_token_claims)):
+    check_history_access(user_id, claims)
+    selected = parse_fields(fields, default=HISTORY_FIELDS)
+    query = history_query(user_id, selected, subtopic, job_role, min_score, max_score)
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(export_rows(SessionLocal, query, selected, format, after_id), media_type=media_type,
+                             headers={"Content-Disposition": f'attachment; filename="history-{user_id}.{format}"'})
+
+#returns job interests with average scores per subtopic, read from the score rollup table
 @app.get("/user-job-interests-with-scores")
-def get_user_job_interests_with_scores(db: Session = Depends(get_db)):
-    #fetches the average scores for each user's job role and subtopics
-    results = (
-        db.query(
-            UserJobInterest.user_id,
-            UserJobInterest.job_role,
-            UserJobInterest.subtopic,
-            #calculates average score
-            func.avg(QuestionResponse.score).label("average_score")
-        )
-        #join on both user_id and subtopic to match responses with interests
-        .join(
-            QuestionResponse,
-            (UserJobInterest.user_id == QuestionResponse.user_id) &
-            (UserJobInterest.subtopic == QuestionResponse.subtopic)
-        )
-        #groups results by user, job role and subtopic to compute averages
-        .group_by(UserJobInterest.user_id, UserJobInterest.job_role, UserJobInterest.subtopic)
+def get_user_job_interests_with_scores(user_id: Optional[int] = None, job_role: Optional[str] = None,
+                                       limit: int = Query(100, ge=1, le=1000), offset: int = Query(0, ge=0),
+                                       db: Session = Depends(get_db)):
+    query = db.query(SubtopicScoreRollup).filter(SubtopicScoreRollup.subtopic != "")
+    #filters by user or job role when requested
+    if user_id is not None:
+        query = query.filter(SubtopicScoreRollup.user_id == user_id)
+    if job_role is not None:
+        query = query.filter(SubtopicScoreRollup.job_role == job_role)
+    rows = (
+        query.order_by(SubtopicScoreRollup.user_id, SubtopicScoreRollup.job_role, SubtopicScoreRollup.subtopic)
+        .offset(offset)
+        .limit(limit)
         .all()
     )
-    return [{"user_id": user_id, "job_role": job_role, "subtopic": subtopic, "average_score": round(avg_score, 2) if avg_score is not None else None}
-        for user_id, job_role, subtopic, avg_score in results
+    return [{"user_id": row.user_id, "job_role": row.job_role or None, "subtopic": row.subtopic,
+             "average_score": round(row.score_sum / row.scored_count, 2) if row.scored_count else None,
+             "response_count": row.response_count, "min_score": row.min_score, "max_score": row.max_score,
+             "last_answered_at": row.last_answered_at}
+        for row in rows
     ]
+
+#reports hit/miss counters for the LLM completion cache
+@app.get("/llm-cache/stats")
+def get_llm_cache_stats():
+    return llm_cache.stats()
+
+#reports load, health and circuit breaker state of each Ollama server
+@app.get("/llm-backends")
+def get_llm_backends():
+    return llm_pool.stats()
+
+#reports hit rate and score drift of the semantic evaluation cache
+@app.get("/semantic-cache/stats")
+def get_semantic_cache_stats():
+    return semantic_cache.stats()
+
+#reports the per-user limits, requests rejected by them, and the fair LLM queue
+@app.get("/rate-limit/stats")
+def get_rate_limit_stats():
+    return {**rate_limiter.stats(), "llm_queue": queue_stats()}
+
+#reports queue depth and timings of the password hashing pool
+@app.get("/auth/hash-stats")
+def get_hash_stats():
+    return hash_executor.stats()
+
+#the cache, queue and pool counters kept by other modules, read when /metrics is scraped
+registry.gauge("llm_cache_hits_total", "Completions served from the LLM cache",
+               lambda: llm_cache.stats()["memory_hits"] + llm_cache.stats()["disk_hits"], "counter")
+registry.gauge("llm_cache_misses_total", "Completions the LLM cache didn't have", lambda: llm_cache.stats()["misses"], "counter")
+registry.gauge("llm_cache_hit_ratio", "Share of LLM cache lookups that hit", lambda: llm_cache.stats()["hit_rate"])
+registry.gauge("semantic_cache_lookups_total", "Answers looked up in the semantic cache",
+               lambda: semantic_cache.stats()["lookups"], "counter")
+registry.gauge("semantic_cache_hits_total", "Evaluations reused by the semantic cache",
+               lambda: semantic_cache.stats()["hits"], "counter")
+registry.gauge("semantic_cache_hit_ratio", "Share of semantic cache lookups that hit", lambda: semantic_cache.stats()["hit_rate"])
+registry.gauge("structured_output_repairs_total", "LLM outputs that needed a repair prompt",
+               lambda: structured_stats["repairs"], "counter")
+registry.gauge("structured_output_failures_total", "LLM outputs that stayed invalid after repair",
+               lambda: structured_stats["failures"], "counter")
+registry.gauge("llm_queue_waiting", "Completions waiting for a free concurrency slot", lambda: queue_stats()["waiting"])
+registry.gauge("job_queue_depth", "Background jobs waiting for a worker", lambda: job_queue.stats()["queued"])
+registry.gauge("llm_outstanding_requests", "Completions in flight across all Ollama servers",
+               lambda: sum(backend["outstanding"] for backend in llm_pool.stats()["backends"]))
+registry.gauge("password_hash_queue_depth", "Password hashes waiting for a worker", lambda: hash_executor.stats()["queued"])
+
+#Prometheus scrape endpoint with latency histograms, LLM token counts and timings, database query timings
+#and cache hit rates
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+#background job handlers, run by the job queue workers
+job_queue.register("check-response", grade_and_store, PRIORITY_INTERACTIVE)
+job_queue.register("generate-subtopics", lambda payload: generate_subtopics(SubtopicRequest(**payload)))
+job_queue.register("refine-subtopics", lambda payload: refine_subtopics(RefineRequest(**payload)))
+job_queue.register("generate-questions", lambda payload: generate_questions(QuestionRequest(**payload)))
+job_queue.register("refill-question-bank", refill_question_bank)
+
+#returns the status of a background job
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    job = job_queue.get(job_id)
+    if not job:
+        #catches any errors with the job not existing
+        raise HTTPException(status_code=404, detail="Job not found")
+    job.pop("result")
+    return job
+
+#returns the result of a finished background job, or 202 while it is still pending
+@app.get("/jobs/{job_id}/result")
+def get_job_result(job_id: str):
+    job = job_queue.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] == "failed":
+        raise HTTPException(status_code=500, detail=job["error"])
+    if job["status"] != "succeeded":
+        return JSONResponse(status_code=202, content={"job_id": job_id, "status": job["status"]})
+    return job["result"]
+
+#reports prompt registry load time, model warm-up time and first-request latency
+@app.get("/startup-stats")
+def get_startup_stats():
+    return startup_stats
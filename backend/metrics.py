@@ -0,0 +1,275 @@
+#imports
+import contextvars
+import json
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from langchain_core.callbacks import BaseCallbackHandler
+from sqlalchemy import event
+
+#share of log events that are written, errors are always written
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.1"))
+
+#latency buckets in seconds, from fast database reads up to full LLM generations
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _number(value):
+    return repr(float(value)) if value != float("inf") else "+Inf"
+
+#a metric family with one value per label combination
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    #every value keyed by its comma joined label values, for the JSON stats endpoints
+    def snapshot(self):
+        with self._lock:
+            return {",".join(key): value for key, value in self._values.items()}
+
+    def render(self):
+        with self._lock:
+            return self.header() + [f"{self.name}{_labels(self.label_names, key)} {_number(value)}"
+                                    for key, value in self._values.items()]
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    def count(self, **labels):
+        entry = self._values.get(self._key(labels))
+        return entry[0][-1] if entry else 0
+
+    def render(self):
+        lines = self.header()
+        with self._lock:
+            for key, (counts, total) in self._values.items():
+                for bound, count in zip(self.buckets, counts):
+                    le = 'le="' + _number(bound) + '"'
+                    lines.append(f"{self.name}_bucket{_labels(self.label_names, key, le)} {count}")
+                lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {_number(total)}")
+                lines.append(f"{self.name}_count{_labels(self.label_names, key)} {counts[-1]}")
+        return lines
+
+#holds every metric and gauge callback and renders them in the Prometheus text format
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.gauges = []
+
+    def counter(self, name, help_text, labels=()):
+        metric = Counter(name, help_text, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, help_text, labels, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    #registers a value read from a function at scrape time, such as the counters other modules keep in their stats
+    def gauge(self, name, help_text, read, kind="gauge"):
+        self.gauges.append((name, help_text, read, kind))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        for name, help_text, read, kind in self.gauges:
+            try:
+                value = read()
+            except Exception:
+                continue
+            if value is None:
+                continue
+            lines.extend([f"# HELP {name} {help_text}", f"# TYPE {name} {kind}", f"{name} {_number(value)}"])
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+http_request_duration = registry.histogram(
+    "http_request_duration_seconds", "Time until the response starts, by route", ("method", "route", "status"))
+db_queries_per_request = registry.histogram(
+    "db_queries_per_request", "Database queries run while handling a request", ("route",),
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 250))
+db_time_per_request = registry.histogram(
+    "db_time_per_request_seconds", "Time spent in database queries while handling a request", ("route",))
+db_query_duration = registry.histogram(
+    "db_query_duration_seconds", "Duration of single database queries", ("operation",))
+llm_request_duration = registry.histogram(
+    "llm_request_duration_seconds", "Duration of LLM completions, by prompt", ("prompt", "model"))
+llm_time_to_first_token = registry.histogram(
+    "llm_time_to_first_token_seconds", "Time until the first generated token, by prompt", ("prompt", "model"))
+llm_tokens_per_second = registry.histogram(
+    "llm_tokens_per_second", "Generation speed reported by Ollama", ("prompt", "model"),
+    buckets=(1, 2, 5, 10, 20, 30, 50, 75, 100, 200))
+llm_prompt_tokens = registry.counter("llm_prompt_tokens_total", "Prompt tokens evaluated", ("prompt", "model"))
+llm_completion_tokens = registry.counter("llm_completion_tokens_total", "Tokens generated", ("prompt", "model"))
+llm_errors = registry.counter("llm_errors_total", "LLM completions that failed", ("prompt", "model"))
+llm_queue_wait = registry.histogram(
+    "llm_queue_wait_seconds", "Time completions wait for a free concurrency slot before reaching Ollama")
+stage_duration = registry.histogram(
+    "stage_duration_seconds", "Duration of the steps of multi-step endpoints such as check-response", ("stage",))
+
+#database work of the request being handled, shared with threadpool and run_db calls through the context
+_request_db = contextvars.ContextVar("request_db", default=None)
+
+@contextmanager
+def track_request_db():
+    stats = {"queries": 0, "seconds": 0.0}
+    token = _request_db.set(stats)
+    try:
+        yield stats
+    finally:
+        _request_db.reset(token)
+
+#token counts of the completions run for the current request, filled in by the LLM callback
+_request_tokens = contextvars.ContextVar("request_tokens", default=None)
+
+#starts counting tokens for the rest of the current task, returns the totals, which fill in as completions finish
+def track_token_usage():
+    usage = {"prompt_tokens": 0, "completion_tokens": 0, "completions": 0}
+    _request_tokens.set(usage)
+    return usage
+
+#the token columns stored with a graded answer, zero when no LLM call was made and None when the LLM didn't report
+def usage_columns(usage, llm_calls):
+    if not llm_calls:
+        return {"prompt_tokens": 0, "completion_tokens": 0}
+    if not usage["completions"]:
+        return {"prompt_tokens": None, "completion_tokens": None}
+    return {"prompt_tokens": usage["prompt_tokens"], "completion_tokens": usage["completion_tokens"]}
+
+@contextmanager
+def timed_stage(stage):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_duration.observe(time.perf_counter() - started, stage=stage)
+
+#times every query on an engine and adds it to the current request's totals
+def instrument_engine(engine):
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        db_query_duration.observe(elapsed, operation=statement.lstrip().split(" ", 1)[0].upper())
+        stats = _request_db.get()
+        if stats is not None:
+            stats["queries"] += 1
+            stats["seconds"] += elapsed
+
+#langchain callback recording duration, time to first token and Ollama's token counts for every completion
+class LLMMetricsHandler(BaseCallbackHandler):
+    def __init__(self):
+        self._runs = {}
+        self._lock = threading.Lock()
+
+    def on_llm_start(self, serialized, prompts, *, run_id, metadata=None, invocation_params=None, **kwargs):
+        invocation_params = invocation_params or {}
+        labels = {"prompt": (metadata or {}).get("prompt", "unknown"),
+                  "model": invocation_params.get("model") or (serialized or {}).get("kwargs", {}).get("model", "")}
+        with self._lock:
+            #the request's usage totals are picked up here, since the end callback may run in another thread
+            self._runs[run_id] = {"labels": labels, "started": time.perf_counter(), "first_token": None,
+                                  "usage": _request_tokens.get()}
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        run = self._runs.get(run_id)
+        if run is not None and run["first_token"] is None and token:
+            run["first_token"] = time.perf_counter()
+            llm_time_to_first_token.observe(run["first_token"] - run["started"], **run["labels"])
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        labels = run["labels"]
+        llm_request_duration.observe(time.perf_counter() - run["started"], **labels)
+        usage = run["usage"]
+        for generations in response.generations:
+            for generation in generations:
+                info = generation.generation_info or {}
+                llm_prompt_tokens.inc(info.get("prompt_eval_count") or 0, **labels)
+                llm_completion_tokens.inc(info.get("eval_count") or 0, **labels)
+                if usage is not None and "eval_count" in info:
+                    usage["prompt_tokens"] += info.get("prompt_eval_count") or 0
+                    usage["completion_tokens"] += info["eval_count"]
+                    usage["completions"] += 1
+                if info.get("eval_count") and info.get("eval_duration"):
+                    llm_tokens_per_second.observe(info["eval_count"] / (info["eval_duration"] / 1e9), **labels)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+        if run is not None:
+            llm_errors.inc(**run["labels"])
+
+llm_metrics = LLMMetricsHandler()
+
+#the structured log lines go to stderr unless the host application configures the "interview" logger itself
+logger = logging.getLogger("interview")
+if not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+#writes one JSON log line for a sampled share of events, so hot paths don't flood the logs
+def log_event(event_name, sample_rate=None, level=logging.INFO, **fields):
+    rate = LOG_SAMPLE_RATE if sample_rate is None else sample_rate
+    if level < logging.ERROR and random.random() >= rate:
+        return
+    logger.log(level, json.dumps({"event": event_name, **fields}, default=str))
@@ -0,0 +1,51 @@
+#imports
+from sqlalchemy import inspect, text
+from sqlalchemy.orm import Session
+from database import Base
+from models import QuestionResponse, SubtopicScoreRollup, UserJobInterest
+from rollups import backfill
+
+#collapses the old one-row-per-answer user_job_interests table into one counted row per key
+def dedupe_user_job_interests(engine):
+    columns = {column["name"] for column in inspect(engine).get_columns("user_job_interests")}
+    if "interaction_count" in columns:
+        return False
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE user_job_interests RENAME TO user_job_interests_old"))
+        #the old index keeps its name after the rename, so it is dropped before the new table reuses it
+        conn.execute(text("DROP INDEX IF EXISTS ix_user_job_interests_id"))
+        UserJobInterest.__table__.create(bind=conn)
+        conn.execute(text(
+            "INSERT INTO user_job_interests (user_id, job_role, subtopic, interaction_count, last_seen_at) "
+            "SELECT user_id, COALESCE(job_role, ''), COALESCE(subtopic, ''), COUNT(*), NULL "
+            "FROM user_job_interests_old GROUP BY user_id, COALESCE(job_role, ''), COALESCE(subtopic, '')"
+        ))
+        conn.execute(text("DROP TABLE user_job_interests_old"))
+    return True
+
+#adds columns that were added to models of tables which already existed, new columns have to be nullable
+def add_missing_columns(engine):
+    added = []
+    for table in Base.metadata.sorted_tables:
+        existing = {column["name"] for column in inspect(engine).get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            with engine.begin() as conn:
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} "
+                                  f"{column.type.compile(dialect=engine.dialect)}"))
+            added.append(f"{table.name}.{column.name}")
+    return added
+
+#brings an existing database up to date with the models, since create_all only creates missing tables
+def run_migrations(engine):
+    dedupe_user_job_interests(engine)
+    add_missing_columns(engine)
+    #creates indexes that were added to tables which already existed
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+    #fills the score rollups once for databases that already had responses before the table existed
+    with Session(engine) as db:
+        if db.query(SubtopicScoreRollup.id).first() is None and db.query(QuestionResponse.id).first() is not None:
+            backfill(db)
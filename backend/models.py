@@ -1,7 +1,8 @@
 #imports
 from sqlalchemy import Column, Integer, String
 from database import Base
-from sqlalchemy import ForeignKey, Boolean, Text
+from sqlalchemy import ForeignKey, Boolean, Text, DateTime, Index, UniqueConstraint
+from datetime import datetime
 from sqlalchemy.orm import relationship
 
 #model representing registered users
@@ -16,6 +17,13 @@ class User(Base):
 #model representing the users responses to interview questions
 class QuestionResponse(Base):
     __tablename__ = "question_responses"
+    #composite indexes used by the per-user profile aggregates, score is included so they cover the query,
+    #and one for paging through a user's history by id
+    __table_args__ = (
+        Index("ix_question_responses_user_subtopic", "user_id", "subtopic", "score"),
+        Index("ix_question_responses_user_job_role", "user_id", "job_role"),
+        Index("ix_question_responses_user_id_id", "user_id", "id"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     job_role = Column(String)
@@ -26,14 +34,87 @@ class QuestionResponse(Base):
     user = relationship("User", back_populates="responses")
     User.responses = relationship("QuestionResponse", back_populates="user")
     subtopic = Column(String)
+    #tokens the grading used as reported by Ollama, 0 for reused evaluations and empty when not reported
+    prompt_tokens = Column(Integer)
+    completion_tokens = Column(Integer)
 
-#model representing tracking of the users job interests 
+#model representing tracking of the users job interests, one row per user, job role and subtopic
 class UserJobInterest(Base):
     __tablename__ = "user_job_interests"
+    __table_args__ = (
+        UniqueConstraint("user_id", "job_role", "subtopic", name="uq_user_job_interests_key"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
-    job_role = Column(String)
+    #missing job roles and subtopics are stored as empty strings so the unique key applies to them
+    job_role = Column(String, nullable=False, default="")
     user = relationship("User", back_populates="job_interests")
-    subtopic = Column(String)
+    subtopic = Column(String, nullable=False, default="")
     User.job_interests = relationship("UserJobInterest", back_populates="user")
+    interaction_count = Column(Integer, nullable=False, default=1)
+    last_seen_at = Column(DateTime, default=datetime.utcnow)
+
+#model representing long-running generations queued for background workers
+class Job(Base):
+    __tablename__ = "jobs"
+    id = Column(String, primary_key=True, index=True)
+    kind = Column(String)
+    status = Column(String, index=True)
+    priority = Column(Integer)
+    payload = Column(Text)
+    result = Column(Text)
+    error = Column(Text)
+    #the worker process running the job, and until when its claim holds unless renewed
+    owner = Column(String)
+    lease_until = Column(DateTime)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+#model holding running score totals per user, job role and subtopic, updated with every response
+class SubtopicScoreRollup(Base):
+    __tablename__ = "subtopic_score_rollups"
+    __table_args__ = (
+        UniqueConstraint("user_id", "job_role", "subtopic", name="uq_subtopic_score_rollups_key"),
+        Index("ix_subtopic_score_rollups_job_role", "job_role"),
+    )
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    #missing job roles and subtopics are stored as empty strings so the unique key applies to them
+    job_role = Column(String, nullable=False, default="")
+    subtopic = Column(String, nullable=False, default="")
+    response_count = Column(Integer, nullable=False, default=0)
+    scored_count = Column(Integer, nullable=False, default=0)
+    score_sum = Column(Integer, nullable=False, default=0)
+    min_score = Column(Integer)
+    max_score = Column(Integer)
+    last_answered_at = Column(DateTime)
+
+#model representing refresh tokens issued at login, stored as hashes
+class RefreshToken(Base):
+    __tablename__ = "refresh_tokens"
+    id = Column(Integer, primary_key=True, index=True)
+    token_hash = Column(String, unique=True, index=True, nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+    revoked_at = Column(DateTime)
+    created_at = Column(DateTime, default=datetime.utcnow)
 
+#model holding pre-generated interview questions, one row per question, served in rotation
+class BankQuestion(Base):
+    __tablename__ = "question_bank"
+    __table_args__ = (
+        UniqueConstraint("job_role", "experience_level", "subtopic", "question_type", "question_text",
+                         name="uq_question_bank_question"),
+        #least served questions for a key come first, so serving a set is a single index range scan
+        Index("ix_question_bank_key", "job_role", "experience_level", "subtopic", "question_type", "times_served"),
+    )
+    id = Column(Integer, primary_key=True, index=True)
+    #key columns are stored normalised, see question_bank.bank_key
+    job_role = Column(String, nullable=False)
+    experience_level = Column(String, nullable=False)
+    subtopic = Column(String, nullable=False)
+    question_type = Column(String, nullable=False)
+    question_text = Column(Text, nullable=False)
+    times_served = Column(Integer, nullable=False, default=0)
+    last_served_at = Column(DateTime)
+    created_at = Column(DateTime, default=datetime.utcnow)
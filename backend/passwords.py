@@ -0,0 +1,106 @@
+#imports
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import HTTPException
+from passlib.context import CryptContext
+
+#the first scheme hashes new passwords, the others are still accepted and upgraded on login
+PASSWORD_SCHEMES = [s.strip() for s in os.getenv("PASSWORD_SCHEMES", "bcrypt,argon2").split(",") if s.strip()]
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+ARGON2_TIME_COST = int(os.getenv("ARGON2_TIME_COST", "3"))
+ARGON2_MEMORY_COST = int(os.getenv("ARGON2_MEMORY_COST", "65536"))
+ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", "4"))
+#hashing runs on its own small pool so a login burst can't starve the threadpool used by sync endpoints
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", "2"))
+#hash requests waiting beyond this limit are rejected with a 503
+HASH_QUEUE_LIMIT = int(os.getenv("HASH_QUEUE_LIMIT", "64"))
+
+#builds the passlib context, min_rounds makes hashes with an older, lower cost count as outdated
+def build_context(schemes=PASSWORD_SCHEMES):
+    return CryptContext(
+        schemes=schemes,
+        deprecated="auto",
+        bcrypt__default_rounds=BCRYPT_ROUNDS,
+        bcrypt__min_rounds=BCRYPT_ROUNDS,
+        argon2__time_cost=ARGON2_TIME_COST,
+        argon2__memory_cost=ARGON2_MEMORY_COST,
+        argon2__parallelism=ARGON2_PARALLELISM,
+    )
+
+pwd_context = build_context()
+
+#size-limited executor that keeps queue depth and wait time metrics
+class HashExecutor:
+    def __init__(self, workers=HASH_WORKERS, queue_limit=HASH_QUEUE_LIMIT):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.completed = 0
+        self.rejected = 0
+        self.running = 0
+        self.max_queued = 0
+        self.total_wait = 0.0
+        self.total_run = 0.0
+
+    @property
+    def queued(self):
+        return self.submitted - self.completed - self.running
+
+    async def run(self, fn, *args):
+        with self._lock:
+            if self.queued >= self.queue_limit:
+                self.rejected += 1
+                #gives an error message so clients back off during a login storm
+                raise HTTPException(status_code=503, detail="Too many sign-in attempts in progress, try again shortly.",
+                                    headers={"Retry-After": "1"})
+            self.submitted += 1
+            self.max_queued = max(self.max_queued, self.queued)
+        submitted_at = time.perf_counter()
+
+        def task():
+            started_at = time.perf_counter()
+            with self._lock:
+                self.running += 1
+                self.total_wait += started_at - submitted_at
+            try:
+                return fn(*args)
+            finally:
+                with self._lock:
+                    self.running -= 1
+                    self.completed += 1
+                    self.total_run += time.perf_counter() - started_at
+
+        return await asyncio.get_running_loop().run_in_executor(self._executor, task)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "running": self.running,
+                "queued": self.queued,
+                "max_queued": self.max_queued,
+                "average_wait_ms": round(self.total_wait / self.completed * 1000, 2) if self.completed else 0.0,
+                "average_hash_ms": round(self.total_run / self.completed * 1000, 2) if self.completed else 0.0,
+            }
+
+hash_executor = HashExecutor()
+
+#hashes a new password with the primary scheme
+async def hash_password(password):
+    return await hash_executor.run(pwd_context.hash, password)
+
+#checks a password, returning whether it matched and a new hash when the stored one is outdated
+async def verify_password(password, hashed_password):
+    try:
+        return await hash_executor.run(pwd_context.verify_and_update, password, hashed_password)
+    except ValueError:
+        #treats hashes passlib can't identify as a failed match
+        return False, None
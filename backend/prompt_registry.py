@@ -0,0 +1,84 @@
+#imports
+import json
+import os
+from langchain_core.language_models import BaseLanguageModel
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import PromptTemplate
+
+#prompts.json at the repository root is the single source for every prompt
+PROMPTS_PATH = os.getenv("PROMPTS_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "prompts.json"))
+#per-prompt model overrides such as "categorization=llama3.2:1b,validation=llama3.2:1b"
+LLM_TASK_MODELS = os.getenv("LLM_TASK_MODELS", "")
+#upper bound on every prompt's num_predict, 0 keeps the values in prompts.json
+LLM_MAX_NUM_PREDICT = int(os.getenv("LLM_MAX_NUM_PREDICT", "0"))
+
+def parse_task_models(value):
+    return dict(item.strip().split("=", 1) for item in value.split(",") if "=" in item)
+
+#loads the prompt templates once and keeps a pre-built chain per prompt
+class PromptRegistry:
+    def __init__(self, path=PROMPTS_PATH, task_models=LLM_TASK_MODELS, max_num_predict=LLM_MAX_NUM_PREDICT):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        self.version = data["version"]
+        #model name, server and keep_alive shared by all prompts
+        self.llm_settings = data.get("model", {})
+        self.templates = {}
+        self.params = {}
+        #prompts without a model of their own run on the default model
+        self.task_models = {}
+        for name, spec in data["prompts"].items():
+            self.templates[name] = PromptTemplate.from_template(spec["template"])
+            self.params[name] = dict(spec.get("params", {}))
+            if max_num_predict:
+                self.params[name]["num_predict"] = min(self.params[name].get("num_predict", max_num_predict), max_num_predict)
+            if spec.get("model"):
+                self.task_models[name] = spec["model"]
+        self.task_models.update(parse_task_models(task_models))
+        self._llm = None
+        self._models = {}
+        self._chains = {}
+        self._text_chains = {}
+
+    #binds the per-prompt model parameters, such as num_predict and temperature, as Ollama options,
+    #and the prompt's own model when it is routed to one
+    def _bind(self, llm, params, model=None):
+        if not (params or model) or not isinstance(llm, BaseLanguageModel):
+            return llm
+        params = dict(params)
+        output_format = params.pop("format", None)
+        kwargs = {"options": params} if params else {}
+        if output_format:
+            kwargs["format"] = output_format
+        if model:
+            kwargs["model"] = model
+        return llm.bind(**kwargs)
+
+    #builds the runnables for every prompt, rebuilding them only when a different LLM is passed in,
+    #each model carries its prompt name so metrics can be broken down by prompt
+    def build(self, llm):
+        if llm is self._llm:
+            return
+        self._models = {name: self._bind(llm, params, self.task_models.get(name)).with_config(metadata={"prompt": name})
+                        for name, params in self.params.items()}
+        self._chains = {name: self.templates[name] | self._models[name] | StrOutputParser() for name in self.templates}
+        self._text_chains = {name: self._models[name] | StrOutputParser() for name in self.templates}
+        self._llm = llm
+
+    def template(self, name):
+        return self.templates[name]
+
+    #the LLM with this prompt's parameters applied
+    def model(self, name, llm):
+        self.build(llm)
+        return self._models[name]
+
+    #prompt | LLM | string parser for this prompt
+    def chain(self, name, llm):
+        self.build(llm)
+        return self._chains[name]
+
+    #LLM with this prompt's parameters applied, followed by a string parser, for already rendered prompts
+    def text_chain(self, name, llm):
+        self.build(llm)
+        return self._text_chains[name]
@@ -0,0 +1,135 @@
+#imports
+import argparse
+import asyncio
+import os
+import re
+from datetime import datetime
+from sqlalchemy import func
+from database import run_db, upsert_insert
+from llm_service import ainvoke_chain
+from models import BankQuestion
+
+#questions served per request, matching the 7 the questions prompt asks for
+QUESTIONS_PER_SET = 7
+#a key with fewer questions than this is topped up in the background
+QUESTION_BANK_TARGET = int(os.getenv("QUESTION_BANK_TARGET", "28"))
+
+QUESTION_TYPES = ("technical", "behavioral")
+
+#normalises the lookup key so "Software Engineer" and " software engineer" share a bank
+def bank_key(job_role, experience_level, subtopic, question_type):
+    normalise = lambda value: " ".join(str(value).split()).lower()
+    return (normalise(job_role), normalise(experience_level), normalise(subtopic), normalise(question_type))
+
+def _filter(query, key):
+    job_role, experience_level, subtopic, question_type = key
+    return query.filter(BankQuestion.job_role == job_role, BankQuestion.experience_level == experience_level,
+                        BankQuestion.subtopic == subtopic, BankQuestion.question_type == question_type)
+
+_NUMBERED = re.compile(r"^\s*(?:\d+\s*[.)]|[-*•])\s*(.+)$")
+
+#splits the LLM's numbered list into individual questions, ignoring any introduction before the first item
+def parse_questions(text):
+    questions = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        match = _NUMBERED.match(line)
+        if match:
+            questions.append(match.group(1).strip().strip("*").strip())
+        elif questions:
+            #wrapped lines belong to the previous question
+            questions[-1] = f"{questions[-1]} {line}"
+    return [question for question in questions if question]
+
+#formats questions as the numbered list the endpoint has always returned
+def format_questions(questions):
+    return "\n".join(f"{number}. {question}" for number, question in enumerate(questions, 1))
+
+#stores new questions for a key, skipping ones the bank already has, returns how many were added,
+#questions that were just shown to a user count as served once
+def add_questions(db, key, questions, served=False):
+    job_role, experience_level, subtopic, question_type = key
+    rows = [{"job_role": job_role, "experience_level": experience_level, "subtopic": subtopic,
+             "question_type": question_type, "question_text": question, "times_served": int(served),
+             "created_at": datetime.utcnow()} for question in dict.fromkeys(questions)]
+    if not rows:
+        return 0
+    before = stock(db, key)
+    db.execute(upsert_insert(db, BankQuestion).values(rows).on_conflict_do_nothing(
+        index_elements=["job_role", "experience_level", "subtopic", "question_type", "question_text"]))
+    db.commit()
+    return stock(db, key) - before
+
+def stock(db, key):
+    return _filter(db.query(func.count(BankQuestion.id)), key).scalar()
+
+#picks the least served questions for a key, random among equally served ones, and marks them served,
+#returns None when the bank can't fill a whole set
+def take_questions(db, key, count=QUESTIONS_PER_SET):
+    rows = _filter(db.query(BankQuestion.id, BankQuestion.question_text), key) \
+        .order_by(BankQuestion.times_served, func.random()).limit(count).all()
+    if len(rows) < count:
+        return None
+    db.query(BankQuestion).filter(BankQuestion.id.in_([row.id for row in rows])).update(
+        {"times_served": BankQuestion.times_served + 1, "last_served_at": datetime.utcnow()},
+        synchronize_session=False)
+    db.commit()
+    return [row.question_text for row in rows]
+
+#asks the LLM for a fresh set of questions, bypassing the completion cache so each batch is new
+async def generate_batch(prompts, llm, inputs):
+    response = await ainvoke_chain(prompts.chain("questions", llm), inputs)
+    return response, parse_questions(response)
+
+#tops a key up to the target stock, stopping early when the LLM only repeats questions the bank has
+async def refill(prompts, llm, inputs, target=QUESTION_BANK_TARGET):
+    key = bank_key(inputs["job_role"], inputs["experience_level"], inputs["subtopic"], inputs["question_type"])
+    added = 0
+    while await run_db(lambda db: stock(db, key)) < target:
+        _, questions = await generate_batch(prompts, llm, inputs)
+        new = await run_db(lambda db: add_questions(db, key, questions))
+        if not new:
+            break
+        added += new
+    return {"added": added, "stock": await run_db(lambda db: stock(db, key))}
+
+#pre-seeds the bank for popular roles, e.g.
+#python question_bank.py seed --job-role "Software Engineer" --experience-level Junior --experience-level Senior
+async def seed(job_roles, experience_levels, subtopics, question_types, target):
+    from llm_pool import pool_from_settings
+    from prompt_registry import PromptRegistry
+    from structured_output import SubtopicsOutput, generate_structured
+    prompts = PromptRegistry()
+    llm = pool_from_settings(prompts.llm_settings)
+    for job_role in job_roles:
+        for experience_level in experience_levels:
+            role_subtopics = subtopics
+            if not role_subtopics:
+                #uses the same subtopics users would get when none are given
+                parsed, _ = await generate_structured(prompts, "subtopics", llm, {
+                    "job_role": job_role, "experience_level": experience_level}, SubtopicsOutput)
+                role_subtopics = parsed["subtopics"]
+            for subtopic in role_subtopics:
+                for question_type in question_types:
+                    result = await refill(prompts, llm, {"job_role": job_role, "experience_level": experience_level,
+                                                         "subtopic": subtopic, "question_type": question_type}, target)
+                    print(f"{job_role} / {experience_level} / {subtopic} / {question_type}: "
+                          f"+{result['added']} ({result['stock']} in bank)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain the interview question bank")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    seed_parser = subparsers.add_parser("seed", help="generate questions ahead of time with the LLM")
+    seed_parser.add_argument("--job-role", action="append", required=True)
+    seed_parser.add_argument("--experience-level", action="append", required=True)
+    seed_parser.add_argument("--subtopic", action="append", default=[],
+                             help="defaults to the subtopics the LLM suggests for each role")
+    seed_parser.add_argument("--question-type", action="append", choices=QUESTION_TYPES, default=[])
+    seed_parser.add_argument("--target", type=int, default=QUESTION_BANK_TARGET)
+    args = parser.parse_args()
+    from database import Base, engine
+    Base.metadata.create_all(bind=engine)
+    asyncio.run(seed(args.job_role, args.experience_level, args.subtopic,
+                     args.question_type or list(QUESTION_TYPES), args.target))
@@ -0,0 +1,133 @@
+#imports
+import math
+import os
+import sqlite3
+import threading
+import time
+from fastapi import Depends, HTTPException, Request
+from llm_service import llm_client
+from metrics import registry
+from tokens import get_token_claims
+
+#set to 0 to turn the per-user limits off, requests are still queued fairly
+RATE_LIMIT = os.getenv("RATE_LIMIT", "1") == "1"
+#sustained LLM requests per minute each user (or IP, when signed out) may make to each route
+RATE_LIMIT_PER_MINUTE = float(os.getenv("RATE_LIMIT_PER_MINUTE", "20"))
+#requests a user may make back to back before the per-minute rate applies
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "10"))
+#SQLite file holding the buckets so every uvicorn worker enforces the same limit, empty keeps them in memory
+RATE_LIMIT_DB = os.getenv("RATE_LIMIT_DB", "")
+
+rate_limited = registry.counter("rate_limited_total", "LLM requests rejected with a 429 by the per-user limit", ("route",))
+
+#refills a token bucket for the time since its last update and takes cost tokens from it when it has enough,
+#returns the new token count and how many seconds until the request would be allowed (0 when it is)
+def take_tokens(tokens, updated_at, now, rate, burst, cost):
+    tokens = min(burst, tokens + (now - updated_at) * rate)
+    if tokens >= cost:
+        return tokens - cost, 0.0
+    return tokens, (cost - tokens) / rate
+
+#buckets of one process
+class MemoryBucketStore:
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._last_prune = time.monotonic()
+
+    def take(self, key, rate, burst, cost):
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (burst, now))
+            tokens, retry_after = take_tokens(tokens, updated_at, now, rate, burst, cost)
+            self._buckets[key] = (tokens, now)
+            #forgets buckets that have refilled completely, they behave the same as new ones
+            if now - self._last_prune > 60:
+                self._buckets = {k: v for k, v in self._buckets.items() if v[0] + (now - v[1]) * rate < burst}
+                self._last_prune = now
+            return retry_after
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+#buckets in a SQLite file shared by every worker process, each update runs in its own write transaction
+class SQLiteBucketStore:
+    def __init__(self, db_path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_buckets ("
+            "key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+
+    def take(self, key, rate, burst, cost):
+        #wall clock time, since monotonic clocks aren't shared between processes
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT tokens, updated_at FROM rate_buckets WHERE key = ?", (key,)).fetchone()
+                tokens, updated_at = row if row is not None else (burst, now)
+                tokens, retry_after = take_tokens(tokens, updated_at, now, rate, burst, cost)
+                self._conn.execute("INSERT OR REPLACE INTO rate_buckets (key, tokens, updated_at) VALUES (?, ?, ?)",
+                                   (key, tokens, now))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            return retry_after
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM rate_buckets")
+
+#token bucket limit per client and route
+class RateLimiter:
+    def __init__(self, store=None, per_minute=RATE_LIMIT_PER_MINUTE, burst=RATE_LIMIT_BURST, enabled=RATE_LIMIT):
+        self.store = store if store is not None else (SQLiteBucketStore(RATE_LIMIT_DB) if RATE_LIMIT_DB else MemoryBucketStore())
+        self.rate = per_minute / 60
+        self.burst = burst
+        self.enabled = enabled
+
+    #raises a 429 with Retry-After when the client has used up its requests for the route
+    def check(self, route, client, cost=1):
+        if not self.enabled:
+            return
+        #a request costing more than the burst could never pass, retrying wouldn't help so it gets a 413
+        if cost > self.burst:
+            rate_limited.inc(route=route)
+            raise HTTPException(status_code=413, detail=f"At most {int(self.burst)} answers can be graded in one "
+                                                        f"request, split the batch.")
+        retry_after = self.store.take(f"{route}:{client}", self.rate, self.burst, cost)
+        if retry_after > 0:
+            rate_limited.inc(route=route)
+            raise HTTPException(status_code=429, detail="Too many requests, try again later.",
+                                headers={"Retry-After": str(math.ceil(retry_after))})
+
+    def stats(self):
+        return {"enabled": self.enabled, "per_minute": round(self.rate * 60, 2), "burst": self.burst,
+                "store": type(self.store).__name__, "rejected": rate_limited.snapshot()}
+
+rate_limiter = RateLimiter()
+
+#the signed in user, or the client's IP address for requests without a token
+def client_identity(request, claims):
+    if claims is not None:
+        return f"user:{claims['sub']}"
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+#applies the route's limit to the request's client and tags the request with the client,
+#so the LLM queue can take turns between clients
+def apply_rate_limit(request, claims, route, cost=1):
+    client = client_identity(request, claims)
+    llm_client.set(client)
+    rate_limiter.check(route, client, cost)
+    return client
+
+#dependency for LLM-backed routes
+def rate_limit(route):
+    async def check(request: Request, claims=Depends(get_token_claims)):
+        return apply_rate_limit(request, claims, route)
+    return check
@@ -0,0 +1,100 @@
+#imports
+import argparse
+from datetime import datetime
+from sqlalchemy import case, func, insert
+from database import SessionLocal, upsert_insert
+from models import QuestionResponse, SubtopicScoreRollup, UserJobInterest
+
+#adds freshly graded responses to the per-user/job role/subtopic totals, within the caller's transaction
+def record_responses(db, rows):
+    now = datetime.utcnow()
+    totals = {}
+    #combines rows that share a key so each key is written once
+    for row in rows:
+        key = (row["user_id"], row.get("job_role") or "", row.get("subtopic") or "")
+        score = row.get("score")
+        entry = totals.setdefault(key, {"response_count": 0, "scored_count": 0, "score_sum": 0,
+                                        "min_score": None, "max_score": None})
+        entry["response_count"] += 1
+        if score is not None:
+            entry["scored_count"] += 1
+            entry["score_sum"] += score
+            entry["min_score"] = score if entry["min_score"] is None else min(entry["min_score"], score)
+            entry["max_score"] = score if entry["max_score"] is None else max(entry["max_score"], score)
+    table = SubtopicScoreRollup.__table__
+    for (user_id, job_role, subtopic), entry in totals.items():
+        stmt = upsert_insert(db, SubtopicScoreRollup).values(
+            user_id=user_id, job_role=job_role, subtopic=subtopic, last_answered_at=now, **entry
+        )
+        new = stmt.excluded
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["user_id", "job_role", "subtopic"],
+            set_={
+                "response_count": table.c.response_count + new.response_count,
+                "scored_count": table.c.scored_count + new.scored_count,
+                "score_sum": table.c.score_sum + new.score_sum,
+                #comparisons with NULL are false, so a missing bound is always replaced and a missing score never is
+                "min_score": case((table.c.min_score.is_(None), new.min_score),
+                                  (new.min_score < table.c.min_score, new.min_score),
+                                  else_=table.c.min_score),
+                "max_score": case((table.c.max_score.is_(None), new.max_score),
+                                  (new.max_score > table.c.max_score, new.max_score),
+                                  else_=table.c.max_score),
+                "last_answered_at": new.last_answered_at,
+            },
+        )
+        db.execute(stmt)
+
+#counts interactions with a job role and subtopic, keeping a single row per user, job role and subtopic
+def record_interest(db, user_id, job_role, subtopic, count=1):
+    stmt = upsert_insert(db, UserJobInterest).values(
+        user_id=user_id, job_role=job_role or "", subtopic=subtopic or "",
+        interaction_count=count, last_seen_at=datetime.utcnow()
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["user_id", "job_role", "subtopic"],
+        set_={
+            "interaction_count": UserJobInterest.__table__.c.interaction_count + stmt.excluded.interaction_count,
+            "last_seen_at": stmt.excluded.last_seen_at,
+        },
+    )
+    db.execute(stmt)
+
+#rebuilds the totals from the question_responses table
+def backfill(db):
+    db.query(SubtopicScoreRollup).delete()
+    job_role = func.coalesce(QuestionResponse.job_role, "")
+    subtopic = func.coalesce(QuestionResponse.subtopic, "")
+    grouped = (
+        db.query(
+            QuestionResponse.user_id,
+            job_role,
+            subtopic,
+            func.count(QuestionResponse.id),
+            func.count(QuestionResponse.score),
+            func.coalesce(func.sum(QuestionResponse.score), 0),
+            func.min(QuestionResponse.score),
+            func.max(QuestionResponse.score),
+        )
+        .filter(QuestionResponse.user_id.isnot(None))
+        .group_by(QuestionResponse.user_id, job_role, subtopic)
+    )
+    db.execute(insert(SubtopicScoreRollup).from_select(
+        ["user_id", "job_role", "subtopic", "response_count", "scored_count", "score_sum", "min_score", "max_score"],
+        grouped.statement,
+    ))
+    db.commit()
+    return db.query(SubtopicScoreRollup).count()
+
+#one-shot backfill for existing databases: python rollups.py backfill
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain the subtopic score rollup table")
+    parser.add_argument("command", choices=["backfill"])
+    parser.parse_args()
+    from database import Base, engine
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        print(f"Rebuilt {backfill(db)} rollup rows")
+    finally:
+        db.close()
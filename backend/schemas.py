@@ -11,3 +11,7 @@ class UserCreate(BaseModel):
 class UserLogin(BaseModel):
     email: str
     password: str
+
+#schema for refresh and logout requests
+class RefreshRequest(BaseModel):
+    refresh_token: str
@@ -0,0 +1,228 @@
+#imports
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import tempfile
+import threading
+from metrics import log_event
+
+#numpy is optional, without it the semantic cache stays off
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+#set to 1 to reuse evaluations of near-identical answers to the same question
+SEMANTIC_CACHE = os.getenv("SEMANTIC_CACHE", "0") == "1"
+#cosine similarity above which a previous evaluation is reused
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+#one index file per question is kept here, empty keeps the indexes in memory only
+SEMANTIC_CACHE_DIR = os.getenv("SEMANTIC_CACHE_DIR", "./semantic_cache")
+#"hashing" works offline without a model, "ollama:<model>" uses a local embedding model such as nomic-embed-text
+SEMANTIC_CACHE_EMBEDDER = os.getenv("SEMANTIC_CACHE_EMBEDDER", "hashing")
+#answers kept per question, the oldest are dropped first
+SEMANTIC_CACHE_MAX_PER_QUESTION = int(os.getenv("SEMANTIC_CACHE_MAX_PER_QUESTION", "500"))
+#share of hits that are graded again anyway to measure how far reused scores drift from fresh ones
+SEMANTIC_CACHE_AUDIT_RATE = float(os.getenv("SEMANTIC_CACHE_AUDIT_RATE", "0.05"))
+#a question's index file is rewritten once this many answers were added to it, and for every question on shutdown
+SEMANTIC_CACHE_SAVE_EVERY = int(os.getenv("SEMANTIC_CACHE_SAVE_EVERY", "20"))
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+#deterministic bag of words and word pairs embedding using the hashing trick, no model needed
+class HashingEmbedder:
+    def __init__(self, dimensions=512):
+        self.dimensions = dimensions
+        self.name = f"hashing-{dimensions}"
+
+    def embed(self, text):
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        words = _WORD.findall(text.lower())
+        for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+            digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+            index = int.from_bytes(digest[:4], "little") % self.dimensions
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    async def aembed(self, text):
+        return self.embed(text)
+
+#embeddings from a model served by the local Ollama server
+class OllamaEmbedder:
+    def __init__(self, model, base_url):
+        from langchain_ollama import OllamaEmbeddings
+        self.name = f"ollama-{model}"
+        self._embeddings = OllamaEmbeddings(model=model, base_url=base_url)
+
+    async def aembed(self, text):
+        vector = np.asarray(await self._embeddings.aembed_query(text), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+def build_embedder(spec=SEMANTIC_CACHE_EMBEDDER, base_url="http://localhost:11434"):
+    if spec.startswith("ollama:"):
+        return OllamaEmbedder(spec.split(":", 1)[1], base_url)
+    return HashingEmbedder()
+
+#the answers seen for one question as a matrix of unit vectors, with the evaluation of each
+class QuestionIndex:
+    def __init__(self, dimensions):
+        self.vectors = np.zeros((0, dimensions), dtype=np.float32)
+        self.entries = []
+
+    #returns the most similar stored answer and its cosine similarity
+    def nearest(self, vector):
+        if not self.entries:
+            return None, 0.0
+        similarities = self.vectors @ vector
+        best = int(np.argmax(similarities))
+        return self.entries[best], float(similarities[best])
+
+    def add(self, vector, entry, limit):
+        self.vectors = np.vstack([self.vectors, vector[None, :]])[-limit:]
+        self.entries = (self.entries + [entry])[-limit:]
+
+#reuses evaluations of near-duplicate answers, keyed by question
+class SemanticCache:
+    def __init__(self, embedder=None, threshold=SEMANTIC_CACHE_THRESHOLD, directory=SEMANTIC_CACHE_DIR,
+                 max_per_question=SEMANTIC_CACHE_MAX_PER_QUESTION, audit_rate=SEMANTIC_CACHE_AUDIT_RATE,
+                 enabled=SEMANTIC_CACHE, save_every=SEMANTIC_CACHE_SAVE_EVERY):
+        self.enabled = enabled and np is not None
+        self.embedder = embedder if embedder is not None or not self.enabled else build_embedder()
+        self.threshold = threshold
+        self.directory = directory
+        self.max_per_question = max_per_question
+        self.audit_rate = audit_rate
+        self.save_every = save_every
+        self._indexes = {}
+        self._lock = threading.Lock()
+        #answers added to each question since its file was last written, and a lock per question ordering the writes
+        self._unsaved = {}
+        self._save_locks = {}
+        self.lookups = 0
+        self.hits = 0
+        self.stores = 0
+        self.audits = 0
+        self.drift_total = 0
+        self.drift_max = 0
+        if self.enabled and directory:
+            os.makedirs(directory, exist_ok=True)
+
+    #the question's index is keyed by its text and the embedder, since vectors from different embedders don't mix
+    def _key(self, question):
+        normalised = " ".join(question.split()).lower()
+        return hashlib.sha256(f"{self.embedder.name}\n{normalised}".encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.npz")
+
+    def _index(self, key, dimensions):
+        index = self._indexes.get(key)
+        if index is None:
+            index = QuestionIndex(dimensions)
+            if self.directory and os.path.exists(self._path(key)):
+                with np.load(self._path(key)) as stored:
+                    index.vectors = stored["vectors"]
+                    index.entries = json.loads(str(stored["entries"]))
+            self._indexes[key] = index
+        return index
+
+    def _save(self, key, vectors, entries):
+        #writes to a temporary file of its own first so a crash never leaves a half written index
+        descriptor, temporary = tempfile.mkstemp(dir=self.directory, prefix=f"{key}.", suffix=".tmp")
+        try:
+            with os.fdopen(descriptor, "wb") as f:
+                np.savez(f, vectors=vectors, entries=np.array(json.dumps(entries)))
+            os.replace(temporary, self._path(key))
+        except BaseException:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+
+    #writes a question's index if it changed, run in a worker thread, the snapshot is taken under the question's
+    #lock so an older index can never replace a newer one, and a failed write is logged and retried on the next save
+    def _persist(self, key):
+        with self._lock:
+            save_lock = self._save_locks.setdefault(key, threading.Lock())
+        with save_lock:
+            with self._lock:
+                unsaved = self._unsaved.get(key, 0)
+                if not unsaved:
+                    return
+                index = self._indexes[key]
+                vectors, entries = index.vectors, list(index.entries)
+                self._unsaved[key] = 0
+            try:
+                self._save(key, vectors, entries)
+            except Exception as e:
+                with self._lock:
+                    self._unsaved[key] = self._unsaved.get(key, 0) + unsaved
+                log_event("semantic_cache_save_failed", level=logging.ERROR, error=str(e) or type(e).__name__)
+
+    #writes every question with answers added since its last save, on shutdown
+    async def flush(self):
+        if not self.directory:
+            return
+        with self._lock:
+            keys = [key for key, unsaved in self._unsaved.items() if unsaved]
+        for key in keys:
+            await asyncio.to_thread(self._persist, key)
+
+    #looks for a stored evaluation of a near-identical answer, returning it (or None) and the answer's vector,
+    #a hit marked "audit" should be graded again and reported with record_drift
+    async def match(self, question, answer):
+        if not self.enabled:
+            return None, None
+        vector = await self.embedder.aembed(answer)
+        with self._lock:
+            self.lookups += 1
+            entry, similarity = self._index(self._key(question), vector.shape[0]).nearest(vector)
+            if entry is None or similarity < self.threshold:
+                return None, vector
+            self.hits += 1
+        return {**entry, "similarity": similarity, "audit": random.random() < self.audit_rate}, vector
+
+    #stores a fresh evaluation so later near-identical answers can reuse it
+    async def add(self, question, vector, feedback, score):
+        if not self.enabled or vector is None or score is None:
+            return
+        key = self._key(question)
+        with self._lock:
+            index = self._index(key, vector.shape[0])
+            index.add(vector, {"feedback": feedback, "score": score}, self.max_per_question)
+            self.stores += 1
+            self._unsaved[key] = self._unsaved.get(key, 0) + 1
+            due = self._unsaved[key] >= self.save_every
+        if self.directory and due:
+            await asyncio.to_thread(self._persist, key)
+
+    #compares a reused score with the score a fresh evaluation gave
+    def record_drift(self, cached_score, fresh_score):
+        if cached_score is None or fresh_score is None:
+            return
+        with self._lock:
+            drift = abs(cached_score - fresh_score)
+            self.audits += 1
+            self.drift_total += drift
+            self.drift_max = max(self.drift_max, drift)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "embedder": self.embedder.name if self.embedder else None,
+                "threshold": self.threshold,
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": round(self.hits / self.lookups, 4) if self.lookups else 0.0,
+                "stores": self.stores,
+                "questions": len(self._indexes),
+                "audits": self.audits,
+                "mean_score_drift": round(self.drift_total / self.audits, 3) if self.audits else 0.0,
+                "max_score_drift": self.drift_max,
+            }
@@ -0,0 +1,133 @@
+#imports
+import json
+import os
+from contextlib import aclosing
+from typing import Dict, List
+from fastapi import HTTPException
+from pydantic import BaseModel, Field, RootModel, ValidationError, field_validator
+from llm_service import astream_chain
+
+#how many repair attempts are made after the first invalid answer
+STRUCTURED_MAX_RETRIES = int(os.getenv("STRUCTURED_MAX_RETRIES", "1"))
+
+#schemas the LLM output is validated against
+class SubtopicsOutput(BaseModel):
+    subtopics: List[str] = Field(min_length=1)
+
+class RefinedSubtopicsOutput(BaseModel):
+    refined_subtopics: List[str] = Field(min_length=1)
+
+class CategorizedSubtopics(RootModel[Dict[str, List[str]]]):
+    #single values are wrapped in a list and empty values become an empty list
+    @field_validator("root", mode="before")
+    @classmethod
+    def wrap_values(cls, value):
+        if not isinstance(value, dict):
+            raise ValueError("Expected a dictionary of categories.")
+        return {key: item if isinstance(item, list) else ([item] if item else []) for key, item in value.items()}
+
+#counters for how often generations stop early or need repairs
+structured_stats = {"objects": 0, "early_stops": 0, "repairs": 0, "failures": 0}
+
+#incrementally finds the first complete top-level JSON object in streamed text, tracking braces outside strings
+class JsonObjectExtractor:
+    def __init__(self):
+        self.text = ""
+        self._pos = 0
+        self._start = None
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self.result = None
+        self.end = None
+
+    #adds a chunk and returns the parsed object once it is complete, otherwise None
+    def feed(self, chunk):
+        if self.result is not None:
+            return self.result
+        self.text += chunk
+        while self._pos < len(self.text):
+            char = self.text[self._pos]
+            self._pos += 1
+            if self._start is None:
+                if char == "{":
+                    self._start, self._depth = self._pos - 1, 1
+                continue
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == "{":
+                self._depth += 1
+            elif char == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    candidate = self.text[self._start:self._pos]
+                    try:
+                        parsed = json.loads(candidate)
+                    except ValueError:
+                        parsed = None
+                    if isinstance(parsed, dict):
+                        self.result, self.end = parsed, self._pos
+                        return parsed
+                    #keeps scanning after a balanced span that isn't valid JSON
+                    self._start = None
+        return None
+
+#finds the first JSON object in a complete text
+def extract_json_object(text):
+    return JsonObjectExtractor().feed(text)
+
+#streams a chain until its first JSON object closes, so the model stops generating trailing text
+async def stream_json_object(chain, inputs):
+    extractor = JsonObjectExtractor()
+    #closes the stream right after the break, stopping generation and freeing the concurrency slot
+    async with aclosing(astream_chain(chain, inputs)) as stream:
+        async for chunk in stream:
+            if extractor.feed(chunk) is not None:
+                break
+    if extractor.result is not None and extractor.end < len(extractor.text.rstrip()):
+        structured_stats["early_stops"] += 1
+    return extractor.result, extractor.text
+
+#validates parsed output against a schema and returns the validated data, or the error message
+def validate_output(parsed, schema):
+    if parsed is None:
+        return None, "No JSON object found in response."
+    try:
+        return schema.model_validate(parsed).model_dump(), None
+    except ValidationError as e:
+        return None, str(e)
+
+#generates, extracts and validates a JSON answer, asking the model to repair invalid output a bounded number of times
+async def generate_structured(prompts, name, llm, inputs, schema, cache=None, max_retries=STRUCTURED_MAX_RETRIES):
+    key = None
+    if cache is not None:
+        #a cached answer is stored as the validated JSON object
+        _, key = cache.prepare(prompts.template(name), prompts.model(name, llm), inputs)
+        cached = await cache.aget(key)
+        if cached is not None:
+            data, error = validate_output(extract_json_object(cached), schema)
+            if error is None:
+                return data, cached
+    parsed, raw = await stream_json_object(prompts.chain(name, llm), inputs)
+    data, error = validate_output(parsed, schema)
+    attempts = 0
+    while error is not None and attempts < max_retries:
+        attempts += 1
+        structured_stats["repairs"] += 1
+        parsed, raw = await stream_json_object(prompts.chain("json_repair", llm), {"error": error, "output": raw})
+        data, error = validate_output(parsed, schema)
+    if error is not None:
+        structured_stats["failures"] += 1
+        #gives an error message if the output is still unusable after repairs
+        raise HTTPException(status_code=500, detail=f"Invalid response format: {error}")
+    structured_stats["objects"] += 1
+    if key is not None:
+        await cache.aset(key, json.dumps(parsed))
+    return data, raw
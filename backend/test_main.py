@@ -52,7 +52,7 @@ def test_login_nonexistent_user():
 
 
 #tests if subtopics can be generated based on the users preferences
-def test_generate_subtopics():
+def test_generate_subtopics(fake_llm):
     response = client.post("/generate-subtopics", json={
         "job_role": "Software Engineer",
         "experience_level": "Entry-level"
@@ -67,7 +67,7 @@ def test_generate_subtopics_empty_fields():
 
 
 #tests if questions can be generated based on the subtopic
-def test_generate_questions():
+def test_generate_questions(fake_llm):
     response = client.post("/generate-questions", json={
         "subtopic": "Data Structures",
         "question_type": "technical",
@@ -98,7 +98,7 @@ def test_generate_questions_empty_subtopic():
     assert response.status_code in [422, 500]
 
 #tests if the validate LLM prompt works okay
-def test_validate_subtopics():
+def test_validate_subtopics(fake_llm):
     response = client.post("/validate-subtopics", json={
         "subtopics": ["Data Structures", "System Design"],
         "job_role": "Software Engineer"
@@ -107,7 +107,7 @@ def test_validate_subtopics():
     assert "validation_feedback" in response.json()
 
 #tests if the refining LLM prompt works okay
-def test_refine_subtopics():
+def test_refine_subtopics(fake_llm):
     response = client.post("/refine-subtopics", json={
         "subtopics": ["Data Structures", "System Design"],
         "job_role": "Software Engineer",
@@ -117,7 +117,7 @@ def test_refine_subtopics():
     assert "refined_subtopics" in response.json()
 
 #tests if the categorize LLM prompt works okay
-def test_categorize_subtopics():
+def test_categorize_subtopics(fake_llm):
     response = client.post("/categorize-subtopics", json={
         "subtopics": ["Data Structures", "Communication", "Leadership"]
     })
@@ -125,7 +125,7 @@ def test_categorize_subtopics():
     assert isinstance(response.json(), dict)
 
 #tests if the users response to a question is recieved okay
-def test_check_response():
+def test_check_response(fake_llm):
     response = client.post("/check-response", json={
         "question": "What is polymorphism in OOP?",
         "answer": "It allows objects to be treated as instances of their parent class.",
@@ -138,7 +138,7 @@ def test_check_response():
 
 
 #tests how the code handles an invalid user id '999'
-def test_check_response():
+def test_check_response(fake_llm):
     response = client.post("/check-response", json={
         "question": "What is polymorphism in OOP?",
         "answer": "It allows objects to be treated as instances of their parent class.",
@@ -161,3 +161,808 @@ def test_user_job_interests_with_scores():
     response = client.get("/user-job-interests-with-scores")
     assert response.status_code == 200
     assert isinstance(response.json(), list)
+
+#tests that a slow LLM call is abandoned with a 504 instead of hanging the worker
+def test_llm_call_timeout(fake_llm):
+    import asyncio
+    from fastapi import HTTPException
+    from llm_service import ainvoke_chain
+
+    fake_llm.latency = 1
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(ainvoke_chain(fake_llm, "Reply with OK", timeout=0.05))
+    assert exc.value.status_code == 504
+
+#tests that repeated prompts are served from the completion cache and survive a restart
+def test_llm_cache_hits(tmp_path, fake_llm):
+    import asyncio
+    from langchain_core.prompts import PromptTemplate
+    from llm_cache import LLMCache
+
+    fake_llm.default_response = "1. What is a stack?"
+    prompt = PromptTemplate.from_template("Questions about {subtopic}")
+    db_path = str(tmp_path / "llm_cache.db")
+
+    cache = LLMCache(db_path=db_path)
+    first = asyncio.run(cache.ainvoke(prompt, fake_llm, {"subtopic": "Data Structures"}))
+    second = asyncio.run(cache.ainvoke(prompt, fake_llm, {"subtopic": "Data Structures"}))
+    assert first == second
+    assert len(fake_llm.calls) == 1
+    assert cache.stats()["memory_hits"] == 1
+
+    restarted = LLMCache(db_path=db_path)
+    asyncio.run(restarted.ainvoke(prompt, fake_llm, {"subtopic": "Data Structures"}))
+    assert len(fake_llm.calls) == 1
+    assert restarted.stats()["disk_hits"] == 1
+
+#tests that expired rows are swept from the SQLite tier every few writes rather than on each one
+def test_llm_cache_sweep(tmp_path):
+    import time
+    from llm_cache import LLMCache
+
+    cache = LLMCache(db_path=str(tmp_path / "llm_cache.db"), ttl=60, sweep_every=2)
+    cache._conn.execute("INSERT INTO llm_cache (key, value, created_at) VALUES ('old', 'x', ?)", (time.time() - 120,))
+    cache._conn.commit()
+    count = lambda: cache._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+    cache.set("a", "1")
+    assert count() == 2
+    cache.set("b", "2")
+    assert count() == 2
+
+#tests that the memory tier evicts the least recently used entry
+def test_llm_cache_lru_eviction():
+    from llm_cache import LLMCache
+
+    cache = LLMCache(db_path=None, max_entries=2)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    cache.get("a")
+    cache.set("c", "3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+
+#tests that streamed feedback ends with a structured event holding the parsed score
+def test_check_response_stream(fake_llm):
+    import json
+
+    fake_llm.responses = (("Candidate's answer", "Score: 8/10\nConstructive Feedback:\nClear answer."),)
+    response = client.post("/check-response/stream", json={
+        "question": "What is polymorphism in OOP?",
+        "answer": "It allows objects to be treated as instances of their parent class."
+    })
+    assert response.status_code == 200
+    events = [json.loads(line) for line in response.text.splitlines()]
+    assert events[0]["type"] == "token"
+    assert events[-1] == {"type": "result", "score": 8, "feedback": "Score: 8/10\nConstructive Feedback:\nClear answer.", "llm_calls": 1}
+
+#tests that single-pass evaluation falls back to the refinement call only for malformed output
+def test_single_pass_evaluation_fallback(fake_llm):
+    import asyncio
+    import main
+
+    #the refinement prompt repeats the candidate's answer, so its phrase is checked first
+    fake_llm.responses = (("original feedback generated", "Score: 9/10\nConstructive Feedback:\nMention overriding."),
+                          ("Candidate's answer", "Great answer, 9 out of 10"))
+    result, score, llm_calls = asyncio.run(main.evaluate_answer("What is polymorphism?", "Many forms.", "single"))
+    assert score == 9
+    assert llm_calls == 2
+    assert result.startswith("Score: 9/10")
+
+    fake_llm.responses = (("Candidate's answer", "Score: 7/10\nConstructive Feedback:\nGood."),)
+    _, score, llm_calls = asyncio.run(main.evaluate_answer("What is polymorphism?", "Many forms.", "single"))
+    assert (score, llm_calls) == (7, 1)
+
+#tests that a batch keeps per-item order, reports failures and stores the successful results
+def test_check_responses_batch(fake_llm):
+    import main
+    from database import SessionLocal
+    from models import QuestionResponse
+
+    def grade(prompt):
+        if "broken" in prompt:
+            raise RuntimeError("model crashed")
+        return "Score: 6/10\nConstructive Feedback:\nAdd an example."
+
+    fake_llm.responses = (("Candidate's answer", grade),)
+    subtopic = f"Batch {uuid.uuid4().hex[:6]}"
+    response = client.post("/check-responses/batch", json={
+        "user_id": 1,
+        "job_role": "Software Engineer",
+        "subtopic": subtopic,
+        "items": [
+            {"question": "What is a stack?", "answer": "LIFO structure."},
+            {"question": "What is a queue?", "answer": "broken"},
+            {"question": "What is a heap?", "answer": "A tree with the heap property."}
+        ]
+    })
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [r["index"] for r in results] == [0, 1, 2]
+    assert results[0]["score"] == 6
+    assert "error" in results[1]
+    db = SessionLocal()
+    try:
+        assert db.query(QuestionResponse).filter(QuestionResponse.subtopic == subtopic).count() == 2
+    finally:
+        db.close()
+    #a batch over BATCH_MAX_ITEMS is rejected before anything is graded
+    oversized = {"items": [{"question": "What is a stack?", "answer": "LIFO structure."}] * (main.BATCH_MAX_ITEMS + 1)}
+    assert client.post("/check-responses/batch", json=oversized).status_code == 422
+
+#tests that the warm-up task is kept while it runs and cancelled on shutdown
+def test_warmup_task_cancelled_on_shutdown(monkeypatch, fake_llm):
+    import main
+
+    monkeypatch.setattr(main, "WARMUP_ON_STARTUP", True)
+    fake_llm.latency = 30
+    with TestClient(app):
+        task = app.state.warmup_task
+        assert not task.done()
+    assert task.cancelled() and app.state.warmup_task is None
+
+#tests that a background generation returns a job id and its result can be polled
+def test_background_job(fake_llm):
+    import time
+
+    fake_llm.responses = (("Break down the role", '{"subtopics": ["Caching", "Queues"]}'),)
+    with TestClient(app) as background_client:
+        response = background_client.post("/generate-subtopics?background=true", json={
+            "job_role": f"Engineer {uuid.uuid4().hex[:6]}",
+            "experience_level": "Senior"
+        })
+        assert response.status_code == 202
+        job_id = response.json()["job_id"]
+        for _ in range(50):
+            result = background_client.get(f"/jobs/{job_id}/result")
+            if result.status_code != 202:
+                break
+            time.sleep(0.05)
+        assert result.status_code == 200
+        assert result.json() == {"subtopics": ["Caching", "Queues"]}
+        assert background_client.get(f"/jobs/{job_id}").json()["status"] == "succeeded"
+
+#tests that finished jobs past the retention are deleted while unfinished and recent ones are kept
+def test_job_retention(temp_db):
+    import asyncio
+    from datetime import datetime, timedelta
+    from jobs import JobQueue
+    from models import Job
+
+    old = datetime.utcnow() - timedelta(hours=2)
+    ids = {status: uuid.uuid4().hex for status in ("succeeded", "failed", "queued", "recent")}
+    db = temp_db()
+    try:
+        for status, job_id in ids.items():
+            db.add(Job(id=job_id, kind="generate-subtopics", status="succeeded" if status == "recent" else status,
+                       priority=10, payload="{}", updated_at=datetime.utcnow() if status == "recent" else old))
+        db.commit()
+        assert asyncio.run(JobQueue(session_factory=temp_db, retention_hours=1).prune()) == 2
+        remaining = {job.id for job in db.query(Job.id)}
+        assert remaining == {ids["queued"], ids["recent"]}
+    finally:
+        db.close()
+
+#tests that a queued job is run by only one of the workers sharing the table and that only running jobs
+#whose lease has expired are taken over
+def test_job_claims(temp_db):
+    import asyncio
+    from datetime import datetime, timedelta
+    from jobs import JobQueue
+    from models import Job
+
+    ids = {name: uuid.uuid4().hex for name in ("queued", "live", "dead")}
+    db = temp_db()
+    try:
+        db.add(Job(id=ids["queued"], kind="generate-subtopics", status="queued", priority=10, payload="{}"))
+        db.add(Job(id=ids["live"], kind="generate-subtopics", status="running", priority=10, payload="{}",
+                   owner="other", lease_until=datetime.utcnow() + timedelta(minutes=5)))
+        db.add(Job(id=ids["dead"], kind="generate-subtopics", status="running", priority=10, payload="{}",
+                   owner="gone", lease_until=datetime.utcnow() - timedelta(minutes=5)))
+        db.commit()
+    finally:
+        db.close()
+
+    async def scenario():
+        first, second = JobQueue(session_factory=temp_db), JobQueue(session_factory=temp_db)
+        first._queue = asyncio.PriorityQueue()
+        await first.requeue()
+        claims = await asyncio.gather(first._claim(ids["queued"]), second._claim(ids["queued"]))
+        return first._queued, claims
+
+    requeued, claims = asyncio.run(scenario())
+    assert requeued == {ids["queued"], ids["dead"]}
+    assert sorted(kind is None for kind, _ in claims) == [False, True]
+
+#tests that the profile aggregates are computed correctly from the stored responses
+def test_user_profile_aggregates():
+    from database import SessionLocal
+    from main import save_response
+
+    response = client.post("/register", json={
+        "email": f"profile_{uuid.uuid4().hex[:6]}@example.com",
+        "name": "Profile User",
+        "password": "secure123"
+    })
+    user_id = response.json()["id"]
+    db = SessionLocal()
+    try:
+        for job_role, subtopic, score in [("Engineer", "OOP", 8), ("Engineer", "OOP", 6),
+                                          ("Engineer", "SQL", None), ("Analyst", "SQL", 4)]:
+            save_response(db, user_id, job_role, subtopic, "q", "a", score, "f")
+    finally:
+        db.close()
+    profile = client.get(f"/user-profile/{user_id}").json()
+    assert profile["total_questions"] == 4
+    assert profile["average_score"] == 4.5
+    assert profile["average_scores_by_subtopic"] == {"OOP": 7.0, "SQL": 4.0}
+    assert profile["most_interested_career"] == "Engineer"
+    assert profile["job_role_distribution"] == {"Engineer": 3, "Analyst": 1}
+    interests = client.get(f"/user-job-interests-with-scores?user_id={user_id}").json()
+    assert [(i["job_role"], i["subtopic"], i["average_score"]) for i in interests] == [
+        ("Analyst", "SQL", 4.0), ("Engineer", "OOP", 7.0), ("Engineer", "SQL", None)
+    ]
+    assert interests[1]["min_score"] == 6 and interests[1]["max_score"] == 8
+
+#tests that the rollup backfill rebuilds the same totals as the incremental updates
+def test_rollup_backfill_matches_incremental(temp_db):
+    from main import save_response
+    from models import SubtopicScoreRollup, User
+    from rollups import backfill
+
+    db = temp_db()
+    try:
+        user = User(email="rollup@example.com", name="Rollup User", hashed_password="x")
+        db.add(user)
+        db.commit()
+        for job_role, subtopic, score in [("Engineer", "OOP", 8), ("Engineer", "OOP", 6), ("Engineer", None, None),
+                                          ("Analyst", "SQL", 4), ("Analyst", "SQL", 9)]:
+            save_response(db, user.id, job_role, subtopic, "q", "a", score, "f")
+        columns = lambda r: (r.user_id, r.job_role, r.subtopic, r.response_count, r.scored_count, r.score_sum, r.min_score, r.max_score)
+        before = sorted(columns(r) for r in db.query(SubtopicScoreRollup).all())
+        assert len(before) == 3
+        backfill(db)
+        after = sorted(columns(r) for r in db.query(SubtopicScoreRollup).all())
+        assert before == after
+    finally:
+        db.close()
+
+#tests that the migration collapses duplicate interest rows and that new answers increment the counter,
+#on a database with the old schema rather than temp_db's migrated one
+def test_user_job_interest_dedupe(tmp_path):
+    from sqlalchemy import create_engine, text
+    from sqlalchemy.orm import Session
+    from migrations import dedupe_user_job_interests
+    from models import UserJobInterest
+    from rollups import record_interest
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'interests.db'}")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE users (id INTEGER PRIMARY KEY)"))
+        conn.execute(text("CREATE TABLE user_job_interests (id INTEGER PRIMARY KEY, user_id INTEGER, job_role VARCHAR, subtopic VARCHAR)"))
+        conn.execute(text("CREATE INDEX ix_user_job_interests_id ON user_job_interests (id)"))
+        conn.execute(text("INSERT INTO user_job_interests (user_id, job_role, subtopic) VALUES "
+                          "(1, 'Engineer', 'OOP'), (1, 'Engineer', 'OOP'), (1, 'Engineer', 'OOP'), (1, 'Engineer', NULL)"))
+    assert dedupe_user_job_interests(engine)
+    with Session(engine) as db:
+        record_interest(db, 1, "Engineer", "OOP")
+        db.commit()
+        rows = {(r.job_role, r.subtopic): r.interaction_count for r in db.query(UserJobInterest).all()}
+    assert rows == {("Engineer", "OOP"): 4, ("Engineer", ""): 1}
+    assert not dedupe_user_job_interests(engine)
+
+#tests that file-backed SQLite engines are created in WAL mode with the tuned pragmas
+def test_sqlite_engine_pragmas(temp_db):
+    from sqlalchemy import text
+
+    db = temp_db()
+    try:
+        assert db.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert db.execute(text("PRAGMA synchronous")).scalar() == 1
+        assert db.execute(text("PRAGMA busy_timeout")).scalar() > 0
+    finally:
+        db.close()
+
+#tests that logging in transparently rehashes a password when the primary scheme changes
+def test_login_rehashes_outdated_hash(monkeypatch):
+    import passwords
+    from database import SessionLocal
+    from models import User
+
+    email = f"rehash_{uuid.uuid4().hex[:6]}@example.com"
+    client.post("/register", json={"email": email, "name": "Rehash", "password": "secure123"})
+    monkeypatch.setattr(passwords, "pwd_context", passwords.build_context(["argon2", "bcrypt"]))
+    response = client.post("/login", json={"email": email, "password": "secure123"})
+    assert response.status_code == 200
+    db = SessionLocal()
+    try:
+        assert db.query(User).filter(User.email == email).first().hashed_password.startswith("$argon2")
+    finally:
+        db.close()
+    assert client.post("/login", json={"email": email, "password": "secure123"}).status_code == 200
+    assert client.get("/auth/hash-stats").json()["completed"] >= 3
+
+#tests that login issues tokens which identify the user without sending user_id, and that refresh tokens rotate
+def test_access_and_refresh_tokens(fake_llm):
+    email = f"token_{uuid.uuid4().hex[:6]}@example.com"
+    user_id = client.post("/register", json={"email": email, "name": "Token User", "password": "secure123"}).json()["id"]
+    tokens = client.post("/login", json={"email": email, "password": "secure123"}).json()
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+
+    fake_llm.responses = (("Candidate's answer", "Score: 5/10\nConstructive Feedback:\nMore depth."),)
+    response = client.post("/check-response", headers=headers, json={
+        "question": "What is a stack?", "answer": "LIFO.", "job_role": "Engineer", "subtopic": "Stacks"
+    })
+    assert response.status_code == 200
+    profile = client.get(f"/user-profile/{user_id}", headers=headers).json()
+    assert profile["email"] == email
+    assert profile["total_questions"] == 1
+    assert client.get(f"/user-profile/{user_id + 1}", headers=headers).status_code == 403
+    assert client.get(f"/user-profile/{user_id}", headers={"Authorization": "Bearer not.a.token"}).status_code == 401
+
+    refreshed = client.post("/token/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert refreshed.status_code == 200
+    assert client.post("/token/refresh", json={"refresh_token": tokens["refresh_token"]}).status_code == 401
+
+    #an expired refresh token is refused without being marked revoked
+    from datetime import datetime, timedelta
+    from database import SessionLocal
+    from models import RefreshToken
+    from tokens import consume_refresh_token, issue_refresh_token
+    db = SessionLocal()
+    try:
+        expired = issue_refresh_token(db, user_id)
+        db.commit()
+        db.query(RefreshToken).filter(RefreshToken.user_id == user_id, RefreshToken.revoked_at.is_(None)) \
+            .update({RefreshToken.expires_at: datetime.utcnow() - timedelta(days=1)})
+        db.commit()
+        assert consume_refresh_token(db, expired) is None
+    finally:
+        db.close()
+
+#tests that prompts come from prompts.json with their per-prompt model parameters bound
+def test_prompt_registry():
+    from langchain_ollama import OllamaLLM
+    from prompt_registry import PromptRegistry
+
+    registry = PromptRegistry()
+    assert registry.version >= 2
+    assert "{subtopics}" in registry.template("categorization").template
+    model = registry.model("categorization", OllamaLLM(model="llama3"))
+    assert model.kwargs["options"]["num_predict"] == registry.params["categorization"]["num_predict"]
+    chain = registry.chain("questions", OllamaLLM(model="llama3"))
+    assert chain is registry.chain("questions", registry._llm)
+
+#tests that the JSON extractor handles braces inside strings and objects split across chunks
+def test_json_object_extractor():
+    from structured_output import JsonObjectExtractor, extract_json_object
+
+    assert extract_json_object('Sure! {"a": "}{", "b": {"c": "\\"}"}} trailing {"d": 1}') == {"a": "}{", "b": {"c": "\"}"}}
+    assert extract_json_object("{not json} then {\"ok\": true}") == {"ok": True}
+    assert extract_json_object("no object here") is None
+    extractor = JsonObjectExtractor()
+    assert extractor.feed('{"subtopics": ["Ca') is None
+    assert extractor.feed('ching"]} and more') == {"subtopics": ["Caching"]}
+
+#tests that streaming stops once the object closes and that invalid output is repaired once
+def test_structured_output_stops_early_and_repairs(fake_llm):
+    import asyncio
+    import main
+    from langchain_core.runnables import RunnableGenerator
+    from llm_service import queue_stats
+    from structured_output import RefinedSubtopicsOutput, generate_structured, stream_json_object
+
+    consumed = []
+
+    async def chunks(_):
+        for chunk in ['{"refined_', 'subtopics": ["A"]}', " extra", " text", " the model keeps writing"]:
+            consumed.append(chunk)
+            yield chunk
+
+    async def stop_early():
+        parsed, _ = await stream_json_object(RunnableGenerator(chunks), {})
+        #the concurrency slot is released as soon as the object closes, not when the stream is collected
+        return parsed, queue_stats()["active"]
+
+    parsed, active = asyncio.run(stop_early())
+    assert parsed == {"refined_subtopics": ["A"]}
+    assert len(consumed) == 2
+    assert active == 0
+
+    fake_llm.responses = (("Your previous reply could not be used", '{"refined_subtopics": ["Caching"]}'),
+                          ("refine the subtopics", '{"refined": "Caching"}'))
+    data, _ = asyncio.run(generate_structured(main.prompts, "refinement", fake_llm,
+                                              {"feedback": "ok", "job_role": "Engineer", "subtopics": "Caching"},
+                                              RefinedSubtopicsOutput))
+    assert data == {"refined_subtopics": ["Caching"]}
+    assert len(fake_llm.calls) == 2
+
+    fake_llm.responses = ()
+    fake_llm.default_response = "I can't answer in JSON."
+    response = client.post("/refine-subtopics", json={
+        "job_role": "Engineer", "subtopics": ["Caching"], "validation_feedback": "ok"})
+    assert response.status_code == 500
+
+#tests routing, failover and circuit breaking of the LLM pool against stub Ollama servers
+def test_llm_pool_failover_and_routing():
+    import asyncio
+    from benchmarks.stub_ollama import StubOllama
+    from llm_pool import pool_from_settings
+    from prompt_registry import PromptRegistry
+
+    first = StubOllama(reply="first", latency=0.2)
+    second = StubOllama(reply="second", latency=0.2, models=("llama3", "tiny"))
+    try:
+        pool = pool_from_settings({"name": "llama3"}, backends=f"{first.url},{second.url}")
+
+        async def run():
+            await pool.check_health()
+            #least outstanding requests spreads concurrent calls evenly
+            replies = await asyncio.gather(*(pool.ainvoke("question") for _ in range(4)))
+            assert sorted(reply.strip() for reply in replies) == ["first", "first", "second", "second"]
+            first.fail = True
+            first.latency = second.latency = 0
+            #every call still succeeds while the failing backend's circuit opens
+            for _ in range(50):
+                assert (await pool.ainvoke("question")).strip() == "second"
+                if pool.stats()["backends"][0]["circuit"] == "open":
+                    break
+            #per-task routing sends the categorization prompt to the small model
+            registry = PromptRegistry(task_models="categorization=tiny")
+            await registry.chain("categorization", pool).ainvoke({"subtopics": "Caching"})
+
+        asyncio.run(run())
+        stats = {backend["base_url"]: backend for backend in pool.stats()["backends"]}
+        assert stats[first.url]["circuit"] == "open"
+        assert second.requests[-1]["model"] == "tiny"
+        assert second.requests[-1]["format"] == "json"
+    finally:
+        first.stop()
+        second.stop()
+
+#tests that a half-open circuit lets exactly one trial request through, reopening on failure and closing on success
+def test_llm_circuit_half_open():
+    from llm_pool import LLM_CIRCUIT_FAILURES, LLM_CIRCUIT_RESET_SECONDS, Backend
+
+    backend = Backend("http://localhost:1", "llama3")
+    for _ in range(LLM_CIRCUIT_FAILURES):
+        backend.record_failure(0)
+    assert not backend.begin(1)
+    after_reset = LLM_CIRCUIT_RESET_SECONDS + 1
+    assert backend.stats(after_reset)["circuit"] == "half-open"
+    assert backend.begin(after_reset) and not backend.begin(after_reset)
+    backend.trial = False
+    backend.record_failure(after_reset)
+    assert backend.stats(after_reset)["circuit"] == "open"
+    later = after_reset + LLM_CIRCUIT_RESET_SECONDS + 1
+    assert backend.begin(later)
+    backend.trial = False
+    backend.record_success()
+    assert backend.begin(later) and backend.begin(later) and backend.stats(later)["circuit"] == "closed"
+
+#tests that questions are parsed into the bank, topped up in the background and served in rotation
+def test_question_bank_rotation(fake_llm):
+    import itertools
+    import time
+    import main
+    from database import SessionLocal
+    from question_bank import bank_key, parse_questions, stock
+
+    assert parse_questions("Here you go:\n1. What is a stack?\n2) Explain\n   recursion.\n\n3. **Why test?**") == \
+        ["What is a stack?", "Explain recursion.", "Why test?"]
+    counter = itertools.count()
+    fake_llm.responses = (("interview questions for",
+                           lambda prompt: "\n".join(f"{n}. Question {next(counter)}?" for n in range(1, 8))),)
+    request = {"job_role": f"Engineer {uuid.uuid4().hex[:6]}", "experience_level": "Junior",
+               "subtopic": "Caching", "question_type": "technical"}
+    key = bank_key(request["job_role"], "Junior", "Caching", "technical")
+    with TestClient(app) as bank_client:
+        first = bank_client.post("/generate-questions", json=request).json()
+        assert first["source"] == "llm"
+        assert len(first["items"]) == 7
+        db = SessionLocal()
+        try:
+            #the request's own set and one fresh set for the next request, not the whole target at once
+            for _ in range(100):
+                if stock(db, key) >= 2 * main.QUESTIONS_PER_SET:
+                    break
+                time.sleep(0.05)
+            time.sleep(0.1)
+            assert stock(db, key) == 2 * main.QUESTIONS_PER_SET
+        finally:
+            db.close()
+        second = bank_client.post("/generate-questions", json=request).json()
+    assert second["source"] == "bank"
+    assert len(second["items"]) == 7
+    assert not set(first["items"]) & set(second["items"])
+    assert second["questions"].startswith("1. ")
+
+#tests that near-identical answers reuse an evaluation, across restarts, and that audits measure score drift
+def test_semantic_cache(monkeypatch, tmp_path, fake_llm):
+    import asyncio
+    import main
+    from semantic_cache import HashingEmbedder, SemanticCache
+
+    #alternates between 7 and 6, so an audit always sees a drift of one
+    fake_llm.responses = (("Candidate's answer",
+                           lambda prompt: f"Score: {6 + len(fake_llm.calls) % 2}/10\nConstructive Feedback:\nFine."),)
+    cache = SemanticCache(embedder=HashingEmbedder(), threshold=0.9, directory=str(tmp_path), audit_rate=0, enabled=True)
+    monkeypatch.setattr(main, "semantic_cache", cache)
+    question = "What is polymorphism?"
+    answer = "Polymorphism lets objects of different classes be used through the same interface, " \
+             "so one method call behaves differently depending on the object's class."
+
+    _, score, llm_calls = asyncio.run(main.evaluate_answer(question, answer))
+    assert llm_calls == 1
+    _, reused, llm_calls = asyncio.run(main.evaluate_answer(question, answer.replace("lets", "allows")))
+    assert (reused, llm_calls) == (score, 0)
+    assert asyncio.run(main.evaluate_answer(question, "It is about databases and indexes."))[2] == 1
+    assert asyncio.run(main.evaluate_answer("What is a hash map?", answer))[2] == 1
+    #indexes are written every few answers, and the rest when the app shuts down
+    asyncio.run(cache.flush())
+
+    restarted = SemanticCache(embedder=HashingEmbedder(), threshold=0.9, directory=str(tmp_path), audit_rate=1,
+                              enabled=True)
+    monkeypatch.setattr(main, "semantic_cache", restarted)
+    #an audited hit is graded again and its score compared with the reused one
+    assert asyncio.run(main.evaluate_answer(question, answer))[2] == 1
+    stats = restarted.stats()
+    assert stats["hits"] == 1 and stats["audits"] == 1
+    assert stats["max_score_drift"] == 1
+    assert cache.stats()["hit_rate"] == 0.25
+
+#tests that concurrent saves of one question's index neither fail nor leave an older index on disk
+def test_semantic_cache_concurrent_saves(tmp_path):
+    import asyncio
+    import os
+    from semantic_cache import HashingEmbedder, SemanticCache
+
+    cache = SemanticCache(embedder=HashingEmbedder(), directory=str(tmp_path), enabled=True, save_every=1)
+    embedder = HashingEmbedder()
+
+    async def add_all():
+        await asyncio.gather(*(cache.add("What is a stack?", embedder.embed(f"answer {n}"), "Fine.", n % 10)
+                               for n in range(100)))
+
+    asyncio.run(add_all())
+    assert os.listdir(tmp_path) == [f"{cache._key('What is a stack?')}.npz"]
+    restarted = SemanticCache(embedder=HashingEmbedder(), directory=str(tmp_path), enabled=True)
+    assert len(restarted._index(cache._key("What is a stack?"), 512).entries) == 100
+    #a failed write is logged and kept for the next save instead of failing the graded request
+    cache.directory = str(tmp_path / "missing")
+    asyncio.run(cache.add("What is a stack?", embedder.embed("one more"), "Fine.", 5))
+    assert cache._unsaved[cache._key("What is a stack?")] == 1
+
+#tests that the subtopic pipeline streams every stage, skips refinement when validation needs no changes and prefetches
+def test_subtopic_pipeline(fake_llm):
+    import itertools
+    import json
+    import time
+    import main
+    from database import SessionLocal
+    from question_bank import bank_key, stock
+
+    verdict = {"text": "Verdict: NO CHANGES"}
+    counter = itertools.count()
+    fake_llm.responses = (
+        ("Break down the role", '{"subtopics": ["Caching", "Queues"]}'),
+        ("Validate the following", lambda prompt: f"They are relevant.\n{verdict['text']}"),
+        ("refine the subtopics", '{"refined_subtopics": ["Caching"]}'),
+        ("Categorize the following", '{"Technical Skills": ["Caching", "Queues"], "Soft Skills": "Teamwork"}'),
+        #fresh questions every time, so a top-up is only limited by its target
+        ("interview questions for", lambda prompt: "\n".join(f"{n}. Question {next(counter)}?" for n in range(1, 8))),
+    )
+    job_role = f"Engineer {uuid.uuid4().hex[:6]}"
+    with TestClient(app) as pipeline_client:
+        response = pipeline_client.post("/subtopic-pipeline", json={"job_role": job_role, "experience_level": "Senior"})
+        events = [json.loads(line) for line in response.text.splitlines()]
+        assert [event.get("stage", event["type"]) for event in events] == \
+            ["subtopics", "validation", "refinement", "prefetch", "categorization", "result"]
+        assert events[2]["skipped"] is True
+        assert events[3]["subtopics"] == ["Caching", "Queues"]
+        result = events[-1]
+        assert result["categories"] == {"Technical Skills": ["Caching", "Queues"], "Soft Skills": ["Teamwork"]}
+        assert set(result["timings"]) == {"subtopics", "validation", "categorization", "total"}
+        #prefetching queues one set per subtopic, not a top-up to the full bank target
+        key = bank_key(job_role, "Senior", "Caching", "technical")
+        db = SessionLocal()
+        try:
+            for _ in range(100):
+                if stock(db, key) >= main.QUESTIONS_PER_SET:
+                    break
+                time.sleep(0.05)
+            time.sleep(0.1)
+            assert stock(db, key) == main.QUESTIONS_PER_SET
+        finally:
+            db.close()
+
+        verdict["text"] = "Verdict: CHANGES NEEDED"
+        response = pipeline_client.post("/subtopic-pipeline", json={
+            "job_role": f"Engineer {uuid.uuid4().hex[:6]}", "experience_level": "Senior"})
+        result = json.loads(response.text.splitlines()[-1])
+        assert result["refined_subtopics"] == ["Caching"]
+        assert "refinement" in result["timings"]
+
+#tests that /metrics exposes route latency, per-request database work and per-prompt LLM timings
+def test_metrics():
+    from langchain_core.language_models.fake import FakeListLLM
+    from metrics import llm_metrics, llm_request_duration
+
+    client.post("/register", json={"email": f"metrics_{uuid.uuid4().hex[:6]}@example.com",
+                                   "name": "Metrics", "password": "secure123"})
+    FakeListLLM(responses=["ok"], callbacks=[llm_metrics]).with_config(metadata={"prompt": "metrics_test"}).invoke("hi")
+    assert llm_request_duration.count(prompt="metrics_test", model="") == 1
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    text = response.text
+    assert '# TYPE http_request_duration_seconds histogram' in text
+    assert 'http_request_duration_seconds_count{method="POST",route="/register",status="200"}' in text
+    assert 'db_queries_per_request_bucket{route="/register",le="+Inf"}' in text
+    assert 'db_query_duration_seconds_count{operation="INSERT"}' in text
+    assert 'llm_request_duration_seconds_count{prompt="metrics_test",model=""} 1' in text
+    assert "llm_cache_hit_ratio " in text
+
+#tests that a client over its limit gets a 429 with Retry-After while other clients are still served
+def test_rate_limit(monkeypatch, tmp_path, fake_llm):
+    import rate_limit
+    from rate_limit import MemoryBucketStore, RateLimiter, SQLiteBucketStore
+
+    monkeypatch.setattr(rate_limit, "rate_limiter", RateLimiter(MemoryBucketStore(), per_minute=60, burst=2, enabled=True))
+    body = {"job_role": "Software Engineer", "experience_level": "Senior"}
+    assert [client.post("/generate-subtopics", json=body).status_code for _ in range(2)] == [200, 200]
+    limited = client.post("/generate-subtopics", json=body)
+    assert limited.status_code == 429
+    assert limited.headers["Retry-After"] == "1"
+    token = client.post("/login", json={"email": "testuser@example.com", "password": "secure123"}).json()["access_token"]
+    assert client.post("/generate-subtopics", json=body, headers={"Authorization": f"Bearer {token}"}).status_code == 200
+    assert client.get("/rate-limit/stats").json()["rejected"]["generate-subtopics"] == 1
+
+    #a batch is charged one request per answer, one larger than the burst is refused outright
+    batch = {"items": [{"question": "What is a stack?", "answer": "LIFO structure."}] * 3}
+    calls = len(fake_llm.calls)
+    assert client.post("/check-responses/batch", json=batch).status_code == 413
+    assert len(fake_llm.calls) == calls
+    batch["items"] = batch["items"][:2]
+    assert client.post("/check-responses/batch", json=batch, headers={"Authorization": f"Bearer {token}"}).status_code == 200
+    single = {"question": "What is a stack?", "answer": "LIFO structure."}
+    assert client.post("/check-response", json=single, headers={"Authorization": f"Bearer {token}"}).status_code == 429
+
+    #two workers sharing the SQLite store share the bucket
+    first, second = SQLiteBucketStore(str(tmp_path / "buckets.db")), SQLiteBucketStore(str(tmp_path / "buckets.db"))
+    assert first.take("route:ip:1", 1, 1, 1) == 0
+    assert second.take("route:ip:1", 1, 1, 1) > 0
+
+#tests that waiting completions take turns between clients and that an overfull client queue is rejected
+def test_fair_llm_queue():
+    import asyncio
+    from fastapi import HTTPException
+    from llm_service import FairQueue
+
+    async def scenario():
+        queue = FairQueue(1, per_client=3)
+        order = []
+        await queue.acquire("a")
+
+        async def job(name, client):
+            await queue.acquire(client)
+            order.append(name)
+            queue.release()
+
+        tasks = [asyncio.create_task(job(f"a{n}", "a")) for n in range(3)] + [asyncio.create_task(job("b0", "b"))]
+        await asyncio.sleep(0)
+        with pytest.raises(HTTPException) as full:
+            await queue.acquire("a")
+        with pytest.raises(HTTPException) as timeout:
+            await queue.acquire("c", timeout=0.01)
+        queue.release()
+        await asyncio.gather(*tasks)
+        return order, full.value, timeout.value, queue.active
+
+    order, full, timeout, active = asyncio.run(scenario())
+    assert order == ["a0", "b0", "a1", "a2"]
+    assert (full.status_code, timeout.status_code) == (429, 503)
+    assert active == 0
+
+#tests that idle work only gets a slot while no user is waiting and never holds more than one
+def test_idle_llm_lane():
+    import asyncio
+    from llm_service import IDLE_CLIENT, FairQueue
+
+    async def scenario():
+        queue = FairQueue(2)
+        order = []
+        await queue.acquire("a")
+        await queue.acquire(IDLE_CLIENT)
+
+        async def job(name, client):
+            await queue.acquire(client)
+            order.append(name)
+
+        tasks = [asyncio.create_task(job("idle1", IDLE_CLIENT)), asyncio.create_task(job("b", "b"))]
+        await asyncio.sleep(0)
+        #idle1 queued first, but the freed idle slot goes to the waiting user
+        queue.release(IDLE_CLIENT)
+        await asyncio.sleep(0.01)
+        assert order == ["b"]
+        queue.release("a")
+        await asyncio.gather(*tasks)
+        return order, queue.active, queue.idle_active
+
+    assert asyncio.run(scenario()) == (["b", "idle1"], 2, 1)
+
+#tests keyset paging, column selection, filters and the streamed exports of a user's history
+def test_history():
+    import csv
+    import io
+    import json
+    from database import SessionLocal
+    from models import QuestionResponse
+
+    email = f"history_{uuid.uuid4().hex[:6]}@example.com"
+    user_id = client.post("/register", json={"email": email, "name": "History", "password": "secure123"}).json()["id"]
+    token = client.post("/login", json={"email": email, "password": "secure123"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    db = SessionLocal()
+    db.add_all([QuestionResponse(user_id=user_id, job_role="Engineer", subtopic=f"Topic {n % 2}", question_text=f"Q{n}",
+                                 user_answer="a" * 500, feedback="f" * 500, score=n) for n in range(7)])
+    db.commit()
+    db.close()
+
+    #a token is required, and only for the user's own history
+    other = client.post("/login", json={"email": "testuser@example.com", "password": "secure123"}).json()["access_token"]
+    assert client.get(f"/history/{user_id}/export").status_code == 401
+    assert client.get(f"/history/{user_id}", headers={"Authorization": f"Bearer {other}"}).status_code == 403
+
+    first = client.get(f"/history/{user_id}", headers=headers, params={"limit": 3}).json()
+    assert [item["question_text"] for item in first["items"]] == ["Q6", "Q5", "Q4"]
+    assert set(first["items"][0]) == {"id", "job_role", "subtopic", "question_text", "score"}
+    pages, cursor = [first], first["next_before_id"]
+    while cursor is not None:
+        pages.append(client.get(f"/history/{user_id}", headers=headers, params={"limit": 3, "before_id": cursor}).json())
+        cursor = pages[-1]["next_before_id"]
+    assert [len(page["items"]) for page in pages] == [3, 3, 1]
+
+    filtered = client.get(f"/history/{user_id}", headers=headers, params={
+        "fields": "score,feedback", "subtopic": "Topic 0", "min_score": 2, "max_score": 5}).json()["items"]
+    assert [(item["score"], len(item["feedback"])) for item in filtered] == [(4, 500), (2, 500)]
+    assert set(filtered[0]) == {"id", "score", "feedback"}
+    assert client.get(f"/history/{user_id}", headers=headers, params={"fields": "hashed_password"}).status_code == 422
+
+    exported = client.get(f"/history/{user_id}/export", headers=headers)
+    assert exported.headers["content-type"].startswith("application/x-ndjson")
+    rows = [json.loads(line) for line in exported.text.splitlines()]
+    assert [row["score"] for row in rows] == list(range(7)) and len(rows[0]["user_answer"]) == 500
+    table = list(csv.reader(io.StringIO(client.get(f"/history/{user_id}/export", headers=headers,
+                                                   params={"format": "csv", "fields": "score"}).text)))
+    assert table == [["id", "score"]] + [[str(row["id"]), str(row["score"])] for row in rows]
+
+#tests that long answers are trimmed to the token budget, oversized ones get a 413 and token usage is stored
+def test_token_budget(fake_llm):
+    from database import SessionLocal
+    from models import QuestionResponse
+    from prompt_registry import PromptRegistry
+    from token_budget import ANSWER_HARD_LIMIT_TOKENS, count_tokens, trim_text
+
+    trimmed, was_trimmed = trim_text(" ".join(f"word{n}" for n in range(3000)), 200)
+    assert was_trimmed and count_tokens(trimmed) <= 200
+    assert trimmed.startswith("word0 ") and trimmed.endswith(" word2999") and "words trimmed" in trimmed
+    pasted, _ = trim_text("First point.\n\nSecond point.\n\n" * 100, 20)
+    assert pasted == "First point.\n\nSecond point.\n\n"
+    assert PromptRegistry(max_num_predict=64).params["initial_feedback"]["num_predict"] == 64
+
+    token = client.post("/login", json={"email": "testuser@example.com", "password": "secure123"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    question = f"Budget question {uuid.uuid4().hex[:6]}?"
+    long_answer = " ".join(f"point{n}" for n in range(1500))
+    response = client.post("/check-response", headers=headers, json={"question": question, "answer": long_answer})
+    assert response.status_code == 200
+    prompt = fake_llm.calls[-1]
+    assert "words trimmed" in prompt and count_tokens(prompt) < count_tokens(long_answer)
+    db = SessionLocal()
+    row = db.query(QuestionResponse).filter(QuestionResponse.question_text == question).one()
+    db.close()
+    assert row.user_answer == long_answer
+    assert row.prompt_tokens == len(prompt.split()) and row.completion_tokens > 0
+
+    too_long = "word " * (ANSWER_HARD_LIMIT_TOKENS + 1)
+    assert client.post("/check-response", headers=headers, json={"question": question, "answer": too_long}).status_code == 413
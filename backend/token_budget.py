@@ -0,0 +1,81 @@
+#imports
+import math
+import os
+import re
+from fastapi import HTTPException
+from metrics import registry
+
+#context window of the model, prompt and generated tokens together have to fit in it
+LLM_CONTEXT_TOKENS = int(os.getenv("LLM_CONTEXT_TOKENS", "8192"))
+#answers longer than this are trimmed before grading, the stored answer is kept whole
+ANSWER_MAX_TOKENS = int(os.getenv("ANSWER_MAX_TOKENS", "1500"))
+#question and answer together above this are rejected with a 413 instead of being graded
+ANSWER_HARD_LIMIT_TOKENS = int(os.getenv("ANSWER_HARD_LIMIT_TOKENS", "6000"))
+#first-pass feedback longer than this is trimmed before it goes into the refinement prompt
+FEEDBACK_MAX_TOKENS = int(os.getenv("FEEDBACK_MAX_TOKENS", "800"))
+
+inputs_trimmed = registry.counter("prompt_inputs_trimmed_total", "Prompt inputs trimmed to fit the token budget", ("field",))
+inputs_rejected = registry.counter("prompt_inputs_rejected_total", "Answers rejected with a 413 for being too long")
+
+_PIECE = re.compile(r"\w+|[^\w\s]")
+
+#estimates the llama tokenizer's count, which splits words into pieces and gives punctuation its own tokens,
+#so it takes the larger of the word and punctuation count and one token per four characters
+def count_tokens(text):
+    if not text:
+        return 0
+    return max(len(_PIECE.findall(text)), math.ceil(len(text) / 4))
+
+#drops paragraphs that were pasted more than once, keeping the first copy
+def dedupe_paragraphs(text):
+    seen = set()
+    paragraphs = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        key = " ".join(paragraph.split()).lower()
+        if key and key in seen:
+            continue
+        seen.add(key)
+        paragraphs.append(paragraph)
+    return "\n\n".join(paragraphs)
+
+#shortens text to about max_tokens, keeping its start and end, which carry an answer's approach and conclusion,
+#returns the text and whether it was shortened
+def trim_text(text, max_tokens):
+    if count_tokens(text) <= max_tokens:
+        return text, False
+    deduped = dedupe_paragraphs(text)
+    if count_tokens(deduped) <= max_tokens:
+        return deduped, True
+    #takes whole words alternately from the start and the end until the budget, less room for the marker, is spent
+    words = deduped.split()
+    budget = max(max_tokens - 16, 0)
+    head_end, tail_start, used = 0, len(words), 0
+    while head_end < tail_start:
+        index = head_end if head_end <= len(words) - tail_start else tail_start - 1
+        used += count_tokens(words[index])
+        if used > budget:
+            break
+        if index == head_end:
+            head_end += 1
+        else:
+            tail_start -= 1
+    return (f"{' '.join(words[:head_end])}\n[... {tail_start - head_end} words trimmed ...]\n"
+            f"{' '.join(words[tail_start:])}", True)
+
+#rejects an answer too long to grade with a 413
+def check_answer_size(question, answer, limit=ANSWER_HARD_LIMIT_TOKENS):
+    if count_tokens(question) + count_tokens(answer) > limit:
+        inputs_rejected.inc()
+        raise HTTPException(status_code=413, detail=f"The answer is too long to grade, keep it under about "
+                                                    f"{limit * 3 // 4} words.")
+
+#trims one input of a prompt to whatever is left of the context window after the rest of the prompt
+#and the task's num_predict, and to max_tokens
+def fit_input(prompts, name, inputs, field, max_tokens):
+    rest = count_tokens(prompts.template(name).format(**{**inputs, field: ""}))
+    num_predict = prompts.params.get(name, {}).get("num_predict", 512)
+    budget = max(0, min(max_tokens, LLM_CONTEXT_TOKENS - num_predict - rest))
+    text, trimmed = trim_text(inputs[field], budget)
+    if trimmed:
+        inputs_trimmed.inc(field=field)
+    return {**inputs, field: text}
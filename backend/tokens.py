@@ -0,0 +1,97 @@
+#imports
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import time
+from datetime import datetime, timedelta
+from fastapi import Depends, HTTPException
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from models import RefreshToken
+
+#signing key for access tokens, set it explicitly so tokens stay valid across restarts and workers
+SECRET_KEY = os.getenv("SECRET_KEY") or secrets.token_urlsafe(32)
+ACCESS_TOKEN_TTL_SECONDS = int(os.getenv("ACCESS_TOKEN_TTL_SECONDS", "3600"))
+REFRESH_TOKEN_TTL_DAYS = int(os.getenv("REFRESH_TOKEN_TTL_DAYS", "30"))
+#lets clients without a token keep sending user_id in the request body while they migrate
+ALLOW_LEGACY_USER_ID = os.getenv("ALLOW_LEGACY_USER_ID", "1") == "1"
+
+_HEADER = {"alg": "HS256", "typ": "JWT"}
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+def _b64decode(data):
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+def _sign(signing_input):
+    return _b64encode(hmac.new(SECRET_KEY.encode("utf-8"), signing_input.encode("ascii"), hashlib.sha256).digest())
+
+#creates a signed HS256 JWT carrying the user's id, email and name
+def create_access_token(user_id, email, name, ttl=None):
+    now = int(time.time())
+    claims = {"sub": str(user_id), "email": email, "name": name, "iat": now,
+              "exp": now + (ACCESS_TOKEN_TTL_SECONDS if ttl is None else ttl)}
+    signing_input = _b64encode(json.dumps(_HEADER, separators=(",", ":")).encode()) + "." + \
+        _b64encode(json.dumps(claims, separators=(",", ":")).encode())
+    return signing_input + "." + _sign(signing_input)
+
+#checks the signature and expiry of an access token and returns its claims, without touching the database
+def decode_access_token(token):
+    try:
+        header, payload, signature = token.split(".")
+        if not hmac.compare_digest(signature, _sign(header + "." + payload)):
+            raise ValueError("bad signature")
+        claims = json.loads(_b64decode(payload))
+    except (ValueError, TypeError):
+        #gives an error message for tampered or malformed tokens
+        raise HTTPException(status_code=401, detail="Invalid access token", headers={"WWW-Authenticate": "Bearer"})
+    if claims.get("exp", 0) < time.time():
+        raise HTTPException(status_code=401, detail="Access token expired", headers={"WWW-Authenticate": "Bearer"})
+    return claims
+
+_bearer = HTTPBearer(auto_error=False)
+
+#dependency returning the token claims when an Authorization header is sent, otherwise None
+def get_token_claims(credentials: HTTPAuthorizationCredentials = Depends(_bearer)):
+    if credentials is None:
+        return None
+    return decode_access_token(credentials.credentials)
+
+#dependency that requires a valid access token
+def require_token_claims(claims=Depends(get_token_claims)):
+    if claims is None:
+        raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+    return claims
+
+#picks the user from the token, falling back to the body's user_id only while legacy clients are allowed
+def resolve_user_id(claims, legacy_user_id=None):
+    if claims is not None:
+        return int(claims["sub"])
+    if ALLOW_LEGACY_USER_ID and legacy_user_id not in (None, ""):
+        return int(legacy_user_id)
+    return None
+
+def _hash_refresh_token(token):
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+#stores a new refresh token for the user and returns it, only its hash is kept in the database
+def issue_refresh_token(db, user_id):
+    token = secrets.token_urlsafe(32)
+    db.add(RefreshToken(token_hash=_hash_refresh_token(token), user_id=user_id,
+                        expires_at=datetime.utcnow() + timedelta(days=REFRESH_TOKEN_TTL_DAYS)))
+    return token
+
+#revokes a refresh token and returns the user it belonged to, or None if it is unknown, expired or revoked,
+#the check and the revoke are one conditional UPDATE so two concurrent refreshes can't both use the token
+def consume_refresh_token(db, token):
+    token_hash = _hash_refresh_token(token)
+    now = datetime.utcnow()
+    revoked = db.query(RefreshToken).filter(
+        RefreshToken.token_hash == token_hash, RefreshToken.revoked_at.is_(None), RefreshToken.expires_at > now
+    ).update({RefreshToken.revoked_at: now}, synchronize_session=False)
+    if revoked != 1:
+        return None
+    return db.query(RefreshToken.user_id).filter(RefreshToken.token_hash == token_hash).scalar()
@@ -3,6 +3,7 @@ import React, { useState } from 'react';
 import './InterviewForm.css';
 import './Layout.css'
 import { useNavigate } from 'react-router-dom';
+import { authFetch } from './auth';
 
 
 const InterviewForm = () => {
@@ -30,7 +31,7 @@ const InterviewForm = () => {
   //handler for clicking to generate initial subtopics
   const handleSubmit = async (e) => {
     e.preventDefault();
-    const response = await fetch('http://localhost:8000/generate-subtopics', {
+    const response = await authFetch('http://localhost:8000/generate-subtopics', {
       method: 'POST',
       headers: { 'Content-Type': 'application/json' },
       body: JSON.stringify({
@@ -46,7 +47,7 @@ const InterviewForm = () => {
 
   //handler for clicking tovalidate initial subtopics
   const handleValidate = async () => {
-    const response = await fetch('http://localhost:8000/validate-subtopics', {
+    const response = await authFetch('http://localhost:8000/validate-subtopics', {
       method: 'POST',
       headers: { 'Content-Type': 'application/json' },
       body: JSON.stringify({
@@ -61,7 +62,7 @@ const InterviewForm = () => {
   //handler for clicking to generate refined subtopics
   const handleRefine = async () => {
     try {
-      const response = await fetch('http://localhost:8000/refine-subtopics', {
+      const response = await authFetch('http://localhost:8000/refine-subtopics', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({
@@ -89,7 +90,7 @@ const InterviewForm = () => {
 
   //handler for clicking to categorize refined subtopics
   const handleCategorize = async () => {
-    const response = await fetch('http://localhost:8000/categorize-subtopics', {
+    const response = await authFetch('http://localhost:8000/categorize-subtopics', {
       method: 'POST',
       headers: { 'Content-Type': 'application/json' },
       body: JSON.stringify({ subtopics: refined_subtopics })
@@ -3,6 +3,7 @@ import { useNavigate } from 'react-router-dom';
 import React, { useState } from 'react';
 import './Layout.css';
 import './Login.css';
+import { saveTokens } from './auth';
 
 const Login = ({ onLogin }) => {
   //extracted data passed via navigation
@@ -39,9 +40,10 @@ const Login = ({ onLogin }) => {
         return;
       }
 
-      //stores ID locally
+      //stores ID and session tokens locally
       const data = await response.json();
       localStorage.setItem('user_id', data.id);
+      saveTokens(data);
       onLogin && onLogin(data);
       //redirects to interview form page
       navigate('/InterviewForm');
@@ -24,7 +24,7 @@ const Plan = () => {
   useEffect(() => {
     const fetchInterests = async () => {
       try {
-        const response = await fetch("http://localhost:8000/user-job-interests-with-scores");
+        const response = await fetch(`http://localhost:8000/user-job-interests-with-scores?user_id=${userId}&limit=1000`);
         const data = await response.json();
         //filters interests for the current user
         const filtered = data.filter(item => item.user_id === parseInt(userId));
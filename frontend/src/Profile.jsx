@@ -2,6 +2,7 @@
 import React, { useEffect, useState } from 'react';
 import './Layout.css'
 import './Profile.css';
+import { authFetch } from './auth';
 import { useNavigate } from 'react-router-dom';
 //used to create a pie chart graph
 import { Pie } from 'react-chartjs-2';
@@ -19,7 +20,7 @@ const Profile = () => {
   useEffect(() => {
     const fetchProfile = async () => {
       try {
-        const response = await fetch(`http://localhost:8000/user-profile/${userId}`);
+        const response = await authFetch(`http://localhost:8000/user-profile/${userId}`);
         const data = await response.json();
         //sets data and job role distribution for the chart
         setProfile(data);
@@ -3,6 +3,7 @@ import React, { useRef, useEffect, useState } from 'react';
 import { useLocation } from 'react-router-dom';
 import './Layout.css';
 import './Questions.css';
+import { authFetch } from './auth';
 import { useNavigate } from 'react-router-dom';
 
 const Questions = () => {
@@ -15,6 +16,7 @@ const Questions = () => {
 
   //state variables
   const [questions, setQuestions] = useState('');
+  const [questionItems, setQuestionItems] = useState(null);
   const [loading, setLoading] = useState(true);
   const [responses, setResponses] = useState({});
   const [feedback, setFeedback] = useState({});
@@ -44,7 +46,7 @@ const Questions = () => {
   hasFetched.current = true;
     const fetchQuestions = async () => {
       try {
-        const response = await fetch('http://localhost:8000/generate-questions', {
+        const response = await authFetch('http://localhost:8000/generate-questions', {
           method: 'POST',
           headers: { 'Content-Type': 'application/json' },
           body: JSON.stringify({
@@ -56,6 +58,8 @@ const Questions = () => {
         });
         const data = await response.json();
         setQuestions(data.questions);
+        //already parsed questions, when the backend sends them
+        setQuestionItems(data.items || null);
       } catch (error) {
         console.error('Error fetching questions:', error);
         setQuestions('Failed to load questions.');
@@ -81,7 +85,7 @@ const Questions = () => {
     if (!answer || !question) return;
     setChecking(prev => ({ ...prev, [index]: true }));
     try {
-      const response = await fetch('http://localhost:8000/check-response', {
+      const response = await authFetch('http://localhost:8000/check-response', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({ 
@@ -117,6 +121,10 @@ const Questions = () => {
     qList = qList.slice(1);
   }
 
+  if (questionItems && questionItems.length) {
+    qList = questionItems;
+  }
+
   //cleans up any unnecessary phrases (the LLM loves to put 'I'm happy to help in' >:v)
   const cleanFeedback = (text) => {
     return text
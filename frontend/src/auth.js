@@ -0,0 +1,34 @@
+//stores the tokens returned by the backend after login
+export const saveTokens = (data) => {
+  localStorage.setItem('access_token', data.access_token);
+  localStorage.setItem('refresh_token', data.refresh_token);
+};
+
+//swaps the refresh token for a new pair, returns false if the session can't be renewed
+const refreshTokens = async () => {
+  const refreshToken = localStorage.getItem('refresh_token');
+  if (!refreshToken) return false;
+  const response = await fetch('http://localhost:8000/token/refresh', {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ refresh_token: refreshToken }),
+  });
+  if (!response.ok) return false;
+  saveTokens(await response.json());
+  return true;
+};
+
+//fetch wrapper that sends the access token and retries once with a refreshed token when it has expired
+export const authFetch = async (url, options = {}) => {
+  const withToken = () => {
+    const token = localStorage.getItem('access_token');
+    const headers = { ...(options.headers || {}) };
+    if (token) headers.Authorization = `Bearer ${token}`;
+    return fetch(url, { ...options, headers });
+  };
+  const response = await withToken();
+  if (response.status === 401 && (await refreshTokens())) {
+    return withToken();
+  }
+  return response;
+};